@@ -0,0 +1,74 @@
+# bench_cold_start.py
+# Mesure du démarrage à froid : temps d'import et temps jusqu'à la première prédiction
+#
+# Chaque mesure tourne dans un processus Python neuf, pour que rien ne soit déjà en cache.
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+# Modules mesurés : nom affiché -> module importé
+TARGETS = {
+    "keras": "butterfly",
+    "numpy": "butterfly_numpy",
+}
+
+SAMPLE_INCIDENT = {
+    "distance_km": 1.2, "days_since_incident": 0, "hour_of_day": 22,
+    "user_engagement_rate": 0.7, "user_num_friends": 45, "user_connections": 180,
+    "urgency_score": (1 / (1.2 + 0.1)) * (1 / (0 + 1)),
+    "user_type": "Tourist", "incident_type": "Vol", "day_of_week": 4,
+    "is_weekend": 1, "incident_zone_type": "touristic",
+}
+
+# Script exécuté dans le processus enfant ; il affiche un objet JSON sur la dernière ligne
+_CHILD = """
+import json, resource, sys, time
+def max_rss_mb():
+    # VmHWM plutôt que ru_maxrss : sous Linux, ru_maxrss hérite du pic du processus parent
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) / 1024 for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+start = time.perf_counter()
+import {module} as engine
+imported = time.perf_counter()
+engine.predict_proba([json.loads(sys.argv[1])])
+first = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - start,
+    "first_prediction_s": first - imported,
+    "total_s": first - start,
+    "max_rss_mb": max_rss_mb(),
+}}))
+"""
+
+def measure(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(module=module), json.dumps(SAMPLE_INCIDENT)],
+        cwd=MODULE_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(repeat: int = 3) -> dict:
+    report = {}
+    for name, module in TARGETS.items():
+        runs = [measure(module) for _ in range(repeat)]
+        report[name] = {key: min(r[key] for r in runs) for key in runs[0]}
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Démarrage à froid des moteurs de prédiction")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre de processus par moteur (on garde le minimum)")
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    print(f"{'moteur':<8} {'import':>10} {'1re prédiction':>16} {'total':>10} {'RSS max':>10}")
+    for name, r in report.items():
+        print(f"{name:<8} {r['import_s'] * 1000:>8.1f}ms {r['first_prediction_s'] * 1000:>14.1f}ms "
+              f"{r['total_s'] * 1000:>8.1f}ms {r['max_rss_mb']:>8.1f}MB")
@@ -0,0 +1,135 @@
+# bench_encoding.py
+# Coût d'encodage par ligne : ancien chemin DataFrame de predict_incident, ancien encodeur
+# manuel de ml_server.py, et plan d'encodage compilé (butterfly_features.EncodingPlan)
+#
+# Seul l'encodage est mesuré (pas le modèle) ; TensorFlow n'est pas importé.
+
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from butterfly_features import FeatureEncodingError
+from model_loader import get_artifacts
+
+def random_row(rng: random.Random) -> dict:
+    distance = rng.uniform(0, 10)
+    days = rng.randint(0, 30)
+    day_of_week = rng.randint(0, 6)
+    return {
+        "distance_km": distance,
+        "days_since_incident": days,
+        "hour_of_day": rng.randint(0, 23),
+        "user_engagement_rate": rng.uniform(0.1, 0.9),
+        "user_num_friends": rng.randint(10, 150),
+        "user_connections": rng.randint(50, 2000),
+        "urgency_score": (1 / (distance + 0.1)) * (1 / (days + 1)),
+        "user_type": rng.choice(["Local", "Expat", "Tourist"]),
+        "incident_type": rng.choice(["Vol", "Agression", "Objet Perdu", "Disparition"]),
+        "day_of_week": day_of_week,
+        "is_weekend": 1 if day_of_week >= 5 else 0,
+        "incident_zone_type": rng.choice(["touristic", "residential", "business", "suburbs", "nightlife"]),
+    }
+
+# --- 1. ANCIENS ENCODEURS (RÉFÉRENCE) ---
+
+def legacy_dataframe_encode(new_data, model_columns, feature_config, scaler):
+    """Préparation des données de l'ancien butterfly.predict_incident (pandas, une ligne)."""
+    import pandas as pd
+
+    df = pd.DataFrame([new_data])
+    numerical_cols = feature_config['numerical_features']
+    df[numerical_cols] = df[numerical_cols].astype(float)
+    for col in feature_config.get('categorical_features_one_hot', []):
+        df[col] = 0
+    for key, value in new_data.items():
+        one_hot_col_name = f"{key}_{value}"
+        if one_hot_col_name in df.columns:
+            df.loc[0, one_hot_col_name] = 1
+    df_processed = df[model_columns].copy()
+    df_processed.loc[:, numerical_cols] = scaler.transform(df_processed[numerical_cols])
+    return df_processed.to_numpy(dtype=np.float32)
+
+LEGACY_NUMERIC_KEYS = [
+    "distance_km", "days_since_incident", "hour_of_day", "user_engagement_rate",
+    "user_num_friends", "user_connections", "urgency_score", "day_of_week",
+]
+LEGACY_ONE_HOT_CATEGORIES = [
+    ("user_type", ["Local", "Tourist"]),
+    ("incident_type", ["Agression", "Vol", "Objet Perdu"]),
+    ("incident_zone_type", ["touristic", "business", "residential", "suburbs", "nightlife"]),
+]
+
+def legacy_server_encode(data):
+    """Ancien ml_server.encode_features (listes Python, 19 colonnes écrites à la main)."""
+    values = [data[key] for key in LEGACY_NUMERIC_KEYS] + [1 if data["is_weekend"] else 0]
+    for key, categories in LEGACY_ONE_HOT_CATEGORIES:
+        values += [1 if data[key] == cat else 0 for cat in categories]
+    return np.array(values).reshape(1, -1)
+
+# --- 2. MESURES ---
+
+def per_row_us(fn, rows, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for row in rows:
+            fn(row)
+    return (time.perf_counter() - start) / (len(rows) * repeat) * 1e6
+
+def run(n_rows=2000, batch_rows=100_000, seed=0):
+    artifacts = get_artifacts("keras")
+    plan = artifacts.plan
+    rng = random.Random(seed)
+    rows = [random_row(rng) for _ in range(n_rows)]
+
+    import joblib
+    scaler = joblib.load(artifacts.scaler_path)
+    with open(artifacts.features_config_path) as f:
+        feature_config = json.load(f)
+    num_idx = [plan.columns.index(col) for col in feature_config['numerical_features']]
+
+    def plan_encode_scaled(row):
+        # Même travail que l'ancien chemin : encodage + scaler (fait par predict_matrix)
+        X = plan.encode_row(row)
+        X[num_idx] = (X[num_idx] - scaler.mean_) / scaler.scale_
+        return X
+
+    # Parité avec l'ancien chemin DataFrame (qui forçait is_weekend à 0, voir user-001)
+    for row in rows[:200]:
+        expected = legacy_dataframe_encode(dict(row, is_weekend=0), plan.columns, feature_config, scaler)[0]
+        got = plan_encode_scaled(dict(row, is_weekend=0))
+        assert np.allclose(expected, got, atol=1e-5), "Encodage différent de l'ancien chemin DataFrame"
+
+    # Les erreurs sont explicites au lieu d'une colonne silencieusement à zéro
+    try:
+        plan.encode_row(dict(rows[0], incident_type="Incendie"))
+        raise AssertionError("Catégorie inconnue acceptée")
+    except FeatureEncodingError as e:
+        print(f"Catégorie inconnue rejetée : {e}")
+
+    results = {
+        "ancien predict_incident (DataFrame)": per_row_us(
+            lambda r: legacy_dataframe_encode(r, plan.columns, feature_config, scaler), rows[:min(n_rows, 500)]),
+        "ancien ml_server.encode_features": per_row_us(legacy_server_encode, rows, repeat=5),
+        "plan.encode_row": per_row_us(plan.encode_row, rows, repeat=5),
+        "plan.encode_row + scaler": per_row_us(plan_encode_scaled, rows, repeat=5),
+    }
+
+    batch = [random_row(rng) for _ in range(batch_rows)]
+    start = time.perf_counter()
+    plan.encode(batch)
+    results[f"plan.encode (lot de {batch_rows})"] = (time.perf_counter() - start) / batch_rows * 1e6
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coût d'encodage des caractéristiques par ligne")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch-rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.batch_rows)
+    reference = results["ancien predict_incident (DataFrame)"]
+    for name, us in results.items():
+        print(f"{name:<40} {us:>10.2f} µs/ligne  (x{reference / us:,.0f} vs DataFrame)")
@@ -0,0 +1,55 @@
+# bench_geo_features.py
+# geo_features.pairwise_features sur N utilisateurs x M incidents : durée par méthode et
+# par type, comparée à la diffusion NumPy directe (haversine_km sur (N, 1) x (M,)),
+# et écart maximal à haversine_km en float64
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_spatial_index import lisbon_users
+from geo_features import METHODS, haversine_km, pairwise_features, urgency_score
+
+def best_of(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+def naive(user_lat, user_lon, incident_lat, incident_lon, days):
+    distance = haversine_km(user_lat[:, None], user_lon[:, None], incident_lat, incident_lon)
+    return distance, urgency_score(distance, days)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distances et urgence N x M : geo_features contre diffusion directe")
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--incidents", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    user_lat, user_lon = lisbon_users(args.users, rng)
+    incident_lat, incident_lon = lisbon_users(args.incidents, rng)
+    days = rng.integers(0, 30, args.incidents)
+    pairs = args.users * args.incidents
+
+    naive_s, (reference, reference_urgency) = best_of(lambda: naive(user_lat, user_lon, incident_lat, incident_lon, days),
+                                                      args.repeat)
+    print(f"{args.users:,} utilisateurs x {args.incidents} incidents ({pairs / 1e6:.0f}M de paires)")
+    print(f"  {'diffusion directe float64':<25}: {naive_s:.3f}s, {pairs / naive_s / 1e6:.0f}M paires/s, "
+          f"{(reference.nbytes + reference_urgency.nbytes) / 1e6:.0f} Mo")
+
+    for method in METHODS:
+        for dtype in (np.float32, np.float64):
+            elapsed, (distance, urgency) = best_of(
+                lambda: pairwise_features(user_lat, user_lon, incident_lat, incident_lon, days, method=method, dtype=dtype),
+                args.repeat)
+            error = np.abs(distance - reference) / np.maximum(reference, 1e-3)
+            urgency_error = np.abs(urgency - reference_urgency) / reference_urgency
+            print(f"  {method + ' ' + np.dtype(dtype).name:<25}: {elapsed:.3f}s, {pairs / elapsed / 1e6:.0f}M paires/s, "
+                  f"x{naive_s / elapsed:.1f}, {(distance.nbytes + urgency.nbytes) / 1e6:.0f} Mo, "
+                  f"écart relatif max distance {error.max():.1e}, urgence {urgency_error.max():.1e}")
@@ -0,0 +1,81 @@
+# bench_incident_windows.py
+# incident_windows.IncidentWindows sur 1M d'incidents étalés sur 60 jours : chargement,
+# ajouts au fil de l'eau, latence d'une requête 24h / 7d / 30d comparée au filtrage des
+# incidents bruts (ce que fait getIncidents en base), vérification que les comptes sont
+# identiques, et latence de recency() pour les caractéristiques du modèle
+
+import argparse
+import time
+
+import numpy as np
+
+from incident_windows import DAY_S, HOUR_S, RETENTION_DAYS, WINDOWS, ZONE_TYPES, IncidentWindows
+from risk_tiles import INCIDENT_TYPES, SEVERITIES
+
+def best_of(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+def raw_counts(stamps, categories, window, now):
+    """Comptes (type, gravité, zone) des incidents bruts de la fenêtre, bornes alignées sur les tranches."""
+    ring, n_buckets = WINDOWS[window]
+    width = HOUR_S if ring == "hour" else DAY_S
+    start, end = (now // width - n_buckets + 1) * width, (now // width + 1) * width
+    inside = (stamps >= start) & (stamps < end)
+    shape = (len(INCIDENT_TYPES), len(SEVERITIES), len(ZONE_TYPES))
+    return np.bincount(categories[inside], minlength=int(np.prod(shape))).reshape(shape)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fenêtres glissantes : chargement, ajouts, requêtes, récence")
+    parser.add_argument("--incidents", type=int, default=1_000_000)
+    parser.add_argument("--days", type=float, default=60.0, help="Période couverte par les incidents")
+    parser.add_argument("--adds", type=int, default=50_000, help="Incidents ajoutés un par un après fit()")
+    parser.add_argument("--recency-ids", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.incidents + args.adds
+    stamps = np.sort(time.time() - args.days * DAY_S + rng.uniform(0, args.days * DAY_S, n))
+    type_codes = rng.integers(0, len(INCIDENT_TYPES), n)
+    severity_codes = rng.integers(0, len(SEVERITIES), n)
+    zone_codes = rng.integers(0, len(ZONE_TYPES), n)
+    types = np.array(INCIDENT_TYPES, dtype=object)[type_codes]
+    severities = np.array(SEVERITIES, dtype=object)[severity_codes]
+    zones = np.array(ZONE_TYPES, dtype=object)[zone_codes]
+    ids = np.array([f"incident-{i}" for i in range(n)], dtype=object)
+    categories = np.ravel_multi_index((type_codes, severity_codes, zone_codes),
+                                      (len(INCIDENT_TYPES), len(SEVERITIES), len(ZONE_TYPES)))
+    base = slice(0, args.incidents)
+
+    start = time.perf_counter()
+    windows = IncidentWindows().fit(ids[base], types[base], severities[base], zones[base], stamps[base],
+                                    now=stamps[args.incidents - 1])
+    print(f"fit : {args.incidents:,} incidents en {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    for i in range(args.incidents, n):
+        windows.add(ids[i], types[i], severities[i], zones[i], stamps[i])
+    add_s = time.perf_counter() - start
+    print(f"add() : {add_s / max(args.adds, 1) * 1e6:.1f} µs par incident ({args.adds:,} ajouts)")
+
+    now = stamps[-1]
+    for window in WINDOWS:
+        windows_s, counts = best_of(lambda: windows.counts(window, now), args.repeat)
+        query_s, _ = best_of(lambda: windows.query(window, now, types=["theft", "danger"], severities=["high"]),
+                             args.repeat)
+        raw_s, expected = best_of(lambda: raw_counts(stamps, categories, window, now), args.repeat)
+        print(f"  {window:<4}: {int(counts.sum()):,} incidents, counts() {windows_s * 1e6:.0f} µs, "
+              f"query() filtrée {query_s * 1e6:.0f} µs, incidents bruts {raw_s * 1000:.1f} ms "
+              f"(x{raw_s / windows_s:.0f}) ; identique : {np.array_equal(counts, expected)}")
+
+    sample = ids[rng.integers(0, n, args.recency_ids)].tolist()
+    recency_s, features = best_of(lambda: windows.recency(sample, now), args.repeat)
+    known = features["days_since_incident"] >= 0
+    print(f"recency() : {args.recency_ids:,} incidents en {recency_s * 1000:.1f} ms, "
+          f"{known.mean():.0%} connus (dates gardées {RETENTION_DAYS} jours)")
@@ -0,0 +1,166 @@
+# bench_load.py
+# Générateur de charge HTTP local : latence p50/p99 et débit (RPS) d'un serveur de prédiction
+#
+# Exemples :
+#   python bench_load.py --url http://127.0.0.1:5000 --connections 64 --duration 10
+#   python bench_load.py --compare      # lance Flask puis ASGI et compare les deux
+#
+# Client asyncio minimal (HTTP/1.1 keep-alive, une requête à la fois par connexion),
+# sans dépendance externe pour ne pas mesurer le client plutôt que le serveur.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import numpy as np
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+# Serveurs comparés avec --compare : nom -> commande
+SERVERS = {
+    "flask": [sys.executable, "ml_server.py"],
+    "asgi": [sys.executable, "-m", "uvicorn", "ml_server_asgi:app", "--host", "127.0.0.1", "--log-level", "warning"],
+}
+
+def sample_payload(rng: random.Random) -> bytes:
+    distance = rng.uniform(0, 10)
+    days = rng.randint(0, 30)
+    day_of_week = rng.randint(0, 6)
+    return json.dumps({
+        "distanceKm": distance, "daysSinceIncident": days, "hourOfDay": rng.randint(0, 23),
+        "userEngagementRate": rng.uniform(0.1, 0.9), "userNumFriends": rng.randint(10, 150),
+        "userConnections": rng.randint(50, 2000), "urgencyScore": (1 / (distance + 0.1)) * (1 / (days + 1)),
+        "dayOfWeek": day_of_week, "isWeekend": day_of_week >= 5,
+        "userType": rng.choice(["Local", "Tourist"]), "incidentType": rng.choice(["Vol", "Agression", "Objet Perdu"]),
+        "incidentZoneType": rng.choice(["touristic", "residential", "business", "suburbs", "nightlife"]),
+    }).encode()
+
+# --- 1. CLIENT ---
+
+async def _read_response(reader):
+    """Lit une réponse HTTP/1.1 ; retourne (statut, connexion réutilisable)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connexion fermée par le serveur")
+    status = int(status_line.split()[1])
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection" and value == "close":
+            keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+async def _connection(host, port, path, payloads, deadline, latencies, statuses):
+    writer = None
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            body = payloads[i % len(payloads)]
+            i += 1
+            request = (
+                f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n"
+            ).encode() + body
+            start = time.perf_counter()
+            if writer is None:
+                # Le serveur de développement Flask ferme la connexion après chaque réponse
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def run_load(url: str, connections: int, duration: float, n_payloads: int = 1000, payloads=None) -> dict:
+    """:param payloads: Corps JSON (bytes) envoyés à tour de rôle ; n_payloads tirés par sample_payload sinon."""
+    parts = urlsplit(url)
+    if payloads is None:
+        rng = random.Random(0)
+        payloads = [sample_payload(rng) for _ in range(n_payloads)]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        _connection(parts.hostname, parts.port or 80, parts.path or "/predict", payloads, deadline, latencies, statuses)
+        for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "ok_rps": statuses.get(200, 0) / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else None,
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else None,
+        "statuses": statuses,
+    }
+
+# --- 2. COMPARAISON FLASK / ASGI ---
+
+def wait_ready(base_url: str, path: str, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + path) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Serveur {base_url} pas prêt après {timeout}s")
+
+def compare(port: int, connections: int, duration: float) -> dict:
+    results = {}
+    for name, command in SERVERS.items():
+        env = dict(os.environ, PORT=str(port))
+        if name == "asgi":
+            command = command + ["--port", str(port)]
+        process = subprocess.Popen(command, cwd=MODULE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(base_url, "/stats" if name == "flask" else "/readyz")
+            asyncio.run(run_load(f"{base_url}/predict", connections, min(duration, 2))) # échauffement
+            results[name] = asyncio.run(run_load(f"{base_url}/predict", connections, duration))
+        finally:
+            process.terminate()
+            process.wait()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Charge HTTP locale sur /predict")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/predict")
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--compare", action="store_true", help="Lance Flask puis ASGI et compare les deux")
+    parser.add_argument("--port", type=int, default=5097)
+    args = parser.parse_args()
+
+    if args.compare:
+        results = compare(args.port, args.connections, args.duration)
+    else:
+        results = {args.url: asyncio.run(run_load(args.url, args.connections, args.duration))}
+
+    for name, r in results.items():
+        print(f"{name:<10} {r['rps']:>8.0f} req/s  (200: {r['ok_rps']:>8.0f}/s)  "
+              f"p50 {r['p50_ms']:>7.1f} ms  p99 {r['p99_ms']:>7.1f} ms  statuts {r['statuses']}")
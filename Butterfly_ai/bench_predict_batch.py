@@ -0,0 +1,91 @@
+# bench_predict_batch.py
+# Débit (lignes/s) de /predict (une ligne par requête) contre /predict_batch (JSON et binaire)
+#
+# Le serveur Flask de ml_server.py est démarré dans ce processus sur un port local ;
+# les requêtes passent par une vraie connexion HTTP.
+
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from werkzeug.serving import make_server
+
+import ml_server
+from wire_format import BINARY_CONTENT_TYPE, NPY_CONTENT_TYPE, encode_matrix
+
+def random_row(rng: random.Random) -> dict:
+    distance = rng.uniform(0, 10)
+    days = rng.randint(0, 30)
+    day_of_week = rng.randint(0, 6)
+    return {
+        "distanceKm": distance,
+        "daysSinceIncident": days,
+        "hourOfDay": rng.randint(0, 23),
+        "userEngagementRate": rng.uniform(0.1, 0.9),
+        "userNumFriends": rng.randint(10, 150),
+        "userConnections": rng.randint(50, 2000),
+        "urgencyScore": (1 / (distance + 0.1)) * (1 / (days + 1)),
+        "dayOfWeek": day_of_week,
+        "isWeekend": day_of_week >= 5,
+        "userType": rng.choice(["Local", "Expat", "Tourist"]),
+        "incidentType": rng.choice(["Vol", "Agression", "Objet Perdu", "Disparition"]),
+        "incidentZoneType": rng.choice(["touristic", "residential", "business", "suburbs", "nightlife"]),
+    }
+
+def post(url: str, body: bytes, content_type: str) -> bytes:
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    with urllib.request.urlopen(req) as response:
+        return response.read()
+
+def bench_single(base_url, rows, concurrency):
+    def send(row):
+        return post(f"{base_url}/predict", json.dumps(row).encode(), "application/json")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, rows))
+    return len(rows) / (time.perf_counter() - start)
+
+def bench_batch(base_url, body, content_type, n_rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        post(f"{base_url}/predict_batch", body, content_type)
+    return n_rows * repeat / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Débit de /predict contre /predict_batch")
+    parser.add_argument("--rows", type=int, default=10_000, help="Lignes par requête /predict_batch")
+    parser.add_argument("--single-rows", type=int, default=1_000, help="Requêtes envoyées à /predict")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients concurrents pour /predict")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rows = [random_row(rng) for _ in range(args.rows)]
+    matrix = ml_server.encode_features_batch(rows)
+    npy = io.BytesIO()
+    np.save(npy, matrix)
+
+    server = make_server("127.0.0.1", args.port, ml_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    # Échauffement (chargement du graphe Keras)
+    post(f"{base_url}/predict_batch", json.dumps(rows[:10]).encode(), "application/json")
+
+    results = {
+        "predict (1 ligne/requête)": bench_single(base_url, rows[:args.single_rows], args.concurrency),
+        "predict_batch JSON": bench_batch(base_url, json.dumps(rows).encode(), "application/json", args.rows, args.repeat),
+        "predict_batch octet-stream": bench_batch(base_url, encode_matrix(matrix), BINARY_CONTENT_TYPE, args.rows, args.repeat),
+        "predict_batch .npy": bench_batch(base_url, npy.getvalue(), NPY_CONTENT_TYPE, args.rows, args.repeat),
+    }
+    server.shutdown()
+
+    for name, rows_per_s in results.items():
+        print(f"{name:<30} {rows_per_s:>12,.0f} lignes/s")
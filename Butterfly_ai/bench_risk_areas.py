@@ -0,0 +1,69 @@
+# bench_risk_areas.py
+# risk_areas.RiskAreaIndex sur 1M d'incidents à Lisbonne : durée de fit() selon la
+# dispersion (zones denses -> zones isolées), latence de add(), et vérification que les
+# zones sont identiques au regroupement glouton exhaustif de heatmap.ts sur un échantillon
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_spatial_index import lisbon_users
+from geo_features import haversine_km
+from risk_areas import DEFAULT_CLUSTER_RADIUS_KM, RiskAreaIndex
+
+SEVERITIES = np.array(["low", "medium", "high"], dtype=object)
+
+def greedy_labels(latitudes, longitudes, cluster_radius_km):
+    """Boucle de calculateRiskAreas, une graine à la fois contre tous les incidents libres."""
+    labels = np.full(len(latitudes), -1)
+    area = 0
+    for i in range(len(latitudes)):
+        if labels[i] >= 0:
+            continue
+        free = np.flatnonzero(labels < 0)
+        distance = haversine_km(latitudes[i], longitudes[i], latitudes[free], longitudes[free])
+        labels[free[distance <= cluster_radius_km]] = area
+        labels[i] = area
+        area += 1
+    return labels
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Zones à risque : fit() sur 1M d'incidents, add(), exactitude")
+    parser.add_argument("--incidents", type=int, default=1_000_000)
+    parser.add_argument("--spreads", type=float, nargs="+", default=[0.02, 0.2, 1.0],
+                        help="Écarts-types des positions autour des quartiers (degrés)")
+    parser.add_argument("--radius-km", type=float, default=DEFAULT_CLUSTER_RADIUS_KM)
+    parser.add_argument("--adds", type=int, default=10_000, help="Incidents ajoutés un par un après fit()")
+    parser.add_argument("--check", type=int, default=20_000, help="Taille de l'échantillon comparé au calcul exhaustif")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    severities = SEVERITIES[rng.integers(0, len(SEVERITIES), args.incidents)]
+
+    for spread in args.spreads:
+        latitudes, longitudes = lisbon_users(args.incidents, rng, spread)
+        start = time.perf_counter()
+        index = RiskAreaIndex(args.radius_km).fit(latitudes, longitudes, severities)
+        fit_s = time.perf_counter() - start
+        start = time.perf_counter()
+        areas = index.risk_areas()
+        output_s = time.perf_counter() - start
+        print(f"dispersion {spread}° : {args.incidents:,} incidents -> {index.n_areas:,} zones, "
+              f"fit {fit_s:.2f}s, risk_areas() {output_s:.2f}s")
+
+        new_lat, new_lon = lisbon_users(args.adds, rng, spread)
+        start = time.perf_counter()
+        for latitude, longitude, severity in zip(new_lat.tolist(), new_lon.tolist(), severities[:args.adds]):
+            index.add(latitude, longitude, severity)
+        add_s = time.perf_counter() - start
+        print(f"  add() : {add_s / args.adds * 1e6:.0f} µs par incident ({args.adds:,} ajouts)")
+
+        sample = rng.choice(args.incidents, min(args.check, args.incidents), replace=False)
+        labels = RiskAreaIndex(args.radius_km).fit(latitudes[sample], longitudes[sample], severities[sample]).labels
+        start = time.perf_counter()
+        expected = greedy_labels(latitudes[sample], longitudes[sample], args.radius_km)
+        greedy_s = time.perf_counter() - start
+        print(f"  échantillon de {len(sample):,} : identique au calcul exhaustif : {np.array_equal(labels, expected)} "
+              f"(exhaustif {greedy_s:.1f}s)")
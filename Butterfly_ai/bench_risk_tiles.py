@@ -0,0 +1,93 @@
+# bench_risk_tiles.py
+# risk_tiles.RiskTiles sur 1M d'incidents à Lisbonne : reconstruction, sauvegarde et
+# rechargement (mémoire projetée), latence de add() et d'une requête de fenêtre, comparée au
+# recalcul des zones à partir des incidents bruts de la fenêtre (ce que fait la carte
+# aujourd'hui), et vérification que fit() puis add() donne les mêmes tuiles que fit() seul
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench_spatial_index import lisbon_users
+from risk_areas import RiskAreaIndex
+from risk_tiles import INCIDENT_TYPES, SEVERITIES, RiskTiles
+
+# Fenêtres (sud, ouest, nord, est, zoom) : centre de Lisbonne, agglomération
+VIEWPORTS = {
+    "centre z15": (38.700, -9.170, 38.730, -9.120, 15),
+    "ville z13": (38.680, -9.250, 38.800, -9.080, 13),
+    "région z11": (38.450, -9.500, 39.000, -8.700, 11),
+}
+
+def best_of(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+def raw_risk_areas(latitudes, longitudes, severities, viewport):
+    """Zones recalculées à partir des incidents bruts de la fenêtre."""
+    south, west, north, east, _ = viewport
+    inside = (latitudes >= south) & (latitudes <= north) & (longitudes >= west) & (longitudes <= east)
+    return RiskAreaIndex().fit(latitudes[inside], longitudes[inside], severities[inside]).n_areas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tuiles de risque : reconstruction, persistance, mises à jour, requêtes")
+    parser.add_argument("--incidents", type=int, default=1_000_000)
+    parser.add_argument("--spread-deg", type=float, default=0.05, help="Écart-type des positions autour des quartiers")
+    parser.add_argument("--days", type=float, default=90.0, help="Ancienneté maximale des incidents")
+    parser.add_argument("--adds", type=int, default=20_000, help="Incidents ajoutés un par un après fit()")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    n = args.incidents + args.adds
+    latitudes, longitudes = lisbon_users(n, rng, args.spread_deg)
+    types = np.array(INCIDENT_TYPES, dtype=object)[rng.integers(0, len(INCIDENT_TYPES), n)]
+    severities = np.array(SEVERITIES, dtype=object)[rng.integers(0, len(SEVERITIES), n)]
+    now = time.time()
+    stamps = np.sort(now - rng.uniform(0, args.days * 86400, n))
+    base = slice(0, args.incidents)
+
+    start = time.perf_counter()
+    tiles = RiskTiles().fit(latitudes[base], longitudes[base], types[base], severities[base], stamps[base],
+                            now=stamps[args.incidents - 1])
+    fit_s = time.perf_counter() - start
+    print(f"fit : {args.incidents:,} incidents -> {len(tiles):,} tuiles sur {len(tiles.levels)} niveaux en {fit_s:.2f}s")
+
+    directory = tempfile.mkdtemp(prefix="risk_tiles_")
+    try:
+        start = time.perf_counter()
+        tiles.save(directory)
+        save_s = time.perf_counter() - start
+        start = time.perf_counter()
+        tiles = RiskTiles.load(directory)
+        load_s = time.perf_counter() - start
+        size = sum(tiles._levels[zoom].tiles.nbytes for zoom in tiles.levels)
+        print(f"save {save_s * 1000:.0f} ms ({size / 1e6:.1f} Mo), load {load_s * 1000:.1f} ms (mémoire projetée)")
+
+        start = time.perf_counter()
+        for i in range(args.incidents, n):
+            tiles.add(latitudes[i], longitudes[i], types[i], severities[i], stamps[i])
+        add_s = time.perf_counter() - start
+        print(f"add() : {add_s / max(args.adds, 1) * 1e6:.0f} µs par incident ({args.adds:,} ajouts, {len(tiles.levels)} niveaux)")
+
+        full = RiskTiles().fit(latitudes, longitudes, types, severities, stamps, now=stamps[-1])
+        for name, viewport in VIEWPORTS.items():
+            tiles_s, result = best_of(lambda: tiles.query(*viewport, now=stamps[-1]), args.repeat)
+            expected = full.query(*viewport, now=stamps[-1])
+            same_counts = [tile["counts"] for tile in result["tiles"]] == [tile["counts"] for tile in expected["tiles"]]
+            score_error = max((abs(a["score"] - b["score"]) / b["score"] for a, b in zip(result["tiles"], expected["tiles"])),
+                              default=0.0)
+            raw_s, n_areas = best_of(lambda: raw_risk_areas(latitudes, longitudes, severities, viewport), 1)
+            print(f"  {name:<11}: {len(result['tiles']):,} tuiles (niveau {result['zoom']}) en {tiles_s * 1000:.2f} ms, "
+                  f"zones depuis les incidents bruts {raw_s * 1000:.0f} ms ({n_areas:,} zones) ; "
+                  f"identique à fit() complet : {same_counts}, écart de score {score_error:.1e}")
+    finally:
+        shutil.rmtree(directory)
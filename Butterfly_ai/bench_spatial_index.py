@@ -0,0 +1,95 @@
+# bench_spatial_index.py
+# Index spatial en grille (spatial_index.GridIndex) sur 1M d'utilisateurs à Lisbonne :
+# construction, charge mixte déplacements / requêtes de rayon, comparaison au calcul
+# haversine sur toute la population, et vérification que les résultats sont identiques
+
+import argparse
+import time
+
+import numpy as np
+
+from generate_dataset import Config
+from geo_features import haversine_km
+from spatial_index import GridIndex
+
+def lisbon_users(n_users, rng, spread_deg=0.02):
+    """Positions regroupées autour des quartiers de generate_dataset.Config.ZONES (≈ 2 km d'écart-type)."""
+    centers = np.array([[zone["lat"], zone["lon"]] for zones in Config.ZONES.values() for zone in zones])
+    picked = centers[rng.integers(0, len(centers), n_users)]
+    return picked[:, 0] + rng.normal(0, spread_deg, n_users), picked[:, 1] + rng.normal(0, spread_deg, n_users)
+
+def brute_force(latitudes, longitudes, latitude, longitude, radius_km):
+    distance = haversine_km(latitudes, longitudes, latitude, longitude)
+    return np.flatnonzero(distance <= radius_km)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index spatial : charge mixte déplacements / requêtes")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--ops", type=int, default=20_000, help="Opérations (lots de déplacements ou requêtes)")
+    parser.add_argument("--query-fraction", type=float, default=0.1, help="Part des opérations qui sont des requêtes")
+    parser.add_argument("--update-batch", type=int, default=100, help="Utilisateurs déplacés par opération")
+    parser.add_argument("--move-m", type=float, default=50.0, help="Écart-type d'un déplacement (mètres)")
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--cell-km", type=float, default=0.5)
+    parser.add_argument("--spread-deg", type=float, default=0.02, help="Écart-type des positions autour des quartiers")
+    parser.add_argument("--brute-queries", type=int, default=20, help="Requêtes comparées au calcul exhaustif")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    latitudes, longitudes = lisbon_users(args.users, rng, args.spread_deg)
+
+    start = time.perf_counter()
+    index = GridIndex(latitudes, longitudes, cell_km=args.cell_km)
+    build_s = time.perf_counter() - start
+    stats = index.stats()
+    print(f"Construction : {args.users:,} utilisateurs, {stats['cells']:,} cellules de {args.cell_km} km, "
+          f"{build_s:.2f}s, {index.nbytes / 1e6:.0f} Mo")
+
+    # --- Charge mixte ---
+    move_deg = args.move_m / 1000 / 111.2
+    is_query = rng.random(args.ops) < args.query_fraction
+    query_times, update_times, found = [], [], []
+    rebuilds_before = index.rebuilds
+    for query in is_query:
+        if query:
+            user = rng.integers(args.users) # incident à la position d'un utilisateur
+            start = time.perf_counter()
+            indices, _ = index.query_radius(index.latitudes[user], index.longitudes[user], args.radius_km)
+            query_times.append(time.perf_counter() - start)
+            found.append(len(indices))
+        else:
+            users = rng.integers(0, args.users, args.update_batch)
+            new_lat = index.latitudes[users] + rng.normal(0, move_deg, args.update_batch)
+            new_lon = index.longitudes[users] + rng.normal(0, move_deg, args.update_batch)
+            start = time.perf_counter()
+            index.update(users, new_lat, new_lon)
+            update_times.append(time.perf_counter() - start)
+
+    query_ms = np.array(query_times) * 1000
+    n_updates = len(update_times) * args.update_batch
+    print(f"\nCharge mixte : {len(query_times):,} requêtes ({args.radius_km} km), {n_updates:,} déplacements "
+          f"(σ {args.move_m:.0f} m), {index.rebuilds - rebuilds_before} reconstruction(s)")
+    print(f"  requête   : p50 {np.percentile(query_ms, 50):.2f} ms, p95 {np.percentile(query_ms, 95):.2f} ms, "
+          f"{np.mean(found):,.0f} utilisateurs trouvés en moyenne")
+    print(f"  mise à jour : {n_updates / sum(update_times):,.0f} déplacements/s "
+          f"(reconstructions comprises), {index.n_moved:,} hors cellule d'origine")
+
+    # --- Comparaison au calcul exhaustif (positions courantes) ---
+    brute_times, mismatches = [], 0
+    for user in rng.integers(0, args.users, args.brute_queries):
+        lat, lon = index.latitudes[user], index.longitudes[user]
+        start = time.perf_counter()
+        expected = brute_force(index.latitudes, index.longitudes, lat, lon, args.radius_km)
+        brute_times.append(time.perf_counter() - start)
+        indices, _ = index.query_radius(lat, lon, args.radius_km)
+        mismatches += not np.array_equal(indices, expected)
+    brute_ms = np.median(brute_times) * 1000
+    print(f"\nHaversine sur toute la population : {brute_ms:.1f} ms par requête "
+          f"(index : x{brute_ms / np.percentile(query_ms, 50):.0f} plus rapide) ; "
+          f"{mismatches} résultat(s) différent(s) sur {args.brute_queries}")
+    assert mismatches == 0, "L'index ne retourne pas les mêmes utilisateurs que le calcul exhaustif"
+
+    start = time.perf_counter()
+    index.rebuild()
+    print(f"Reconstruction complète : {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,255 @@
+# bench_suite.py
+# Suite de benchmarks des chemins chauds de prédiction, avec résultats JSON comparables
+#
+# Entrées synthétiques tirées par generate_dataset.generate_columns. Sections :
+#   - single_row : latence d'une ligne (predict_incident par moteur, ml_server.encode_features)
+#   - batch      : débit predict_proba (encodage + modèle) à plusieurs tailles de lot
+#   - cold_start : import -> première prédiction dans un processus neuf (bench_cold_start.py)
+#   - http       : req/s, latence et RSS d'un worker ml_server.py local (client de bench_load.py)
+#
+# Exemples :
+#   python bench_suite.py --output bench_baseline.json            # référence
+#   python bench_suite.py --baseline bench_baseline.json          # mesure puis compare
+#   python bench_suite.py --compare-only bench_results.json bench_baseline.json
+#
+# Le code de sortie vaut 1 si une mesure régresse au-delà de --tolerance (utilisable en CI).
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from bench_cold_start import TARGETS
+from bench_cold_start import run as run_cold_start
+from bench_load import SERVERS, run_load, wait_ready
+from model_loader import MODULE_DIR
+
+# --- 1. CONFIGURATION ---
+
+class Config:
+    SECTIONS = ("single_row", "batch", "cold_start", "http")
+    ENGINES = tuple(TARGETS)            # "keras" (butterfly.py), "numpy" (butterfly_numpy.py)
+    SEED = 7
+    ROWS = 20000                        # Lignes synthétiques (le plus grand lot en est tiré)
+    SINGLE_CALLS = 500
+    BATCH_SIZES = (1, 10, 100, 1000, 10000)
+    BATCH_MIN_SECONDS = 0.5             # Chaque taille de lot est répétée au moins cette durée
+    COLD_START_REPEAT = 3
+    HTTP_CONNECTIONS = 16
+    HTTP_DURATION = 5.0
+    HTTP_PORT = 5098
+    TOLERANCE = 0.10                    # Écart relatif toléré avant de signaler une régression
+
+# Mesures pour lesquelles une valeur plus grande est meilleure (débits) ; les autres sont des durées ou de la mémoire
+HIGHER_IS_BETTER = ("_per_s", "_rps")
+
+def synthetic_rows(n_rows=Config.ROWS, seed=Config.SEED):
+    """n_rows lignes de generate_columns, décodées comme en production : (colonnes, liste de dictionnaires)."""
+    from generate_dataset import Config as DatasetConfig, DatasetGenerator, decode_columns, generate_columns
+    with contextlib.redirect_stdout(io.StringIO()):
+        schema = DatasetGenerator(DatasetConfig()).schema()
+    columns, _ = decode_columns(schema, generate_columns(n_rows, seed))
+    rows = [dict(zip(columns, values)) for values in zip(*(v.tolist() for v in columns.values()))]
+    return columns, rows
+
+def _latency_ms(samples) -> dict:
+    samples_ms = np.asarray(samples) * 1e3
+    return {f"p{q}_ms": float(np.percentile(samples_ms, q)) for q in (50, 95, 99)}
+
+def _process_memory_mb(pid) -> dict:
+    """RSS courant et pic de RSS d'un processus, lus dans /proc (Linux) ; {} ailleurs."""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    usage["rss_mb" if key == "VmRSS" else "peak_rss_mb"] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+# --- 2. SECTIONS ---
+
+def bench_single_row(rows, engines=Config.ENGINES, calls=Config.SINGLE_CALLS) -> dict:
+    """Latence d'une ligne, appel par appel (lignes différentes à chaque appel)."""
+    import importlib
+
+    import ml_server
+
+    results = {}
+    samples = []
+    for row in rows[:calls]:
+        start = time.perf_counter()
+        ml_server.encode_features(row)
+        samples.append(time.perf_counter() - start)
+    results["encode_features"] = _latency_ms(samples)
+
+    for engine in engines:
+        module = importlib.import_module(TARGETS[engine])
+        module.warmup()
+        samples = []
+        # predict_incident affiche sa progression : la sortie est jetée pendant la mesure
+        with contextlib.redirect_stdout(io.StringIO()):
+            for row in rows[:calls]:
+                start = time.perf_counter()
+                module.predict_incident(row)
+                samples.append(time.perf_counter() - start)
+        results[f"{engine}.predict_incident"] = _latency_ms(samples)
+    return results
+
+def bench_batch(columns, engines=Config.ENGINES, sizes=Config.BATCH_SIZES, min_seconds=Config.BATCH_MIN_SECONDS) -> dict:
+    """Débit de predict_proba (encodage colonne par colonne + modèle) pour chaque taille de lot."""
+    import importlib
+
+    results = {}
+    for engine in engines:
+        module = importlib.import_module(TARGETS[engine])
+        module.warmup()
+        for size in sizes:
+            batch = {name: values[:size] for name, values in columns.items()}
+            module.predict_proba(batch)
+            durations = []
+            deadline = time.perf_counter() + min_seconds
+            while len(durations) < 3 or time.perf_counter() < deadline:
+                start = time.perf_counter()
+                module.predict_proba(batch)
+                durations.append(time.perf_counter() - start)
+            results[f"{engine}.batch_{size}"] = {
+                "median_ms": float(np.median(durations) * 1e3),
+                "rows_per_s": float(size / np.median(durations)),
+            }
+    return results
+
+def bench_http(rows, engines=Config.ENGINES, connections=Config.HTTP_CONNECTIONS, duration=Config.HTTP_DURATION,
+               port=Config.HTTP_PORT) -> dict:
+    """Un worker ml_server.py par moteur (BUTTERFLY_BACKEND) : req/s, latence, puis RSS après la charge."""
+    payloads = [json.dumps(row).encode() for row in rows[:1000]]
+    results = {}
+    for engine in engines:
+        env = dict(os.environ, PORT=str(port), BUTTERFLY_BACKEND=engine)
+        process = subprocess.Popen(SERVERS["flask"], cwd=MODULE_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(base_url, "/stats")
+            url = f"{base_url}/predict"
+            asyncio.run(run_load(url, connections, min(duration, 2), payloads=payloads)) # échauffement
+            load = asyncio.run(run_load(url, connections, duration, payloads=payloads))
+            results[f"{engine}.predict"] = {
+                "rps": load["rps"], "p50_ms": load["p50_ms"], "p99_ms": load["p99_ms"],
+                "errors": sum(n for status, n in load["statuses"].items() if status != 200),
+                **_process_memory_mb(process.pid),
+            }
+        finally:
+            process.terminate()
+            process.wait()
+    return results
+
+def bench_cold_start(engines=Config.ENGINES, repeat=Config.COLD_START_REPEAT) -> dict:
+    report = run_cold_start(repeat)
+    return {engine: report[engine] for engine in engines}
+
+# --- 3. EXÉCUTION ET COMPARAISON ---
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=MODULE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sections=Config.SECTIONS, engines=Config.ENGINES, rows=Config.ROWS, http_duration=Config.HTTP_DURATION) -> dict:
+    """
+    Exécute les sections demandées.
+    :return: {"meta": {...}, "metrics": {"section.cible.mesure": valeur}}
+    """
+    columns, records = synthetic_rows(rows)
+    benches = {
+        "single_row": lambda: bench_single_row(records, engines),
+        "batch": lambda: bench_batch(columns, engines, [s for s in Config.BATCH_SIZES if s <= rows]),
+        "cold_start": lambda: bench_cold_start(engines),
+        "http": lambda: bench_http(records, engines, duration=http_duration),
+    }
+    metrics = {}
+    for section in sections:
+        start = time.perf_counter()
+        for target, values in benches[section]().items():
+            for name, value in values.items():
+                metrics[f"{section}.{target}.{name}"] = value
+        print(f"Section '{section}' terminée en {time.perf_counter() - start:.1f}s")
+    meta = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "rows": rows,
+        "engines": list(engines),
+    }
+    return {"meta": meta, "metrics": metrics}
+
+def compare(current: dict, baseline: dict, tolerance=Config.TOLERANCE) -> list:
+    """
+    Compare deux résultats de run() mesure par mesure (mesures communes uniquement).
+    :return: [(mesure, référence, actuel, écart relatif orienté "positif = mieux", statut), ...]
+    """
+    rows = []
+    for name, value in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or not isinstance(value, (int, float)) or not base or name.endswith(".errors"):
+            continue
+        change = (value - base) / base
+        if not name.endswith(HIGHER_IS_BETTER):
+            change = -change
+        status = "régression" if change < -tolerance else "amélioration" if change > tolerance else "ok"
+        rows.append((name, base, value, change, status))
+    return rows
+
+def print_metrics(metrics: dict):
+    for name, value in metrics.items():
+        print(f"{name:<55} {value:>14,.3f}")
+
+def print_comparison(rows) -> int:
+    print(f"\n{'mesure':<55} {'référence':>12} {'actuel':>12} {'écart':>8}  statut")
+    for name, base, value, change, status in rows:
+        print(f"{name:<55} {base:>12,.3f} {value:>12,.3f} {change:>+8.1%}  {status}")
+    regressions = sum(status == "régression" for *_, status in rows)
+    print(f"\n{len(rows)} mesures comparées, {regressions} régression(s)")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins de prédiction (JSON, comparaison à une référence)")
+    parser.add_argument("--sections", nargs="+", default=list(Config.SECTIONS), choices=list(Config.SECTIONS))
+    parser.add_argument("--engines", nargs="+", default=list(Config.ENGINES), choices=list(Config.ENGINES))
+    parser.add_argument("--rows", type=int, default=Config.ROWS, help="Lignes synthétiques")
+    parser.add_argument("--http-duration", type=float, default=Config.HTTP_DURATION)
+    parser.add_argument("--output", default="bench_results.json", help="Fichier JSON des résultats")
+    parser.add_argument("--baseline", help="Résultats de référence à comparer après la mesure")
+    parser.add_argument("--compare-only", nargs=2, metavar=("RESULTATS", "REFERENCE"),
+                        help="Compare deux fichiers de résultats sans rien mesurer")
+    parser.add_argument("--tolerance", type=float, default=Config.TOLERANCE)
+    args = parser.parse_args()
+
+    if args.compare_only:
+        current, baseline = (json.load(open(path)) for path in args.compare_only)
+    else:
+        current = run(args.sections, args.engines, args.rows, args.http_duration)
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=4)
+        print_metrics(current["metrics"])
+        print(f"\nRésultats sauvegardés dans '{args.output}'")
+        baseline = json.load(open(args.baseline)) if args.baseline else None
+
+    if baseline is not None:
+        sys.exit(1 if print_comparison(compare(current, baseline, args.tolerance)) else 0)
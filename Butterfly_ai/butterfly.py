@@ -1,37 +1,39 @@
-import pandas as pd
-import tensorflow as tf
-from tensorflow import keras
-import joblib
-import json
+import os
+
 import numpy as np
 
+from butterfly_features import build_result
+from geo_features import urgency_score
+from instrumentation import METRICS
+from model_loader import get_artifacts, load_decision_threshold
+from prediction_cache import PredictionCache
+
 # --- 1. CONFIGURATION ET CHARGEMENT DES ARTEFACTS ---
 
-# Le seuil de décision optimal que nous avons choisi
-DECISION_THRESHOLD = 0.7
+# Seuil de décision recommandé par evaluation.py (decision_threshold.json), 0.7 par défaut
+DECISION_THRESHOLD = load_decision_threshold()
 
-# Noms des fichiers sauvegardés par le script d'entraînement
-MODEL_PATH = 'butterfly_expert_model.keras'
-SCALER_PATH = 'expert_scaler.joblib'
-COLUMNS_PATH = 'expert_model_columns.json'
-FEATURES_CONFIG_PATH = 'feature_config.json'
+# Variante du modèle (model_loader.MODEL_VARIANTS) : "keras" par défaut, ou une variante
+# NumPy produite par optimize_model.py ("float32", "float16", "int8", "pruned")
+MODEL_VARIANT = os.environ.get("BUTTERFLY_MODEL_VARIANT", "keras")
 
-print("Chargement des artefacts du modèle...")
+# Artefacts partagés, chargés au premier appel (voir model_loader.py)
+artifacts = get_artifacts(MODEL_VARIANT)
 
-try:
-    model = keras.models.load_model(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
-    model_columns = json.load(open(COLUMNS_PATH))
-    feature_config = json.load(open(FEATURES_CONFIG_PATH))
-    print("-> Modèle, scaler et configurations chargés avec succès.")
-except FileNotFoundError as e:
-    print(f"Erreur : Fichier manquant -> {e.filename}")
-    print("Assurez-vous que les fichiers du modèle sont dans le même dossier que ce script.")
-    exit()
+# Cache optionnel des prédictions de predict_incident (BUTTERFLY_CACHE_SIZE > 0, voir prediction_cache.py)
+prediction_cache = PredictionCache.from_env(artifacts)
 
-# --- 2. FONCTION DE PRÉDICTION ---
+def warmup():
+    """Charge le modèle et exécute une prédiction factice ; retourne la durée (s)."""
+    return artifacts.warmup()
 
-# Dans butterfly_predict_expert.py, remplace l'ancienne fonction par celle-ci :
+def __getattr__(name):
+    # Compatibilité : butterfly.model, butterfly.scaler, ... déclenchent le chargement paresseux
+    if name in ("model", "scaler", "model_columns", "feature_config"):
+        return getattr(artifacts.load(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- 2. FONCTION DE PRÉDICTION ---
 
 def predict_incident(new_data: dict):
     """
@@ -40,53 +42,57 @@ def predict_incident(new_data: dict):
     :param new_data: Un dictionnaire contenant les caractéristiques brutes du nouvel incident.
     :return: Un dictionnaire avec la décision et le score de confiance.
     """
-    print("\nPréparation des données du nouvel incident pour la prédiction...")
-    
-    # Créer un DataFrame à partir des données d'entrée
-    df = pd.DataFrame([new_data])
-    
-    # --- NOUVELLE LIGNE POUR CORRIGER L'AVERTISSEMENT ---
-    # On s'assure que les colonnes numériques sont bien de type float avant le scaling.
-    numerical_cols = feature_config['numerical_features']
-    df[numerical_cols] = df[numerical_cols].astype(float)
-    # --- FIN DE LA CORRECTION ---
-
-    all_categorical_features = feature_config.get('categorical_features_one_hot', [])
-    for col in all_categorical_features:
-        df[col] = 0
-
-    for key, value in new_data.items():
-        one_hot_col_name = f"{key}_{value}"
-        if one_hot_col_name in df.columns:
-            df.loc[0, one_hot_col_name] = 1
-
-    for col in numerical_cols:
-         if col not in df.columns:
-             df[col] = 0
-
-    try:
-        df_processed = df[model_columns]
-    except KeyError as e:
-        print(f"Erreur de colonne : La colonne {e} est attendue par le modèle mais n'a pas été trouvée.")
-        return None
-
-    df_processed.loc[:, numerical_cols] = scaler.transform(df_processed[numerical_cols])
-    
-    print("-> Données prêtes. Lancement de la prédiction...")
-    
-    prediction_proba = model.predict(df_processed, verbose=0)[0][0]
-    
-    decision = "Utile" if prediction_proba > DECISION_THRESHOLD else "Inutile"
-    confidence = prediction_proba if decision == "Utile" else 1 - prediction_proba
-    
-    return {
-        "decision": decision,
-        "raw_probability": float(prediction_proba),
-        "confidence_score": f"{confidence * 100:.2f}%",
-        "threshold_used": DECISION_THRESHOLD
-    }
+    # Durée de chaque étape dans instrumentation.METRICS (rien si BUTTERFLY_METRICS=0)
+    timer = METRICS.timer()
+
+    # Même encodage que le chemin par lot : un lot d'une seule ligne
+    X = encode_incidents([new_data])
+    timer.lap("encode")
+
+    if prediction_cache is not None:
+        prediction_proba = prediction_cache.predict(X[0], lambda row: artifacts.predict_matrix(row[None], timer)[0])
+    else:
+        prediction_proba = artifacts.predict_matrix(X, timer)[0]
+
+    result = _build_result(prediction_proba)
+    timer.lap("post")
+    METRICS.count_decisions(prediction_proba, DECISION_THRESHOLD)
+    timer.done("predict_incident")
+    return result
+
+# --- 3. PRÉDICTION PAR LOT ---
+
+def encode_incidents(records) -> np.ndarray:
+    """
+    Encode toutes les lignes en une seule matrice NumPy (n, len(model_columns)),
+    dans l'ordre de 'expert_model_columns.json' (valeurs brutes, le scaler est appliqué
+    par predict_matrix). Les clés sont acceptées en snake_case ou en camelCase.
+    """
+    return artifacts.encode(records)
+
+def predict_proba(records) -> np.ndarray:
+    """Retourne les probabilités brutes (float32, une par ligne) en un seul appel au modèle."""
+    timer = METRICS.timer()
+    proba = artifacts.predict_proba(records, timer)
+    METRICS.observe_batch("predict_proba", len(proba))
+    timer.done("predict_proba")
+    return proba
+
+def _build_result(prediction_proba):
+    return build_result(prediction_proba, DECISION_THRESHOLD)
+
+def predict_incidents(records):
+    """
+    Version par lot de predict_incident : un seul encodage et un seul appel au modèle.
+
+    :param records: Une liste de dictionnaires, un dictionnaire de colonnes ou un DataFrame.
+    :return: Une liste de verdicts, dans l'ordre des lignes d'entrée.
+    """
+    proba = predict_proba(records)
+    METRICS.count_decisions(proba, DECISION_THRESHOLD)
+    return [_build_result(p) for p in proba]
 
-# --- 3. EXEMPLE D'UTILISATION ---
+# --- 4. EXEMPLE D'UTILISATION ---
 
 if __name__ == "__main__":
     
@@ -101,7 +107,7 @@ if __name__ == "__main__":
         "user_engagement_rate": 0.7,
         "user_num_friends": 45,
         "user_connections": 180,
-        "urgency_score": (1 / (1.2 + 0.1)) * (1 / (0 + 1)), # Doit être calculé
+        "urgency_score": urgency_score(1.2, 0),
         
         # Caractéristiques catégorielles (valeurs brutes)
         "user_type": "Tourist",
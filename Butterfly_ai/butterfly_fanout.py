@@ -0,0 +1,175 @@
+# butterfly_fanout.py
+# Classement de toute une audience de candidats pour un incident donné
+
+import numpy as np
+
+import butterfly # Module de prédiction (encodage + modèle expert)
+from geo_features import haversine_km, urgency_score
+from social_graph import SocialGraph, overlap_ratio
+from spatial_index import DEFAULT_CELL_KM, GridIndex
+
+# --- 1. CONFIGURATION ---
+
+# Rayon par défaut de la zone d'alerte autour de l'incident
+DEFAULT_RADIUS_KM = 2.0
+
+# Nombre maximum d'utilisateurs retournés par défaut
+DEFAULT_TOP_K = 100
+
+# --- 2. POPULATION D'UTILISATEURS (STOCKAGE EN COLONNES) ---
+
+class UserPopulation:
+    """
+    Population d'utilisateurs candidats, stockée colonne par colonne en tableaux NumPy
+    pour que toutes les caractéristiques (utilisateur, incident) se calculent en bloc.
+
+    :param friends: SocialGraph optionnel, une ligne par utilisateur (même ordre que user_ids).
+    """
+    def __init__(self, user_ids, latitudes, longitudes, engagement_rates,
+                 num_friends, connections, user_types, friends: SocialGraph = None):
+        self.user_ids = np.asarray(user_ids)
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.engagement_rates = np.asarray(engagement_rates, dtype=np.float32)
+        self.num_friends = np.asarray(num_friends, dtype=np.float32)
+        self.connections = np.asarray(connections, dtype=np.float32)
+        self.user_types = np.asarray(user_types).astype(str)
+
+        n_users = len(self.user_ids)
+        for name in ("latitudes", "longitudes", "engagement_rates", "num_friends", "connections", "user_types"):
+            if len(getattr(self, name)) != n_users:
+                raise ValueError(f"La colonne '{name}' n'a pas la même longueur que 'user_ids'.")
+        if friends is not None and len(friends) != n_users:
+            raise ValueError("Le graphe 'friends' doit avoir une ligne par utilisateur.")
+        self.friends = friends
+        self.spatial_index = None
+
+    @classmethod
+    def from_records(cls, users):
+        """
+        Construit la population à partir d'une liste de dictionnaires utilisateur.
+        Si chaque utilisateur porte une liste 'friends', elles sont stockées en SocialGraph.
+        """
+        friends = None
+        if users and all("friends" in u for u in users):
+            friends = SocialGraph.from_lists([u["friends"] for u in users])
+        return cls(
+            user_ids=[u["user_id"] for u in users],
+            latitudes=[u["lat"] for u in users],
+            longitudes=[u["lon"] for u in users],
+            engagement_rates=[u["engagement_rate"] for u in users],
+            num_friends=[u["num_friends"] for u in users],
+            connections=[u["connections"] for u in users],
+            user_types=[u["user_type"] for u in users],
+            friends=friends,
+        )
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def build_spatial_index(self, cell_km=DEFAULT_CELL_KM, **kwargs):
+        """Indexe les positions (GridIndex) : rank_audience ne lit plus que les cellules du rayon."""
+        self.spatial_index = GridIndex(self.latitudes, self.longitudes, cell_km=cell_km, **kwargs)
+        return self.spatial_index
+
+    def update_positions(self, indices, latitudes, longitudes):
+        """Nouvelles positions pour les utilisateurs 'indices' (colonnes et index spatial)."""
+        self.latitudes[indices] = latitudes
+        self.longitudes[indices] = longitudes
+        if self.spatial_index is not None:
+            self.spatial_index.update(indices, latitudes, longitudes)
+
+# --- 3. CARACTÉRISTIQUES PAR PAIRE (VECTORISÉES) ---
+
+def build_pair_features(incident: dict, population: UserPopulation, index=None, distance=None):
+    """
+    Construit les colonnes d'entrée du modèle pour toutes les paires (incident, utilisateur).
+
+    Les attributs de l'incident restent scalaires : l'encodeur de butterfly les diffuse.
+    :param index: Sous-ensemble optionnel d'indices de la population.
+    :param distance: Distances déjà calculées pour ce sous-ensemble (évite un second calcul).
+    """
+    if index is None:
+        index = slice(None)
+    if distance is None:
+        distance = haversine_km(
+            population.latitudes[index], population.longitudes[index],
+            incident["lat"], incident["lon"]
+        )
+    days_since = incident["days_since_incident"]
+    urgency = urgency_score(distance, days_since)
+    day_of_week = incident["day_of_week"]
+
+    return {
+        "distance_km": distance,
+        "days_since_incident": days_since,
+        "hour_of_day": incident["hour_of_day"],
+        "user_engagement_rate": population.engagement_rates[index],
+        "user_num_friends": population.num_friends[index],
+        "user_connections": population.connections[index],
+        "urgency_score": urgency,
+        "user_type": population.user_types[index],
+        "incident_type": incident["incident_type"],
+        "day_of_week": day_of_week,
+        "is_weekend": incident.get("is_weekend", 1 if day_of_week >= 5 else 0),
+        "incident_zone_type": incident["incident_zone_type"],
+    }
+
+# --- 4. CLASSEMENT DE L'AUDIENCE ---
+
+def rank_audience(incident: dict, population: UserPopulation,
+                  top_k: int = DEFAULT_TOP_K, radius_km: float = DEFAULT_RADIUS_KM,
+                  threshold: float = None):
+    """
+    Score un incident contre toute la population et retourne les top-K utilisateurs
+    dont la probabilité dépasse le seuil de décision.
+
+    :param incident: Dictionnaire avec 'lat', 'lon', 'incident_type', 'incident_zone_type',
+                     'days_since_incident', 'hour_of_day', 'day_of_week' (et 'is_weekend' optionnel).
+                     Avec 'victim_friends' (liste d'identifiants) et population.friends, chaque
+                     utilisateur retourné porte aussi son 'social_overlap' avec la victime.
+    :param radius_km: Rayon de la zone d'alerte ; None pour scorer toute la population.
+                      Si population.spatial_index existe, seules les cellules du rayon sont lues.
+    :param threshold: Seuil de décision (par défaut butterfly.DECISION_THRESHOLD).
+    :return: Une liste de dictionnaires triée par probabilité décroissante.
+    """
+    if threshold is None:
+        threshold = butterfly.DECISION_THRESHOLD
+    if len(population) == 0:
+        return []
+
+    # Filtre géographique d'abord : seuls les candidats dans le rayon passent par le modèle
+    if radius_km is not None and population.spatial_index is not None:
+        candidates, candidate_distance = population.spatial_index.query_radius(incident["lat"], incident["lon"], radius_km)
+    else:
+        distance = haversine_km(population.latitudes, population.longitudes, incident["lat"], incident["lon"])
+        candidates = np.flatnonzero(distance <= radius_km) if radius_km is not None else np.arange(len(population))
+        candidate_distance = distance[candidates]
+    if len(candidates) == 0:
+        return []
+
+    features = build_pair_features(incident, population, candidates, candidate_distance)
+    probabilities = butterfly.predict_proba(features)
+
+    above = np.flatnonzero(probabilities > threshold)
+    if len(above) > top_k:
+        above = above[np.argpartition(-probabilities[above], top_k - 1)[:top_k]]
+    above = above[np.argsort(-probabilities[above], kind="stable")]
+
+    results = [
+        {
+            "user_id": population.user_ids[candidates[i]].item(),
+            "probability": float(probabilities[i]),
+            "distance_km": float(features["distance_km"][i]),
+            "urgency_score": float(features["urgency_score"][i]),
+        }
+        for i in above
+    ]
+
+    if population.friends is not None and incident.get("victim_friends") is not None and len(above):
+        # Amis communs avec la victime (score social de ButterflyMock), en un seul lot
+        victim = SocialGraph.from_lists([incident["victim_friends"]])
+        social = overlap_ratio(population.friends, candidates[above], victim, 0)
+        for result, value in zip(results, social.tolist()):
+            result["social_overlap"] = value
+    return results
@@ -0,0 +1,192 @@
+# butterfly_features.py
+# Encodage des caractéristiques partagé par tous les points d'entrée (butterfly, ml_server)
+# et tous les moteurs de prédiction (Keras, NumPy).
+# Ce module n'importe ni TensorFlow ni pandas.
+#
+# feature_config.json et expert_model_columns.json sont "compilés" une fois en tables
+# d'index (EncodingPlan) : encoder une ligne revient ensuite à quelques écritures dans
+# un tableau, sans construire de DataFrame.
+
+import numpy as np
+
+class FeatureEncodingError(ValueError):
+    """Entrée impossible à encoder : caractéristique manquante, catégorie inconnue ou mauvaise forme."""
+
+# --- 1. NORMALISATION DES ENTRÉES ---
+
+def records_to_columns(records):
+    """
+    Normalise l'entrée en un dictionnaire {nom_colonne: séquence de valeurs}.
+
+    Accepte une liste de dictionnaires, un dictionnaire de colonnes (valeurs scalaires
+    autorisées) ou un DataFrame.
+    """
+    if hasattr(records, "columns") and hasattr(records, "to_numpy"): # DataFrame pandas
+        return {col: records[col].to_numpy() for col in records.columns}, len(records)
+    if isinstance(records, dict):
+        # Les valeurs scalaires sont diffusées sur toutes les lignes (ex: attributs de l'incident)
+        lengths = {len(values) for values in records.values() if np.ndim(values) > 0}
+        if len(lengths) > 1:
+            raise FeatureEncodingError("Toutes les colonnes doivent avoir la même longueur.")
+        return records, lengths.pop() if lengths else 1
+
+    keys = {}
+    for record in records:
+        for key in record:
+            keys.setdefault(key, None)
+    return {key: [record.get(key) for record in records] for key in keys}, len(records)
+
+def camel_case(name: str) -> str:
+    """'incident_zone_type' -> 'incidentZoneType' (format des requêtes du backend Node)."""
+    head, *tail = name.split("_")
+    return head + "".join(part[:1].upper() + part[1:] for part in tail)
+
+# --- 2. PLAN D'ENCODAGE COMPILÉ ---
+
+class EncodingPlan:
+    """
+    Tables d'index précalculées à partir de l'ordre des colonnes du modèle et de feature_config.json.
+
+    Trois sortes de caractéristiques brutes :
+    - numériques (feature_config['numerical_features']) : copiées dans leur colonne ;
+    - catégorielles : la valeur choisit une colonne One-Hot f"{champ}_{valeur}" ;
+    - binaires : colonne One-Hot seule de son préfixe (ex: is_weekend), valeur brute recopiée.
+    Chaque champ est accepté en snake_case et en camelCase.
+    """
+    def __init__(self, model_columns, feature_config):
+        self.columns = list(model_columns)
+        self.n_columns = len(self.columns)
+        index = {col: i for i, col in enumerate(self.columns)}
+
+        numerical = list(feature_config['numerical_features'])
+        one_hot = list(feature_config.get('categorical_features_one_hot', []))
+        unknown = [col for col in numerical + one_hot if col not in index]
+        if unknown:
+            raise FeatureEncodingError(f"Colonnes de feature_config absentes du modèle : {unknown}")
+        uncovered = [col for col in self.columns if col not in numerical and col not in one_hot]
+        if uncovered:
+            raise FeatureEncodingError(f"Colonnes du modèle absentes de feature_config : {uncovered}")
+
+        # Regroupement des colonnes One-Hot par champ (préfixe avant le dernier '_')
+        groups = {}
+        for col in one_hot:
+            field, _, value = col.rpartition("_")
+            groups.setdefault(field, {})[value] = index[col]
+
+        self.numeric = [(self._aliases(name), index[name]) for name in numerical]
+        self.binary = []
+        self.categorical = []
+        for field, values in groups.items():
+            if len(values) == 1:
+                (value, i), = values.items()
+                col = f"{field}_{value}"
+                self.binary.append((self._aliases(col), i))
+            else:
+                # Les catégories numériques (day_of_week) sont aussi indexées par leur entier
+                lookup = dict(values)
+                lookup.update({int(v): i for v, i in values.items() if v.lstrip("-").isdigit()})
+                self.categorical.append((self._aliases(field), lookup))
+
+    @staticmethod
+    def _aliases(name):
+        camel = camel_case(name)
+        return (name,) if camel == name else (name, camel)
+
+    @staticmethod
+    def _lookup(record, names):
+        for name in names:
+            if name in record:
+                return record[name]
+        raise FeatureEncodingError(f"Caractéristique manquante : '{names[0]}'")
+
+    @staticmethod
+    def _category_index(field, categories, value):
+        # 4, 4.0 (hash identiques) et "4" trouvent la même colonne
+        i = categories.get(value) if isinstance(value, (str, int, float)) else None
+        if i is None:
+            i = categories.get(str(value))
+        if i is None:
+            expected = sorted(v for v in categories if isinstance(v, str))
+            raise FeatureEncodingError(f"Valeur inconnue {value!r} pour '{field}' (attendu : {expected})")
+        return i
+
+    # --- Encodage ---
+
+    def encode_row(self, record: dict, out=None) -> np.ndarray:
+        """Encode un seul dictionnaire en vecteur (n_columns,) float32, sans scaler."""
+        row = np.zeros(self.n_columns, dtype=np.float32) if out is None else out
+        for names, i in self.numeric:
+            row[i] = self._lookup(record, names)
+        for names, i in self.binary:
+            row[i] = 1.0 if self._lookup(record, names) else 0.0
+        for names, categories in self.categorical:
+            row[self._category_index(names[0], categories, self._lookup(record, names))] = 1.0
+        return row
+
+    def encode(self, records) -> np.ndarray:
+        """
+        Encode toutes les lignes en une matrice (n, n_columns) float32 dans l'ordre du modèle,
+        SANS appliquer le scaler. Entrée : liste de dictionnaires, dictionnaire de colonnes
+        (valeurs scalaires diffusées) ou DataFrame.
+        """
+        if isinstance(records, (list, tuple)):
+            columns, n_rows = self._columns_from_rows(records), len(records)
+        else:
+            columns, n_rows = records_to_columns(records)
+
+        X = np.zeros((n_rows, self.n_columns), dtype=np.float32)
+        if n_rows == 0:
+            return X
+
+        for names, i in self.numeric:
+            X[:, i] = np.asarray(self._lookup(columns, names), dtype=np.float64)
+        for names, i in self.binary:
+            X[:, i] = np.asarray(self._lookup(columns, names), dtype=np.float64) != 0
+        rows_index = np.arange(n_rows)
+        for names, categories in self.categorical:
+            values = self._lookup(columns, names)
+            if np.ndim(values) == 0:
+                X[:, self._category_index(names[0], categories, values)] = 1.0
+                continue
+            values = values if isinstance(values, list) else np.asarray(values).tolist()
+            # Une recherche dans le dictionnaire par ligne ; -1 signale une valeur inconnue
+            get = categories.get
+            targets = np.array([get(v, -1) for v in values], dtype=np.intp)
+            unknown = np.flatnonzero(targets < 0)
+            if len(unknown): # dernier essai via str(), sinon FeatureEncodingError
+                targets[unknown] = [self._category_index(names[0], categories, values[i]) for i in unknown]
+            X[rows_index, targets] = 1.0
+        return X
+
+    def _columns_from_rows(self, rows):
+        """Extrait seulement les champs utiles d'une liste de dictionnaires, colonne par colonne."""
+        columns = {}
+        for names, _ in self.numeric + self.binary + self.categorical:
+            # Nom (snake_case ou camelCase) choisi d'après la première ligne
+            name = next((n for n in names if n in rows[0]), names[0]) if rows else names[0]
+            try:
+                columns[names[0]] = [row[name] for row in rows]
+            except KeyError: # lignes de casses mélangées, ou champ réellement absent
+                columns[names[0]] = [self._lookup(row, names) for row in rows]
+        return columns
+
+    def check_matrix(self, X) -> np.ndarray:
+        """Vérifie qu'une matrice déjà encodée a la bonne forme (n, n_columns)."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_columns:
+            raise FeatureEncodingError(f"Matrice (n, {self.n_columns}) attendue, reçu la forme {X.shape}")
+        return X
+
+# --- 3. INTERPRÉTATION DU RÉSULTAT ---
+
+def build_result(prediction_proba, threshold):
+    """Transforme une probabilité brute en verdict avec le seuil de décision donné."""
+    decision = "Utile" if prediction_proba > threshold else "Inutile"
+    confidence = prediction_proba if decision == "Utile" else 1 - prediction_proba
+
+    return {
+        "decision": decision,
+        "raw_probability": float(prediction_proba),
+        "confidence_score": f"{confidence * 100:.2f}%",
+        "threshold_used": threshold
+    }
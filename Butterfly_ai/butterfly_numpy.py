@@ -0,0 +1,59 @@
+# butterfly_numpy.py
+# Moteur d'inférence NumPy : même interface que butterfly.py, sans TensorFlow
+#
+# Le fichier .npz est produit par export_numpy_model.py (BatchNormalization et
+# StandardScaler déjà repliés dans les poids).
+
+import numpy as np
+
+from butterfly_features import build_result
+from instrumentation import METRICS
+from model_loader import get_artifacts, load_decision_threshold
+
+# --- 1. CONFIGURATION ET CHARGEMENT DES ARTEFACTS ---
+
+# Seuil de décision recommandé par evaluation.py (decision_threshold.json), 0.7 par défaut
+DECISION_THRESHOLD = load_decision_threshold()
+
+# Artefacts partagés, chargés au premier appel (voir model_loader.py)
+artifacts = get_artifacts("numpy")
+
+def warmup():
+    """Charge le modèle et exécute une prédiction factice ; retourne la durée (s)."""
+    return artifacts.warmup()
+
+# --- 2. PRÉDICTION ---
+
+def predict_proba(records) -> np.ndarray:
+    """Retourne les probabilités brutes (float32, une par ligne)."""
+    timer = METRICS.timer()
+    proba = artifacts.predict_proba(records, timer)
+    METRICS.observe_batch("predict_proba", len(proba))
+    timer.done("predict_proba")
+    return proba
+
+def predict_incident(new_data: dict):
+    """
+    Prépare les données d'un nouvel incident, exécute la prédiction et retourne un verdict.
+
+    :param new_data: Un dictionnaire contenant les caractéristiques brutes du nouvel incident.
+    :return: Un dictionnaire avec la décision et le score de confiance.
+    """
+    timer = METRICS.timer()
+    prediction_proba = artifacts.predict_proba([new_data], timer)[0]
+    result = build_result(prediction_proba, DECISION_THRESHOLD)
+    timer.lap("post")
+    METRICS.count_decisions(prediction_proba, DECISION_THRESHOLD)
+    timer.done("predict_incident")
+    return result
+
+def predict_incidents(records):
+    """
+    Version par lot de predict_incident.
+
+    :param records: Une liste de dictionnaires, un dictionnaire de colonnes ou un DataFrame.
+    :return: Une liste de verdicts, dans l'ordre des lignes d'entrée.
+    """
+    proba = predict_proba(records)
+    METRICS.count_decisions(proba, DECISION_THRESHOLD)
+    return [build_result(p, DECISION_THRESHOLD) for p in proba]
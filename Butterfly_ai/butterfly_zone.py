@@ -2,6 +2,7 @@
 # Ton application principale
 
 import butterfly # On importe notre module de prédiction
+from geo_features import urgency_score
 
 def on_new_incident_reported(incident_data):
     """
@@ -19,7 +20,9 @@ def on_new_incident_reported(incident_data):
 
         # Ici, tu peux déclencher la logique d'alerte dynamique
         if prediction['raw_probability'] > 0.85:
-            # Créer une zone d'alerte de 2km, trouver les utilisateurs, etc.
+            # Créer une zone d'alerte de 2km, trouver les utilisateurs, etc. : voir
+            # butterfly_fanout.rank_audience (avec population.build_spatial_index() pour
+            # ne lire que les utilisateurs proches, cf. spatial_index.py)
             pass
 
 # --- Simulation ---
@@ -31,7 +34,7 @@ new_incident = {
     "user_engagement_rate": 0.9,
     "user_num_friends": 200,
     "user_connections": 800,
-    "urgency_score": (1 / (0.8 + 0.1)) * (1 / (0 + 1)),
+    "urgency_score": urgency_score(0.8, 0),
     "user_type": "Local",
     "incident_type": "Agression",
     "day_of_week": 5, # Samedi
@@ -0,0 +1,172 @@
+# dataset_io.py
+# Écriture en continu (par blocs) et relecture du jeu de données expert
+#
+# Trois formats de sortie, choisis par generate_dataset.py --format :
+# - "csv"     : CSV One-Hot historique (lu par train_optimized_network.py) ;
+# - "npy"     : un dossier avec un fichier .npy par colonne + schema.json, catégorielles en
+#               codes entiers int8, relisible en memmap sans tout charger ;
+# - "parquet" : fichier Parquet, catégorielles en colonnes dictionnaire (nécessite pyarrow).
+# Chaque bloc est écrit dès qu'il est produit : la mémoire ne dépend pas du nombre de lignes.
+
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+
+FORMATS = ("csv", "npy", "parquet")
+SCHEMA_FILENAME = "schema.json"
+SCHEMA_VERSION = 1
+
+# --- 1. SCHÉMA ---
+# Liste ordonnée de colonnes : {"name", "dtype", "kind"} avec kind parmi
+# "numerical", "categorical" (+ "categories" : valeur de chaque code), "binary", "label".
+
+def one_hot_header(schema):
+    """En-tête du CSV One-Hot : une colonne par catégorie, binaires et label recopiés."""
+    header = []
+    for column in schema:
+        if column["kind"] == "categorical":
+            header.extend(f"{column['name']}_{category}" for category in column["categories"])
+        else:
+            header.append(column["name"])
+    return header
+
+# --- 2. ÉCRIVAINS ---
+# À utiliser dans un bloc with : si une exception interrompt l'écriture, close(ok=False)
+# supprime la sortie partielle au lieu de la valider (et ne masque pas l'exception).
+
+class _Writer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(ok=exc_type is None)
+        return False
+
+class CsvWriter(_Writer):
+    """CSV One-Hot, ajouté bloc par bloc."""
+    def __init__(self, path, schema, n_rows=None):
+        self.path = Path(path)
+        self.schema = schema
+        self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(one_hot_header(schema))
+
+    def write(self, columns):
+        out = []
+        for column in self.schema:
+            values = columns[column["name"]]
+            if column["kind"] == "categorical":
+                out.extend((values == code).astype(np.int8).tolist() for code in range(len(column["categories"])))
+            else:
+                out.append(values.tolist())
+        self._writer.writerows(zip(*out))
+
+    def close(self, ok=True):
+        self._file.close()
+        if not ok:
+            self.path.unlink(missing_ok=True)
+
+class NpyColumnsWriter(_Writer):
+    """
+    Un fichier <colonne>.npy par colonne. L'en-tête .npy est écrit d'avance pour n_rows
+    lignes, puis les blocs sont ajoutés à la suite : aucune colonne n'est gardée en mémoire.
+    """
+    def __init__(self, directory, schema, n_rows):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.n_rows = n_rows
+        self.rows_written = 0
+        self._files = {}
+        for column in schema:
+            f = open(self.directory / f"{column['name']}.npy", 'wb')
+            header = {"descr": np.dtype(column["dtype"]).str, "fortran_order": False, "shape": (n_rows,)}
+            np.lib.format.write_array_header_1_0(f, header)
+            self._files[column["name"]] = f
+
+    def write(self, columns):
+        for column in self.schema:
+            values = np.ascontiguousarray(columns[column["name"]], dtype=column["dtype"])
+            self._files[column["name"]].write(values.tobytes())
+        self.rows_written += len(columns[self.schema[0]["name"]])
+
+    def close(self, ok=True):
+        """
+        :param ok: False si l'écriture a été interrompue : les .npy partiels sont supprimés
+                   (leurs en-têtes annoncent plus de lignes qu'ils n'en contiennent).
+        """
+        for f in self._files.values():
+            f.close()
+        if not ok:
+            self._remove()
+            return
+        if self.rows_written != self.n_rows:
+            self._remove()
+            raise ValueError(f"{self.rows_written} lignes écrites, {self.n_rows} annoncées dans l'en-tête .npy")
+        with open(self.directory / SCHEMA_FILENAME, 'w') as f:
+            json.dump({"version": SCHEMA_VERSION, "n_rows": self.n_rows, "columns": self.schema}, f, indent=4)
+
+    def _remove(self):
+        for name in self._files:
+            (self.directory / f"{name}.npy").unlink(missing_ok=True)
+        (self.directory / SCHEMA_FILENAME).unlink(missing_ok=True)
+
+class ParquetWriter(_Writer):
+    """Parquet, un groupe de lignes par bloc ; catégorielles en dictionnaire (codes int8)."""
+    def __init__(self, path, schema, n_rows=None):
+        self.path = Path(path)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Le format 'parquet' nécessite pyarrow (pip install pyarrow)") from e
+        self._pa = pa
+        self.schema = schema
+        fields = []
+        for column in schema:
+            if column["kind"] == "categorical":
+                value_type = pa.int64() if all(isinstance(c, int) for c in column["categories"]) else pa.string()
+                fields.append(pa.field(column["name"], pa.dictionary(pa.int8(), value_type)))
+            else:
+                fields.append(pa.field(column["name"], pa.from_numpy_dtype(np.dtype(column["dtype"]))))
+        self._arrow_schema = pa.schema(fields, metadata={"butterfly_schema": json.dumps(schema)})
+        self._writer = pq.ParquetWriter(str(path), self._arrow_schema)
+
+    def write(self, columns):
+        pa = self._pa
+        arrays = []
+        for column, field in zip(self.schema, self._arrow_schema):
+            values = np.asarray(columns[column["name"]], dtype=column["dtype"])
+            if column["kind"] == "categorical":
+                dictionary = pa.array(column["categories"], type=field.type.value_type)
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(values, type=pa.int8()), dictionary))
+            else:
+                arrays.append(pa.array(values))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._arrow_schema))
+
+    def close(self, ok=True):
+        self._writer.close()
+        if not ok:
+            self.path.unlink(missing_ok=True)
+
+WRITERS = {"csv": CsvWriter, "npy": NpyColumnsWriter, "parquet": ParquetWriter}
+
+def open_writer(fmt, path, schema, n_rows):
+    if fmt not in WRITERS:
+        raise ValueError(f"Format inconnu '{fmt}', attendu l'un de {FORMATS}")
+    return WRITERS[fmt](path, schema, n_rows)
+
+# --- 3. LECTURE ---
+
+def load_npy_columns(directory, mmap_mode="r"):
+    """Relit un dossier écrit par NpyColumnsWriter : (schéma, {colonne: tableau memmap})."""
+    directory = Path(directory)
+    with open(directory / SCHEMA_FILENAME) as f:
+        meta = json.load(f)
+    columns = {
+        column["name"]: np.load(directory / f"{column['name']}.npy", mmap_mode=mmap_mode)
+        for column in meta["columns"]
+    }
+    return meta["columns"], columns
@@ -0,0 +1,265 @@
+# evaluation.py
+# Évaluation sans affichage : balayage de tous les seuils, rapports JSON/PNG et seuil recommandé
+#
+# Un seul tri des probabilités suivi de sommes cumulées donne, pour chaque seuil candidat
+# (chaque probabilité distincte), les comptes TP/FP/FN/TN et donc précision, rappel et F1 :
+# O(n log n) pour tous les seuils, au lieu d'un classification_report par seuil.
+#
+# Les graphiques utilisent le backend matplotlib "Agg" (fichiers PNG, aucune fenêtre) ; sans
+# matplotlib, seul le JSON est écrit. Le seuil recommandé est sauvegardé dans
+# decision_threshold.json, lu par butterfly.py (0.7 si le fichier est absent).
+#
+# Exemple, sur des prédictions sauvegardées (np.savez(..., y_true=..., y_proba=...)) :
+#   python evaluation.py predictions.npz --objective "max_recall,min_precision=0.95"
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from model_loader import THRESHOLD_PATH
+
+# --- 1. CONFIGURATION ---
+
+# Objectif du seuil recommandé : "f1", "fbeta,beta=0.5", "max_recall,min_precision=0.9"
+# ou "max_precision,min_recall=0.9"
+DEFAULT_OBJECTIVE = "f1"
+
+# Seuils détaillés dans le rapport (ceux de l'ancienne étape 5) et pas de la courbe enregistrée
+REPORT_THRESHOLDS = [0.5, 0.7, 0.8, 0.9]
+CURVE_STEP = 0.01
+
+OUTPUT_DIR = Path("evaluation")
+
+def parse_objective(spec: str) -> dict:
+    """'max_recall,min_precision=0.9' -> {'name': 'max_recall', 'min_precision': 0.9}"""
+    name, *options = [part.strip() for part in spec.split(",") if part.strip()]
+    objective = {"name": name}
+    for option in options:
+        key, _, value = option.partition("=")
+        objective[key.strip()] = float(value)
+    if name not in OBJECTIVES:
+        raise ValueError(f"Objectif inconnu '{name}', attendu l'un de {sorted(OBJECTIVES)}")
+    return objective
+
+# --- 2. BALAYAGE DES SEUILS ---
+
+def threshold_sweep(y_true, y_proba) -> dict:
+    """
+    Comptes et métriques pour chaque seuil candidat t, avec la règle de butterfly :
+    prédit utile si proba > t. Les candidats sont les probabilités distinctes, par ordre
+    décroissant (la plus haute : aucune ligne prédite utile), puis 0.0.
+
+    :return: Un dictionnaire de tableaux alignés : threshold, tp, fp, fn, tn, precision, recall, f1.
+    """
+    y_true = np.asarray(y_true).astype(bool).ravel()
+    y_proba = np.asarray(y_proba, dtype=np.float64).ravel()
+    if len(y_true) != len(y_proba) or len(y_true) == 0:
+        raise ValueError("y_true et y_proba doivent avoir la même longueur, non nulle")
+
+    order = np.argsort(-y_proba, kind="stable")
+    proba, labels = y_proba[order], y_true[order]
+    # Dernière position de chaque probabilité distincte : comptes des lignes >= cette valeur
+    last = np.flatnonzero(np.append(proba[1:] != proba[:-1], True))
+    tp_ge = np.cumsum(labels)[last]
+    fp_ge = (last + 1) - tp_ge
+
+    # proba > t : les lignes >= la valeur distincte précédente
+    threshold = proba[last]
+    tp = np.concatenate(([0], tp_ge[:-1]))
+    fp = np.concatenate(([0], fp_ge[:-1]))
+    if threshold[-1] > 0: # seuil 0.0 : toutes les lignes prédites utiles
+        threshold, tp, fp = np.append(threshold, 0.0), np.append(tp, tp_ge[-1]), np.append(fp, fp_ge[-1])
+
+    positives = int(y_true.sum())
+    negatives = len(y_true) - positives
+    fn = positives - tp
+    tn = negatives - fp
+    precision = np.divide(tp, tp + fp, out=np.ones(len(tp)), where=(tp + fp) > 0)
+    recall = np.divide(tp, positives, out=np.zeros(len(tp)), where=positives > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(tp)), where=(precision + recall) > 0)
+    return {"threshold": threshold, "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "precision": precision, "recall": recall, "f1": f1}
+
+def at_thresholds(sweep: dict, thresholds) -> dict:
+    """Métriques du balayage à des seuils quelconques (proba > t, comme les candidats)."""
+    # Entre deux candidats, les lignes au-dessus de t sont celles du plus grand candidat <= t
+    ascending = sweep["threshold"][::-1]
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    position = np.clip(np.searchsorted(ascending, thresholds, side="right") - 1, 0, len(ascending) - 1)
+    index = len(ascending) - 1 - position
+    rows = {key: values[index] for key, values in sweep.items()}
+    rows["threshold"] = thresholds
+    return rows
+
+def area_under_curves(sweep: dict) -> dict:
+    """AUC ROC et précision moyenne (aire sous la courbe précision-rappel, en escalier)."""
+    negatives = sweep["fp"][-1] + sweep["tn"][-1]
+    positives = sweep["tp"][-1] + sweep["fn"][-1]
+    fpr = sweep["fp"] / negatives if negatives else np.zeros(len(sweep["fp"]))
+    tpr = sweep["recall"]
+    fpr, tpr = np.append(fpr, 1.0), np.append(tpr, 1.0)
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    average_precision = float(np.sum(np.diff(sweep["recall"]) * sweep["precision"][1:])) if positives else 0.0
+    return {"roc_auc": roc_auc, "average_precision": average_precision}
+
+# --- 3. SEUIL RECOMMANDÉ ---
+
+def _score_fbeta(sweep, beta=1.0):
+    p, r = sweep["precision"], sweep["recall"]
+    denominator = beta ** 2 * p + r
+    return np.divide((1 + beta ** 2) * p * r, denominator, out=np.zeros(len(p)), where=denominator > 0)
+
+def _score_max_recall(sweep, min_precision=0.9):
+    return np.where(sweep["precision"] >= min_precision, sweep["recall"], -np.inf)
+
+def _score_max_precision(sweep, min_recall=0.9):
+    return np.where(sweep["recall"] >= min_recall, sweep["precision"], -np.inf)
+
+OBJECTIVES = {
+    "f1": lambda sweep: _score_fbeta(sweep, 1.0),
+    "fbeta": _score_fbeta,
+    "max_recall": _score_max_recall,
+    "max_precision": _score_max_precision,
+}
+
+def recommend_threshold(sweep: dict, objective=DEFAULT_OBJECTIVE) -> dict:
+    """
+    Seuil maximisant l'objectif ; à score égal, le seuil le plus haut (moins d'alertes).
+    :param objective: Spécification textuelle (voir parse_objective) ou dictionnaire déjà lu.
+    """
+    if isinstance(objective, str):
+        objective = parse_objective(objective)
+    options = {key: value for key, value in objective.items() if key != "name"}
+    score = OBJECTIVES[objective["name"]](sweep, **options)
+    if not np.isfinite(score).any():
+        raise ValueError(f"Aucun seuil ne satisfait l'objectif {objective}")
+    best = int(np.argmax(score)) # premier maximum : le seuil le plus haut (ordre décroissant)
+    recommended = {key: values[best].item() for key, values in sweep.items()}
+    recommended["objective"] = objective
+    recommended["score"] = float(score[best])
+    return recommended
+
+# --- 4. RAPPORTS ---
+
+def evaluate_predictions(y_true, y_proba, output_dir=OUTPUT_DIR, objective=DEFAULT_OBJECTIVE,
+                         threshold_path=THRESHOLD_PATH, name="Modèle Expert"):
+    """
+    Balayage complet, métriques JSON, graphiques PNG et seuil recommandé.
+
+    :param threshold_path: Où écrire le seuil recommandé (None pour ne rien écrire).
+    :return: Le rapport (dictionnaire sérialisé dans metrics.json).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sweep = threshold_sweep(y_true, y_proba)
+    recommended = recommend_threshold(sweep, objective)
+    grid = np.round(np.arange(0, 1 + CURVE_STEP / 2, CURVE_STEP), 10)
+    n_rows = sweep["tp"][0] + sweep["fp"][0] + sweep["fn"][0] + sweep["tn"][0]
+
+    report = {
+        "n_rows": int(n_rows),
+        "positive_rate": float((sweep["tp"][0] + sweep["fn"][0]) / n_rows),
+        **area_under_curves(sweep),
+        "n_candidate_thresholds": len(sweep["threshold"]),
+        "recommended": recommended,
+        "report_thresholds": _rows(at_thresholds(sweep, REPORT_THRESHOLDS)),
+        "curve": {key: values.tolist() for key, values in at_thresholds(sweep, grid).items()},
+    }
+    with open(output_dir / "metrics.json", 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nAUC ROC {report['roc_auc']:.4f}, précision moyenne {report['average_precision']:.4f}")
+    print(f"{'seuil':>6}{'précision':>11}{'rappel':>9}{'F1':>8}{'TP':>9}{'FP':>9}{'FN':>9}{'TN':>9}")
+    for row in report["report_thresholds"] + [recommended]:
+        print(f"{row['threshold']:>6.3f}{row['precision']:>11.4f}{row['recall']:>9.4f}{row['f1']:>8.4f}"
+              f"{row['tp']:>9}{row['fp']:>9}{row['fn']:>9}{row['tn']:>9}")
+    print(f"-> Seuil recommandé ({objective if isinstance(objective, str) else objective['name']}) : "
+          f"{recommended['threshold']:.4f}")
+
+    plots = save_plots(sweep, recommended, output_dir, name)
+    print(f"-> Métriques : {output_dir / 'metrics.json'}" + (f", graphiques : {', '.join(plots)}" if plots else
+          " (matplotlib absent : pas de graphiques)"))
+
+    if threshold_path is not None:
+        save_decision_threshold(recommended, threshold_path)
+        print(f"-> Seuil de décision sauvegardé dans '{threshold_path}'")
+    return report
+
+def _rows(columns: dict) -> list:
+    return [dict(zip(columns, values)) for values in zip(*(v.tolist() for v in columns.values()))]
+
+def save_decision_threshold(recommended: dict, path=THRESHOLD_PATH):
+    """Artefact lu par model_loader.load_decision_threshold."""
+    with open(path, 'w') as f:
+        json.dump({
+            "decision_threshold": recommended["threshold"],
+            "objective": recommended["objective"],
+            "precision": recommended["precision"],
+            "recall": recommended["recall"],
+            "f1": recommended["f1"],
+        }, f, indent=4)
+
+def save_plots(sweep: dict, recommended: dict, output_dir: Path, name="Modèle Expert") -> list:
+    """Courbes précision-rappel, ROC, métriques par seuil et matrice de confusion (PNG)."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg") # aucun affichage : fichiers uniquement
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return []
+
+    paths = []
+
+    def save(fig, filename):
+        fig.savefig(output_dir / filename, dpi=100, bbox_inches="tight")
+        plt.close(fig)
+        paths.append(str(output_dir / filename))
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.plot(sweep["recall"], sweep["precision"], label=name)
+    ax.scatter([recommended["recall"]], [recommended["precision"]], color="red", zorder=3,
+               label=f"seuil {recommended['threshold']:.3f}")
+    ax.set_xlabel("Rappel"); ax.set_ylabel("Précision"); ax.set_title("Courbe Précision-Rappel")
+    ax.grid(True); ax.legend()
+    save(fig, "precision_recall.png")
+
+    negatives = sweep["fp"][-1] + sweep["tn"][-1]
+    fig, ax = plt.subplots(figsize=(8, 6))
+    ax.plot(sweep["fp"] / max(1, negatives), sweep["recall"], label=name)
+    ax.plot([0, 1], [0, 1], linestyle="--", color="grey")
+    ax.set_xlabel("Taux de faux positifs"); ax.set_ylabel("Taux de vrais positifs")
+    ax.set_title("Courbe ROC (Receiver Operating Characteristic)"); ax.grid(True); ax.legend()
+    save(fig, "roc.png")
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for key, label in (("precision", "Précision"), ("recall", "Rappel"), ("f1", "F1")):
+        ax.plot(sweep["threshold"], sweep[key], label=label)
+    ax.axvline(recommended["threshold"], color="red", linestyle="--")
+    ax.set_xlabel("Seuil"); ax.set_xlim(0, 1); ax.set_title("Métriques par seuil"); ax.grid(True); ax.legend()
+    save(fig, "threshold_metrics.png")
+
+    cm = np.array([[recommended["tn"], recommended["fp"]], [recommended["fn"], recommended["tp"]]])
+    fig, ax = plt.subplots(figsize=(6, 5))
+    ax.imshow(cm, cmap="Blues")
+    for (i, j), count in np.ndenumerate(cm):
+        ax.text(j, i, f"{count:d}", ha="center", va="center", color="white" if count > cm.max() / 2 else "black")
+    ax.set_xticks([0, 1], ["Inutile", "Utile"]); ax.set_yticks([0, 1], ["Inutile", "Utile"])
+    ax.set_xlabel("Prédiction"); ax.set_ylabel("Vraie valeur")
+    ax.set_title(f"Matrice de Confusion (Seuil = {recommended['threshold']:.3f})")
+    save(fig, "confusion_matrix.png")
+    return paths
+
+# --- 5. EXÉCUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Balayage des seuils sur des prédictions sauvegardées")
+    parser.add_argument("predictions", help="Fichier .npz avec les tableaux y_true et y_proba")
+    parser.add_argument("--objective", default=DEFAULT_OBJECTIVE)
+    parser.add_argument("--output-dir", default=str(OUTPUT_DIR))
+    parser.add_argument("--no-save-threshold", action="store_true", help="Ne pas écrire decision_threshold.json")
+    args = parser.parse_args()
+
+    data = np.load(args.predictions)
+    evaluate_predictions(data["y_true"], data["y_proba"], args.output_dir, args.objective,
+                         threshold_path=None if args.no_save_threshold else THRESHOLD_PATH)
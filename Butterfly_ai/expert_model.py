@@ -0,0 +1,50 @@
+# expert_model.py
+# Architecture du modèle expert, partagée par les scripts d'entraînement
+# (train_optimized_network.py en mémoire, train_streaming.py hors mémoire) et par la
+# recherche d'hyperparamètres (hyperparameter_search.py)
+
+import tensorflow as tf
+from tensorflow import keras
+from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+
+# Architecture de référence (celle de train_optimized_network.py)
+DEFAULT_UNITS = (128, 64, 32)
+DEFAULT_DROPOUT = (0.5, 0.4, 0.0)
+DEFAULT_LEARNING_RATE = 0.001
+DEFAULT_BATCH_SIZE = 64
+
+def build_expert_model(n_inputs, learning_rate=DEFAULT_LEARNING_RATE, units=DEFAULT_UNITS, dropout=DEFAULT_DROPOUT):
+    """
+    MLP Dense -> BatchNormalization -> ReLU (-> Dropout) par couche cachée, sortie sigmoïde, compilé.
+    :param n_inputs: Nombre de colonnes d'entrée (len(expert_model_columns.json)).
+    :param units: Largeur de chaque couche cachée.
+    :param dropout: Taux de Dropout après chaque couche cachée (0 : pas de couche Dropout).
+    """
+    if len(dropout) != len(units):
+        raise ValueError("units et dropout doivent avoir la même longueur")
+    layers = [keras.layers.Input(shape=(n_inputs,))]
+    for width, rate in zip(units, dropout):
+        layers += [
+            keras.layers.Dense(width, kernel_initializer='he_normal'),
+            keras.layers.BatchNormalization(),
+            keras.layers.Activation('relu'),
+        ]
+        if rate > 0:
+            layers.append(keras.layers.Dropout(rate))
+    layers.append(keras.layers.Dense(1, activation='sigmoid'))
+    model = keras.Sequential(layers)
+
+    optimizer = keras.optimizers.Adam(learning_rate=learning_rate)
+
+    model.compile(
+        optimizer=optimizer,
+        loss='binary_crossentropy',
+        metrics=['accuracy', tf.keras.metrics.Precision(name='precision'), tf.keras.metrics.Recall(name='recall')]
+    )
+    return model
+
+def training_callbacks():
+    """Arrêt précoce et réduction du taux d'apprentissage sur la perte de validation."""
+    early_stopping_callback = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
+    learning_rate_scheduler = ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, min_lr=1e-6, verbose=1)
+    return [early_stopping_callback, learning_rate_scheduler]
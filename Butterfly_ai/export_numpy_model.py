@@ -0,0 +1,130 @@
+# export_numpy_model.py
+# Exporte butterfly_expert_model.keras vers un fichier .npz utilisable sans TensorFlow
+#
+# Les couches BatchNormalization et le StandardScaler sont repliés dans les poids des
+# couches Dense : le moteur NumPy (butterfly_numpy.py) n'a plus qu'à enchaîner
+# produit matriciel + biais + activation.
+
+import argparse
+
+import numpy as np
+
+from model_loader import NUMPY_MODEL_PATH, ModelArtifacts, get_artifacts, load_decision_threshold
+
+# --- 1. CONFIGURATION ---
+
+# Tolérance de parité Keras / NumPy sur la probabilité brute (float32, poids repliés)
+PARITY_ATOL = 1e-5
+PARITY_ROWS = 20000
+
+# --- 2. REPLIEMENT DES COUCHES ---
+
+def fold_layers(model):
+    """
+    Parcourt le modèle Sequential et retourne une liste de couches denses équivalentes
+    [(W, b, activation), ...] pour l'inférence : BatchNormalization replié dans la Dense
+    précédente, Dropout ignoré, Activation rattachée à la Dense précédente.
+    """
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "Dense":
+            W, b = (w.astype(np.float64) for w in layer.get_weights())
+            layers.append([W, b, layer.get_config()["activation"]])
+        elif kind == "BatchNormalization":
+            gamma, beta, moving_mean, moving_var = (w.astype(np.float64) for w in layer.get_weights())
+            factor = gamma / np.sqrt(moving_var + layer.epsilon)
+            W, b, activation = layers[-1]
+            layers[-1] = [W * factor, (b - moving_mean) * factor + beta, activation]
+        elif kind == "Activation":
+            layers[-1][2] = layer.get_config()["activation"]
+        elif kind in ("Dropout", "InputLayer"):
+            continue
+        else:
+            raise ValueError(f"Couche non supportée par l'export NumPy : {kind}")
+    return layers
+
+def fold_scaler(layers, scaler, model_columns, numerical_features):
+    """
+    Replie le StandardScaler dans la première couche : x_s = (x - mean) / scale
+    donc W' = W / scale (lignes numériques) et b' = b - (mean / scale) @ W.
+    """
+    W, b, activation = layers[0]
+    W = W.copy()
+    num_idx = [model_columns.index(col) for col in numerical_features]
+    mean_over_scale = scaler.mean_ / scaler.scale_
+    b = b - mean_over_scale @ W[num_idx]
+    W[num_idx] = W[num_idx] / scaler.scale_[:, None]
+    layers[0] = [W, b, activation]
+    return layers
+
+# --- 3. EXPORT ---
+
+def export(output_path=NUMPY_MODEL_PATH):
+    source = get_artifacts("keras").load()
+    model, scaler = source.model, source.scaler
+    model_columns, feature_config = source.model_columns, source.feature_config
+
+    layers = fold_scaler(fold_layers(model), scaler, model_columns, feature_config['numerical_features'])
+    save_numpy_model(output_path, layers, model_columns, feature_config)
+    print(f"Modèle NumPy ({len(layers)} couches denses) sauvegardé dans '{output_path}'")
+    return output_path
+
+def save_numpy_model(output_path, layers, model_columns, feature_config, weight_dtype=np.float32, **extra):
+    """
+    Écrit le .npz lu par model_loader (moteur NumPy).
+    :param weight_dtype: Type de stockage des matrices W (les biais restent en float32).
+    :param extra: Tableaux supplémentaires (ex: échelles de quantification, voir optimize_model.py).
+    """
+    arrays = {
+        "model_columns": np.array(model_columns),
+        "numerical_features": np.array(feature_config['numerical_features']),
+        "categorical_features_one_hot": np.array(feature_config.get('categorical_features_one_hot', [])),
+        "activations": np.array([activation for _, _, activation in layers]),
+    }
+    for i, (W, b, _) in enumerate(layers):
+        arrays[f"W{i}"] = W.astype(weight_dtype)
+        arrays[f"b{i}"] = b.astype(np.float32)
+    arrays.update(extra)
+    np.savez_compressed(output_path, **arrays)
+    return output_path
+
+# --- 4. TEST DE PARITÉ ---
+
+class ParityError(AssertionError):
+    """Les probabilités NumPy s'écartent des probabilités Keras au-delà de la tolérance."""
+
+def parity_rows(n_rows=PARITY_ROWS, seed=0):
+    """n_rows lignes de generate_columns, catégorielles décodées comme en production (dictionnaire de colonnes)."""
+    from generate_dataset import Config, DatasetGenerator, decode_columns, generate_columns
+    columns, _ = decode_columns(DatasetGenerator(Config()).schema(), generate_columns(n_rows, seed))
+    return columns
+
+def check_parity(n_rows=PARITY_ROWS, atol=PARITY_ATOL, numpy_path=NUMPY_MODEL_PATH, seed=0):
+    """
+    Compare les probabilités du modèle Keras et du .npz exporté (numpy_path) sur des lignes
+    produites par le générateur du jeu de données, quelle que soit BUTTERFLY_MODEL_VARIANT.
+    Lève ParityError au-delà de atol ; retourne l'écart maximal.
+    """
+    rows = parity_rows(n_rows, seed)
+    keras_proba = get_artifacts("keras").predict_proba(rows)
+    numpy_proba = ModelArtifacts("numpy", model_path=numpy_path).predict_proba(rows)
+
+    threshold = load_decision_threshold()
+    max_diff = float(np.max(np.abs(keras_proba - numpy_proba)))
+    flipped = int(np.sum((keras_proba > threshold) != (numpy_proba > threshold)))
+    print(f"Parité sur {n_rows} lignes : écart max = {max_diff:.2e} (tolérance {atol:.0e}), décisions différentes = {flipped}")
+    if max_diff > atol:
+        raise ParityError(f"Écart Keras/NumPy {max_diff:.2e} supérieur à la tolérance {atol:.0e}")
+    return max_diff
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export du modèle expert vers NumPy (.npz)")
+    parser.add_argument("--output", default=NUMPY_MODEL_PATH)
+    parser.add_argument("--check-parity", action="store_true", help="Vérifie la parité Keras/NumPy après l'export")
+    parser.add_argument("--rows", type=int, default=PARITY_ROWS)
+    args = parser.parse_args()
+
+    export(args.output)
+    if args.check_parity:
+        check_parity(args.rows, numpy_path=args.output)
@@ -1,15 +1,28 @@
 # generate_expert_dataset.py
 
-import csv
+import argparse
+import os
 import random
-import math
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from tqdm import tqdm
 from enum import Enum
 
-print("Démarrage de la génération du jeu de données v2 (Expert)...")
+import numpy as np
+
+try:
+    import resource # Unix uniquement : pic mémoire affiché en fin de génération
+except ImportError:
+    resource = None
+
+from dataset_io import FORMATS, open_writer
+from geo_features import haversine_km, urgency_score
+from social_graph import SocialGraph, overlap_ratio
 
 # --- MOCK BUTTERFLY (INCHANGÉ) ---
 class ButterflyMock:
@@ -38,8 +51,16 @@ class IncidentType(Enum):
 class Config:
     """Classe de configuration pour tous les paramètres de la simulation."""
     DATASET_SIZE = 50000 # Taille réduite pour une génération plus rapide
+    SHARD_SIZE = 100_000 # Lignes tirées d'un bloc par le moteur vectorisé (et par tâche du pool)
+    WORKERS = os.cpu_count() or 1
+    SEED = 42
+    REFERENCE_TIME = None # "Maintenant" des incidents ; None : l'heure du lancement
+    SOCIAL_MODEL = "analytic" # Score social : "analytic" (loi exacte, sans listes) ou "graph" (listes d'amis CSR)
     OUTPUT_DIR = Path("./")
     CSV_FILENAME = "lisbon_expert_data.csv"
+    NPY_DIRNAME = "lisbon_expert_data_npy"
+    PARQUET_FILENAME = "lisbon_expert_data.parquet"
+    OUTPUT_FORMAT = "csv" # "csv" (One-Hot historique), "npy" ou "parquet" (voir dataset_io.py)
     CONFIG_FILENAME = "feature_config.json"
 
     ZONES = {
@@ -143,7 +164,215 @@ class Oracle:
         
         return 0
 
-# --- 4. GÉNÉRATEUR DE DATASET ---
+    @staticmethod
+    def decide_if_useful_batch(incident_type, urgency, geo, social, gravity):
+        """Mêmes règles que decide_if_useful, sur des colonnes NumPy (incident_type : codes de INCIDENT_TYPES)."""
+        code = {it: INCIDENT_TYPES.index(it.value) for it in IncidentType}
+        useful = incident_type == code[IncidentType.DISPARITION]
+        useful |= (incident_type == code[IncidentType.AGRESSION]) & ((geo > 0.8) | (urgency > 0.5) | (social > 0.3))
+        useful |= (incident_type == code[IncidentType.VOL]) & (((geo > 0.9) & (gravity > 0.5)) | ((urgency > 0.7) & (social > 0.1)))
+        useful |= (incident_type == code[IncidentType.OBJET_PERDU]) & (urgency > 0.9) & (geo > 0.95)
+        return useful.astype(np.int8)
+
+# --- 4. GÉNÉRATION VECTORISÉE (NUMPY) ---
+# Mêmes tirages que User, Incident et ButterflyMock, mais colonne par colonne sur un
+# bloc entier de lignes. Les catégorielles sont des codes entiers (index dans les listes
+# ci-dessous) ; chaque bloc a sa propre graine, dérivée de Config.SEED par SeedSequence.spawn,
+# si bien que le résultat ne dépend pas du nombre de processus.
+
+USER_TYPES = [ut.value for ut in UserType]
+INCIDENT_TYPES = [it.value for it in IncidentType]
+ZONE_TYPES = list(Config.ZONES.keys())
+
+FRIEND_ID_RANGE = (1000, 10000)   # identifiants d'amis tirés par randint (bornes incluses)
+NUM_FRIENDS_RANGE = (10, 150)
+
+def _zone_code(name):
+    return ZONE_TYPES.index(name)
+
+def _random_locations_in_zones(rng, zone_codes):
+    """Équivalent de User._get_random_location_in_zone pour un tableau de codes de zone."""
+    lat = np.empty(len(zone_codes))
+    lon = np.empty(len(zone_codes))
+    for code, zone_type in enumerate(ZONE_TYPES):
+        mask = zone_codes == code
+        count = int(mask.sum())
+        if count == 0:
+            continue
+        centers = np.array([[zone["lat"], zone["lon"]] for zone in Config.ZONES[zone_type]])
+        picked = centers[rng.integers(0, len(centers), count)]
+        offset = rng.uniform(-0.01, 0.01, count) # même décalage en latitude et longitude
+        lat[mask] = picked[:, 0] + offset
+        lon[mask] = picked[:, 1] + offset
+    return lat, lon
+
+@lru_cache(maxsize=None)
+def _distinct_count_cdf(n_values, max_draws):
+    """
+    cdf[n, u] = P(n tirages uniformes parmi n_values valeurs donnent au plus u valeurs distinctes),
+    par récurrence : P(n, u) = P(n-1, u) * u/K + P(n-1, u-1) * (K-u+1)/K.
+    """
+    pmf = np.zeros((max_draws + 1, max_draws + 1))
+    pmf[0, 0] = 1.0
+    u = np.arange(1, max_draws + 1)
+    for n in range(1, max_draws + 1):
+        pmf[n, 1:] = pmf[n - 1, 1:] * u / n_values + pmf[n - 1, :-1] * (n_values - u + 1) / n_values
+    return np.cumsum(pmf, axis=1)
+
+def _social_overlap(rng, num_user_friends):
+    """
+    len(set(amis) & set(amis_victime)) / len(amis), avec les listes tirées comme User et Incident,
+    sans matérialiser les listes : le nombre d'amis distincts de chaque côté suit la loi
+    d'occupation (table _distinct_count_cdf), et leur intersection une loi hypergéométrique.
+    Même loi que le calcul sur les listes, en O(lignes).
+    """
+    n_rows = len(num_user_friends)
+    n_values = FRIEND_ID_RANGE[1] - FRIEND_ID_RANGE[0] + 1
+    cdf = _distinct_count_cdf(n_values, NUM_FRIENDS_RANGE[1])
+    num_victim_friends = rng.integers(NUM_FRIENDS_RANGE[0], NUM_FRIENDS_RANGE[1] + 1, n_rows)
+
+    def distinct(num_draws):
+        return (cdf[num_draws] < rng.random(n_rows)[:, None]).sum(axis=1)
+
+    user_distinct = distinct(num_user_friends)
+    victim_distinct = distinct(num_victim_friends)
+    common = rng.hypergeometric(user_distinct, n_values - user_distinct, victim_distinct)
+    return common / num_user_friends
+
+def _social_overlap_graph(rng, num_user_friends):
+    """
+    Même score que _social_overlap, calculé sur des listes d'amis réellement tirées (avec
+    doublons, comme User et Incident) et stockées en CSR : sert à valider le modèle analytique
+    et à produire des listes réutilisables.
+    """
+    n_rows = len(num_user_friends)
+    num_victim_friends = rng.integers(NUM_FRIENDS_RANGE[0], NUM_FRIENDS_RANGE[1] + 1, n_rows)
+    low, high = FRIEND_ID_RANGE
+    users = SocialGraph.from_flat(num_user_friends, rng.integers(low, high + 1, num_user_friends.sum()))
+    victims = SocialGraph.from_flat(num_victim_friends, rng.integers(low, high + 1, num_victim_friends.sum()))
+    rows = np.arange(n_rows)
+    # Dénominateur de ButterflyMock : len(user.friends), doublons compris
+    return overlap_ratio(users, rows, victims, rows, denominator=num_user_friends)
+
+SOCIAL_MODELS = {"analytic": _social_overlap, "graph": _social_overlap_graph}
+
+def generate_columns(n_rows, seed, reference_time=None, social_model="analytic"):
+    """
+    Tire un bloc de n_rows lignes, colonne par colonne.
+
+    :param seed: Graine ou np.random.SeedSequence du bloc.
+    :param reference_time: "Maintenant" des incidents (datetime) ; l'heure courante par défaut.
+    :param social_model: Clé de SOCIAL_MODELS pour le score social.
+    :return: Un dictionnaire {colonne: tableau NumPy}, catégorielles en codes entiers.
+    """
+    rng = np.random.default_rng(seed)
+    reference_time = reference_time or datetime.now()
+
+    # Utilisateurs
+    user_type = rng.choice(len(USER_TYPES), n_rows, p=np.array(Config.WEIGHTS["user_type"]) / sum(Config.WEIGHTS["user_type"]))
+    num_friends = rng.integers(NUM_FRIENDS_RANGE[0], NUM_FRIENDS_RANGE[1] + 1, n_rows)
+    connections = rng.integers(50, 2001, n_rows)
+    engagement = rng.uniform(0.1, 0.9, n_rows)
+
+    # Incidents : date = maintenant - jours - heures
+    weights = np.array(Config.WEIGHTS["incident_type"])
+    incident_type = rng.choice(len(INCIDENT_TYPES), n_rows, p=weights / weights.sum())
+    days_since = rng.integers(0, 31, n_rows)
+    hours_back = rng.integers(0, 24, n_rows)
+    dates = np.datetime64(reference_time, "s") - days_since * np.timedelta64(1, "D") - hours_back * np.timedelta64(1, "h")
+    day_start = dates.astype("datetime64[D]")
+    hour = ((dates - day_start) // np.timedelta64(1, "h")).astype(np.int64)
+    day_of_week = (day_start.astype(np.int64) + 3) % 7 # le 1970-01-01 est un jeudi (Lundi=0)
+    is_weekend = day_of_week >= 5
+    night = (hour >= 22) | (hour <= 4)
+
+    # Zone de l'incident (Incident._get_realistic_location)
+    code = {it: INCIDENT_TYPES.index(it.value) for it in IncidentType}
+    violent = (incident_type == code[IncidentType.AGRESSION]) | (incident_type == code[IncidentType.DISPARITION])
+    incident_zone = np.where(rng.random(n_rows) < 0.5, _zone_code("touristic"), _zone_code("residential"))
+    incident_zone[incident_type == code[IncidentType.VOL]] = _zone_code("touristic")
+    incident_zone[violent | night] = _zone_code("nightlife")
+
+    # Lieu courant de l'utilisateur (User.get_current_location)
+    user_zone = np.where(rng.random(n_rows) < 0.5, _zone_code("residential"), _zone_code("touristic"))
+    user_zone[night] = _zone_code("nightlife")
+    user_zone[~is_weekend & (hour >= 8) & (hour <= 18)] = _zone_code("business")
+    user_zone[user_type == USER_TYPES.index(UserType.TOURIST.value)] = _zone_code("touristic")
+
+    incident_lat, incident_lon = _random_locations_in_zones(rng, incident_zone)
+    user_lat, user_lon = _random_locations_in_zones(rng, user_zone)
+    distance = haversine_km(user_lat, user_lon, incident_lat, incident_lon)
+    urgency = urgency_score(distance, days_since)
+
+    # Scores de ButterflyMock ; le score social ne sert qu'aux vols et agressions
+    geo = np.maximum(0, 1 - distance / 10)
+    gravity = 1 - days_since / 90
+    social = np.zeros(n_rows)
+    needs_social = (incident_type == code[IncidentType.VOL]) | (incident_type == code[IncidentType.AGRESSION])
+    social[needs_social] = SOCIAL_MODELS[social_model](rng, num_friends[needs_social])
+
+    return {
+        "distance_km": distance,
+        "days_since_incident": days_since.astype(np.int16),
+        "hour_of_day": hour.astype(np.int8),
+        "user_engagement_rate": engagement,
+        "user_num_friends": num_friends.astype(np.int16),
+        "user_connections": connections.astype(np.int16),
+        "urgency_score": urgency,
+        "user_type": user_type.astype(np.int8),
+        "incident_type": incident_type.astype(np.int8),
+        "day_of_week": day_of_week.astype(np.int8),
+        "is_weekend": is_weekend.astype(np.int8),
+        "incident_zone_type": incident_zone.astype(np.int8),
+        "is_useful": Oracle.decide_if_useful_batch(incident_type, urgency, geo, social, gravity),
+    }
+
+def decode_columns(schema, columns):
+    """
+    Colonnes de generate_columns telles que les reçoit le modèle en production : catégorielles
+    décodées en valeurs brutes ("Tourist", "Vol", ...), étiquette retirée.
+    :return: ({colonne: tableau}, étiquettes ou None)
+    """
+    decoded, labels = {}, None
+    for column in schema:
+        values = columns[column["name"]]
+        if column["kind"] == "label":
+            labels = np.asarray(values, dtype=np.int8)
+        elif column["kind"] == "categorical":
+            decoded[column["name"]] = np.asarray(column["categories"], dtype=object)[values]
+        else:
+            decoded[column["name"]] = np.asarray(values)
+    return decoded, labels
+
+def _generate_shard(task):
+    return generate_columns(*task)
+
+def iter_shards(n_rows, shard_size=Config.SHARD_SIZE, workers=Config.WORKERS, seed=Config.SEED, reference_time=None,
+                social_model=Config.SOCIAL_MODEL):
+    """
+    Génère n_rows lignes par blocs de shard_size, dans l'ordre, répartis sur un pool de processus.
+    Au plus 2 blocs par processus sont en vol : la mémoire ne dépend pas de n_rows.
+    """
+    reference_time = reference_time or datetime.now()
+    sizes = [min(shard_size, n_rows - start) for start in range(0, n_rows, shard_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = iter([(size, shard_seed, reference_time, social_model) for size, shard_seed in zip(sizes, seeds)])
+
+    if workers <= 1 or len(sizes) <= 1:
+        for task in tasks:
+            yield _generate_shard(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(_generate_shard, task) for task in islice(tasks, 2 * workers))
+        while pending:
+            columns = pending.popleft().result()
+            task = next(tasks, None) # une nouvelle tâche pour chaque bloc consommé
+            if task is not None:
+                pending.append(pool.submit(_generate_shard, task))
+            yield columns
+
+# --- 5. GÉNÉRATEUR DE DATASET ---
 
 class DatasetGenerator:
     """Génère le dataset complet et le fichier de configuration des caractéristiques."""
@@ -163,26 +392,68 @@ class DatasetGenerator:
         }
 
     def _calculate_distance_km(self, loc1, loc2):
-        R = 6371
-        lat1, lon1 = math.radians(loc1['lat']), math.radians(loc1['lon'])
-        lat2, lon2 = math.radians(loc2['lat']), math.radians(loc2['lon'])
-        dlon, dlat = lon2 - lon1, lat2 - lat1
-        a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-
-    def generate(self):
-        """Méthode principale pour générer tous les fichiers."""
-        all_data = []
-        print("Génération des lignes de données...")
-        for _ in tqdm(range(self.config.DATASET_SIZE)):
-            all_data.append(self._generate_single_row())
+        return float(haversine_km(loc1['lat'], loc1['lon'], loc2['lat'], loc2['lon']))
+
+    def output_path(self, fmt=None):
+        fmt = fmt or self.config.OUTPUT_FORMAT
+        filename = {
+            "csv": self.config.CSV_FILENAME,
+            "npy": self.config.NPY_DIRNAME,
+            "parquet": self.config.PARQUET_FILENAME,
+        }[fmt]
+        return self.config.OUTPUT_DIR / filename
+
+    def schema(self):
+        """Colonnes produites par generate_columns, dans l'ordre du CSV historique (voir dataset_io.py)."""
+        dtypes = {
+            "distance_km": "float64", "days_since_incident": "int16", "hour_of_day": "int8",
+            "user_engagement_rate": "float64", "user_num_friends": "int16", "user_connections": "int16",
+            "urgency_score": "float64",
+        }
+        schema = [{"name": feat, "dtype": dtypes[feat], "kind": "numerical"} for feat in self.numerical_features]
+        for cat, values in self.categorical_features.items():
+            if cat == "is_weekend": # Déjà binaire
+                schema.append({"name": cat, "dtype": "int8", "kind": "binary"})
+            else:
+                schema.append({"name": cat, "dtype": "int8", "kind": "categorical", "categories": values})
+        schema.append({"name": "is_useful", "dtype": "int8", "kind": "label"})
+        return schema
+
+    def generate(self, workers=None, seed=None, fmt=None):
+        """
+        Méthode principale pour générer tous les fichiers (moteur vectorisé).
+        Chaque bloc de SHARD_SIZE lignes est écrit dès qu'il est produit.
+        """
+        fmt = fmt or self.config.OUTPUT_FORMAT
+        n_rows = self.config.DATASET_SIZE
+        n_shards = -(-n_rows // self.config.SHARD_SIZE)
+        output_path = self.output_path(fmt)
+        print(f"Génération des lignes de données (format {fmt})...")
+
+        with open_writer(fmt, output_path, self.schema(), n_rows) as writer:
+            shards = iter_shards(
+                n_rows, self.config.SHARD_SIZE,
+                workers=self.config.WORKERS if workers is None else workers,
+                seed=self.config.SEED if seed is None else seed,
+                reference_time=self.config.REFERENCE_TIME,
+                social_model=self.config.SOCIAL_MODEL,
+            )
+            for columns in tqdm(shards, total=n_shards, unit="bloc"):
+                writer.write(columns)
 
-        self._write_csv(all_data)
         self._save_feature_config()
         print("\nTerminé !")
-        print(f"-> Fichier de données '{self.config.CSV_FILENAME}' créé.")
+        print(f"-> Données '{output_path.name}' créées.")
         print(f"-> Fichier de configuration '{self.config.CONFIG_FILENAME}' créé.")
+        if resource is not None:
+            print(f"-> Pic mémoire du processus : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} Mo")
+
+    def generate_legacy(self):
+        """Ancien chemin, une ligne à la fois (référence pour compare_with_legacy)."""
+        all_data = []
+        for _ in tqdm(range(self.config.DATASET_SIZE)):
+            all_data.append(self._generate_single_row())
+        return all_data
 
     def _generate_single_row(self):
         user = User()
@@ -192,7 +463,7 @@ class DatasetGenerator:
             user.get_current_location(incident.hour_of_day, incident.is_weekend),
             incident.location
         )
-        urgency = (1 / (distance + 0.1)) * (1 / (incident.days_since + 1))
+        urgency = urgency_score(distance, incident.days_since)
 
         geo, social, _, gravity = butterfly.get_feature_vector(user, incident, distance)
         is_useful = Oracle.decide_if_useful(incident, urgency, geo, social, gravity)
@@ -215,35 +486,6 @@ class DatasetGenerator:
         }
         return row
 
-    def _write_csv(self, data):
-        """Écrit les données dans un fichier CSV avec One-Hot Encoding."""
-        header = self.numerical_features[:]
-        for cat, values in self.categorical_features.items():
-            if cat == "is_weekend": # Déjà binaire
-                 header.append(cat)
-            else:
-                 header.extend([f"{cat}_{val}" for val in values])
-        header.append("is_useful")
-
-        filepath = self.config.OUTPUT_DIR / self.config.CSV_FILENAME
-        with open(filepath, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(header)
-
-            for row_dict in tqdm(data, desc="Écriture du CSV"):
-                row_list = [row_dict.get(feat) for feat in self.numerical_features]
-                
-                for cat, values in self.categorical_features.items():
-                    if cat == "is_weekend":
-                        row_list.append(row_dict.get(cat))
-                    else:
-                        for val in values:
-                            is_present = 1 if row_dict.get(cat) == val else 0
-                            row_list.append(is_present)
-                
-                row_list.append(row_dict.get("is_useful"))
-                writer.writerow(row_list)
-
     def _save_feature_config(self):
         """Sauvegarde la configuration des colonnes pour le script d'entraînement."""
         config_data = {
@@ -258,8 +500,51 @@ class DatasetGenerator:
         with open(filepath, 'w') as f:
             json.dump(config_data, f, indent=4)
 
-# --- 5. EXÉCUTION ---
-if __name__ == "__main__":
+def compare_with_legacy(n_rows, seed=Config.SEED):
+    """Taux de lignes utiles par type d'incident : ancien générateur contre moteur vectorisé (par score social)."""
     config = Config()
-    generator = DatasetGenerator(config)
-    generator.generate()
+    config.DATASET_SIZE = n_rows
+    legacy = DatasetGenerator(config).generate_legacy()
+    vectorized = {}
+    for social_model in SOCIAL_MODELS:
+        labels, types = [], []
+        for columns in iter_shards(n_rows, seed=seed, social_model=social_model):
+            labels.append(columns["is_useful"])
+            types.append(columns["incident_type"])
+        vectorized[social_model] = (np.concatenate(labels), np.concatenate(types))
+
+    print(f"\n{'Type':<14}{'ancien':>10}" + "".join(f"{name:>12}" for name in vectorized))
+    for code, incident_type in enumerate(INCIDENT_TYPES):
+        old_labels = [row["is_useful"] for row in legacy if row["incident_type"] == incident_type]
+        rates = "".join(f"{labels[types == code].mean():>12.3f}" for labels, types in vectorized.values())
+        print(f"{incident_type:<14}{np.mean(old_labels):>10.3f}{rates}")
+    rates = "".join(f"{labels.mean():>12.3f}" for labels, _ in vectorized.values())
+    print(f"{'Total':<14}{np.mean([row['is_useful'] for row in legacy]):>10.3f}{rates}")
+
+# --- 6. EXÉCUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génération du jeu de données expert")
+    parser.add_argument("--rows", type=int, default=Config.DATASET_SIZE)
+    parser.add_argument("--workers", type=int, default=Config.WORKERS, help="Processus du pool (1 : sans pool)")
+    parser.add_argument("--shard-size", type=int, default=Config.SHARD_SIZE)
+    parser.add_argument("--seed", type=int, default=Config.SEED)
+    parser.add_argument("--format", choices=FORMATS, default=Config.OUTPUT_FORMAT)
+    parser.add_argument("--social-model", choices=sorted(SOCIAL_MODELS), default=Config.SOCIAL_MODEL,
+                        help="Score social : loi analytique ou listes d'amis tirées (social_graph.py)")
+    parser.add_argument("--reference-time", type=datetime.fromisoformat,
+                        help="'Maintenant' des incidents (ISO 8601), pour un jeu de données reproductible")
+    parser.add_argument("--compare-legacy", type=int, metavar="N",
+                        help="Compare les taux de labels de N lignes avec l'ancien générateur, sans rien écrire")
+    args = parser.parse_args()
+
+    print("Démarrage de la génération du jeu de données v2 (Expert)...")
+    if args.compare_legacy:
+        compare_with_legacy(args.compare_legacy, args.seed)
+    else:
+        config = Config()
+        config.DATASET_SIZE = args.rows
+        config.SHARD_SIZE = args.shard_size
+        config.REFERENCE_TIME = args.reference_time
+        config.SOCIAL_MODEL = args.social_model
+        generator = DatasetGenerator(config)
+        generator.generate(workers=args.workers, seed=args.seed, fmt=args.format)
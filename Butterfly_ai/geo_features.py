@@ -0,0 +1,131 @@
+# geo_features.py
+# Distances et score d'urgence vectorisés, partagés par generate_dataset.py,
+# butterfly_fanout.py, spatial_index.py et les exemples de butterfly.py
+#
+# pairwise_features() calcule distance_km et urgency_score pour N utilisateurs x M
+# incidents en un appel, bloc par bloc (mémoire bornée), en float32 par défaut.
+# Le client web (client/src/lib/heatmap.ts, calculateDistance) garde sa version
+# TypeScript : même formule haversine, même rayon terrestre.
+
+import numpy as np
+
+# --- 1. CONFIGURATION ---
+
+EARTH_RADIUS_KM = 6371.0
+
+# Décalage de la distance dans le score d'urgence (évite la division par zéro à 0 km)
+URGENCY_DISTANCE_OFFSET_KM = 0.1
+
+# Paires calculées par bloc : les temporaires float64 d'un bloc (512 Ko) restent en cache,
+# 1.3x plus rapide que des blocs de 16 Mo
+DEFAULT_CHUNK_ELEMENTS = 1 << 16
+
+METHODS = ("haversine", "equirectangular")
+
+# --- 2. NOYAUX ÉLÉMENT PAR ÉLÉMENT ---
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance haversine (km) élément par élément, avec diffusion NumPy (scalaires acceptés)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def equirectangular_km(lat1, lon1, lat2, lon2):
+    """
+    Approximation plane à la latitude moyenne : R * sqrt((Δλ cos φm)² + Δφ²), sans sinus.
+    Écart relatif à haversine_km (mesuré sur 2M de paires aléatoires, |latitude| <= 60°) :
+    < 1e-5 (< 0.5 m) jusqu'à 50 km, < 4e-5 (< 4 m) jusqu'à 100 km ; l'écart croît comme
+    le carré de la distance. Δλ n'est pas ramené dans [-180°, 180°] : pas d'antiméridien.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    return EARTH_RADIUS_KM * np.hypot((lon2 - lon1) * np.cos((lat1 + lat2) / 2), lat2 - lat1)
+
+def urgency_score(distance_km, days_since_incident):
+    """Score d'urgence du jeu de données et du modèle : proche et récent -> élevé."""
+    return (1 / (distance_km + URGENCY_DISTANCE_OFFSET_KM)) * (1 / (days_since_incident + 1))
+
+# --- 3. MATRICES UTILISATEURS x INCIDENTS ---
+
+def unit_vectors(lat, lon):
+    """(x, y, z) sur la sphère unité : angle entre deux points = arccos du produit scalaire."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)
+
+def _half_angles(lat, lon):
+    lat = np.radians(lat)
+    return np.cos(lat / 2), np.sin(lat / 2), lat, np.radians(lon)
+
+def _check_method(method):
+    if method not in METHODS:
+        raise ValueError(f"Méthode inconnue '{method}', attendu l'une de {METHODS}")
+
+def _blocks(n_rows, n_cols, chunk_elements):
+    step = max(1, chunk_elements // max(n_cols, 1))
+    for start in range(0, n_rows, step):
+        yield slice(start, min(start + step, n_rows))
+
+def _distance_block(users, incidents, rows, method):
+    """Distances (float64) du bloc de lignes 'rows' contre tous les incidents ; opérations en place."""
+    if method == "haversine":
+        # Corde entre vecteurs unitaires : a = corde² / 4, la même quantité que dans haversine,
+        # sans sinus ni cosinus par paire
+        chord2 = np.subtract(users[0][rows, None], incidents[0])
+        chord2 *= chord2
+        diff = np.empty_like(chord2)
+        for u, v in zip(users[1:], incidents[1:]):
+            np.subtract(u[rows, None], v, out=diff)
+            diff *= diff
+            chord2 += diff
+        np.sqrt(chord2, out=chord2)
+        chord2 *= 0.5
+        np.minimum(chord2, 1.0, out=chord2)
+        np.arcsin(chord2, out=chord2)
+        chord2 *= 2 * EARTH_RADIUS_KM
+        return chord2
+    (cos_u, sin_u, lat_u, lon_u), (cos_v, sin_v, lat_v, lon_v) = users, incidents
+    # cos((φ1 + φ2) / 2) = cos(φ1/2) cos(φ2/2) - sin(φ1/2) sin(φ2/2)
+    x = np.multiply(cos_u[rows, None], cos_v)
+    y = np.multiply(sin_u[rows, None], sin_v)
+    x -= y
+    x *= np.subtract(lon_v, lon_u[rows, None], out=y)
+    x *= x
+    np.subtract(lat_v, lat_u[rows, None], out=y)
+    y *= y
+    x += y
+    np.sqrt(x, out=x)
+    x *= EARTH_RADIUS_KM
+    return x
+
+def pairwise_features(user_lat, user_lon, incident_lat, incident_lon, days_since_incident=None,
+                      method="haversine", dtype=np.float32, chunk_elements=DEFAULT_CHUNK_ELEMENTS):
+    """
+    distance_km (et urgency_score) pour chaque paire (utilisateur, incident).
+
+    :param days_since_incident: Un âge par incident (ou un scalaire) ; None : distances seules.
+    :param method: "haversine" (exact) ou "equirectangular" (voir equirectangular_km pour l'erreur).
+    :param dtype: Type des matrices retournées ; les calculs se font en float64 par bloc.
+    :param chunk_elements: Paires calculées à la fois (borne la mémoire des temporaires).
+    :return: Matrice distance (N, M), ou (distance, urgence) si days_since_incident est donné.
+    """
+    _check_method(method)
+    user_lat, user_lon = np.asarray(user_lat, dtype=np.float64).reshape(-1), np.asarray(user_lon, dtype=np.float64).reshape(-1)
+    incident_lat = np.asarray(incident_lat, dtype=np.float64).reshape(-1)
+    incident_lon = np.asarray(incident_lon, dtype=np.float64).reshape(-1)
+    prepare = unit_vectors if method == "haversine" else _half_angles
+    users, incidents = prepare(user_lat, user_lon), prepare(incident_lat, incident_lon)
+
+    distance = np.empty((len(user_lat), len(incident_lat)), dtype=dtype)
+    urgency = None
+    if days_since_incident is not None:
+        age_factor = 1 / (np.broadcast_to(np.asarray(days_since_incident, dtype=np.float64), incident_lat.shape) + 1)
+        urgency = np.empty_like(distance)
+
+    for rows in _blocks(len(user_lat), len(incident_lat), chunk_elements):
+        block = _distance_block(users, incidents, rows, method)
+        distance[rows] = block
+        if urgency is not None:
+            block += URGENCY_DISTANCE_OFFSET_KM
+            np.divide(age_factor, block, out=block)
+            urgency[rows] = block
+    return distance if urgency is None else (distance, urgency)
@@ -0,0 +1,353 @@
+# hyperparameter_search.py
+# Recherche d'hyperparamètres du modèle expert : essais en parallèle et élagage par
+# "successive halving"
+#
+# Exemples :
+#   python hyperparameter_search.py lisbon_expert_data_npy --trials 27 --eta 3
+#   python hyperparameter_search.py lisbon_expert_data_npy --threads-per-trial 2 --max-rows 2000000
+#
+# 1. Préparation (une fois) : les dossiers .npy (generate_dataset.py --format npy) sont mis à
+#    l'échelle et encodés en One-Hot dans search_runs/data/*.npy, lus ensuite en memmap par
+#    tous les essais : une seule copie du jeu de données, partagée via le cache disque.
+# 2. Successive halving : tous les essais s'entraînent MIN_EPOCHS époques ; le meilleur tiers
+#    (1/eta) selon l'AUC de validation continue pour eta fois plus d'époques, en reprenant son
+#    modèle sauvegardé, et ainsi de suite jusqu'au dernier palier.
+# 3. Chaque évaluation journalise (trials.jsonl) l'AUC de validation, la latence d'une
+#    prédiction d'une ligne, le débit par lot et la taille du modèle ; le rapport final donne
+#    la frontière de Pareto AUC / latence / taille.
+#
+# Les essais tournent dans un pool de processus "spawn" ; chaque processus limite TensorFlow
+# à --threads-per-trial threads (TensorFlow n'est importé qu'après ce réglage).
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+# --- 1. CONFIGURATION ---
+
+class Config:
+    OUTPUT_DIR = Path("search_runs")
+    TRIALS = 27
+    ETA = 3 # Facteur de réduction entre deux paliers
+    MIN_EPOCHS = 1 # Époques du premier palier
+    THREADS_PER_TRIAL = 1
+    SEED = 42
+    LATENCY_CALLS = 200 # Prédictions d'une ligne mesurées par évaluation
+    THROUGHPUT_ROWS = 4096
+
+# Espace de recherche ; le premier essai reprend toujours la configuration de référence
+SEARCH_SPACE = {
+    "units": [(128, 64, 32), (64, 32), (64, 32, 16), (32, 16), (256, 128, 64), (128, 64)],
+    "dropout": [0.0, 0.2, 0.4, 0.5], # sur toutes les couches cachées sauf la dernière
+    "batch_size": [64, 256, 1024],
+    "learning_rate": (1e-4, 3e-3), # tirage log-uniforme
+}
+
+def sample_configs(n_trials, seed=Config.SEED):
+    """Configurations tirées au hasard dans SEARCH_SPACE, la référence en premier."""
+    from expert_model import DEFAULT_BATCH_SIZE, DEFAULT_DROPOUT, DEFAULT_LEARNING_RATE, DEFAULT_UNITS
+
+    rng = np.random.default_rng(seed)
+    configs = [{"units": list(DEFAULT_UNITS), "dropout": list(DEFAULT_DROPOUT),
+                "batch_size": DEFAULT_BATCH_SIZE, "learning_rate": DEFAULT_LEARNING_RATE}]
+    low, high = SEARCH_SPACE["learning_rate"]
+    while len(configs) < n_trials:
+        units = SEARCH_SPACE["units"][rng.integers(len(SEARCH_SPACE["units"]))]
+        rate = float(rng.choice(SEARCH_SPACE["dropout"]))
+        configs.append({
+            "units": list(units),
+            "dropout": [rate] * (len(units) - 1) + [0.0],
+            "batch_size": int(rng.choice(SEARCH_SPACE["batch_size"])),
+            "learning_rate": float(np.exp(rng.uniform(np.log(low), np.log(high)))),
+        })
+    return configs[:n_trials]
+
+# --- 2. JEU DE DONNÉES PARTAGÉ ---
+
+def prepare_dataset(directories, data_dir, max_rows=None, seed=Config.SEED):
+    """
+    Encode les blocs d'entraînement et de validation de train_streaming.split_blocks en
+    matrices float32 prêtes à l'emploi (X_train.npy, y_train.npy, X_val.npy, y_val.npy),
+    écrites bloc par bloc et mélangées (ordre des blocs et lignes dans chaque bloc).
+    Les blocs de test ne sont pas utilisés par la recherche.
+    """
+    from numpy.lib.format import open_memmap
+    from train_streaming import fit_streaming_scaler, model_columns, open_shards, split_blocks
+
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    schema, shards = open_shards(directories)
+    blocks = split_blocks(shards, seed=seed)
+    scaler, class_weights, _ = fit_streaming_scaler(schema, shards, blocks["train"])
+    columns = model_columns(schema)
+    rng = np.random.default_rng(seed)
+
+    for split in ("train", "val"):
+        parts = [blocks[split][i] for i in rng.permutation(len(blocks[split]))]
+        if max_rows:
+            budget = max_rows if split == "train" else max(1, max_rows // 4)
+            kept, total = [], 0
+            for shard, start, stop in parts:
+                if total >= budget:
+                    break
+                stop = min(stop, start + budget - total)
+                kept.append((shard, start, stop))
+                total += stop - start
+            parts = kept
+        n_rows = sum(stop - start for _, start, stop in parts)
+        X = open_memmap(data_dir / f"X_{split}.npy", mode="w+", dtype=np.float32, shape=(n_rows, len(columns)))
+        y = open_memmap(data_dir / f"y_{split}.npy", mode="w+", dtype=np.float32, shape=(n_rows,))
+        offset = 0
+        for shard, start, stop in parts:
+            block_X, block_y = _encode_block(schema, shards[shard], start, stop, scaler)
+            order = rng.permutation(stop - start)
+            X[offset:offset + len(order)] = block_X[order]
+            y[offset:offset + len(order)] = block_y[order]
+            offset += len(order)
+        X.flush()
+        y.flush()
+        del X, y
+
+    with open(data_dir / "meta.json", 'w') as f:
+        json.dump({"columns": columns, "class_weights": class_weights, "directories": [str(d) for d in directories],
+                   "max_rows": max_rows, "seed": seed}, f, indent=4)
+    return data_dir
+
+def _encode_block(schema, columns, start, stop, scaler):
+    """Même encodage que train_streaming.make_dataset, en NumPy."""
+    numerical = [column["name"] for column in schema if column["kind"] == "numerical"]
+    parts = [(np.column_stack([columns[name][start:stop] for name in numerical]) - scaler.mean_) / scaler.scale_]
+    label = None
+    for column in schema:
+        values = columns[column["name"]][start:stop]
+        if column["kind"] == "categorical":
+            parts.append(np.eye(len(column["categories"]), dtype=np.float32)[values])
+        elif column["kind"] == "binary":
+            parts.append(values[:, None])
+        elif column["kind"] == "label":
+            label = values
+    return np.hstack(parts).astype(np.float32), label.astype(np.float32)
+
+# --- 3. ESSAI (DANS UN PROCESSUS DU POOL) ---
+
+def _limit_threads(threads):
+    """Initialiseur du pool : à appeler avant tout import de TensorFlow dans le processus."""
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                 "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[name] = str(threads)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _batches(X, y, batch_size, seed, shuffle=True):
+    """tf.data sur les memmap : chaque lot est une tranche contiguë (lignes déjà mélangées)."""
+    import tensorflow as tf
+
+    n_batches = math.ceil(len(X) / batch_size)
+
+    def get_batch(i):
+        return X[i * batch_size:(i + 1) * batch_size], y[i * batch_size:(i + 1) * batch_size]
+
+    dataset = tf.data.Dataset.range(n_batches)
+    if shuffle:
+        dataset = dataset.shuffle(n_batches, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(
+        lambda i: tuple(tf.numpy_function(get_batch, [i], [tf.float32, tf.float32])),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    dataset = dataset.map(lambda a, b: (tf.ensure_shape(a, [None, X.shape[1]]), tf.ensure_shape(b, [None])))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def run_trial(task):
+    """
+    Entraîne un essai jusqu'à task["epochs"] époques (en reprenant son modèle s'il existe),
+    puis mesure l'AUC de validation, la latence, le débit et la taille.
+    """
+    import tensorflow as tf
+    from sklearn.metrics import roc_auc_score
+    from expert_model import build_expert_model
+
+    trial_dir = Path(task["trial_dir"])
+    trial_dir.mkdir(parents=True, exist_ok=True)
+    model_path = trial_dir / "model.keras"
+    data_dir = Path(task["data_dir"])
+    with open(data_dir / "meta.json") as f:
+        meta = json.load(f)
+    X_train = np.load(data_dir / "X_train.npy", mmap_mode="r")
+    y_train = np.load(data_dir / "y_train.npy", mmap_mode="r")
+    X_val = np.load(data_dir / "X_val.npy", mmap_mode="r")
+    y_val = np.load(data_dir / "y_val.npy", mmap_mode="r")
+    params = task["params"]
+
+    tf.keras.utils.set_random_seed(task["seed"])
+    if task["initial_epoch"] > 0:
+        model = tf.keras.models.load_model(model_path)
+    else:
+        model = build_expert_model(X_train.shape[1], params["learning_rate"], params["units"], params["dropout"])
+
+    start = time.perf_counter()
+    model.fit(
+        _batches(X_train, y_train, params["batch_size"], task["seed"]),
+        epochs=task["epochs"],
+        initial_epoch=task["initial_epoch"],
+        shuffle=False, # l'ordre des lots est déjà mélangé par _batches
+        class_weight={int(k): v for k, v in meta["class_weights"].items()},
+        verbose=0,
+    )
+    train_s = time.perf_counter() - start
+    model.save(model_path)
+
+    probabilities = np.concatenate([
+        model.predict_on_batch(X_val[i:i + Config.THROUGHPUT_ROWS]).ravel()
+        for i in range(0, len(X_val), Config.THROUGHPUT_ROWS)
+    ])
+
+    # Latence : prédiction d'une ligne, comme butterfly.predict_incident (moteur keras)
+    row = np.array(X_val[:1])
+    model.predict_on_batch(row)
+    timings = []
+    for _ in range(Config.LATENCY_CALLS):
+        t = time.perf_counter()
+        model.predict_on_batch(row)
+        timings.append(time.perf_counter() - t)
+    batch = np.array(X_val[:Config.THROUGHPUT_ROWS])
+    t = time.perf_counter()
+    model.predict_on_batch(batch)
+    batch_s = time.perf_counter() - t
+
+    return {
+        "trial": task["trial"],
+        "rung": task["rung"],
+        "epochs": task["epochs"],
+        "params": params,
+        "val_auc": float(roc_auc_score(y_val, probabilities)),
+        "latency_p50_ms": float(np.percentile(timings, 50) * 1e3),
+        "latency_p95_ms": float(np.percentile(timings, 95) * 1e3),
+        "throughput_rows_per_s": len(batch) / batch_s,
+        "n_params": int(model.count_params()),
+        "model_bytes": model_path.stat().st_size,
+        "train_s": train_s,
+        "pid": os.getpid(),
+    }
+
+# --- 4. SUCCESSIVE HALVING ---
+
+def rung_epochs(n_trials, eta=Config.ETA, min_epochs=Config.MIN_EPOCHS):
+    """Époques cumulées de chaque palier : min_epochs * eta^k, tant qu'il reste plus d'un essai."""
+    n_rungs = int(math.floor(math.log(n_trials, eta) + 1e-9)) + 1 if n_trials > 1 else 1
+    return [min_epochs * eta ** k for k in range(n_rungs)]
+
+def successive_halving(configs, data_dir, output_dir, eta=Config.ETA, min_epochs=Config.MIN_EPOCHS,
+                       workers=1, threads_per_trial=Config.THREADS_PER_TRIAL, seed=Config.SEED):
+    """Exécute tous les paliers ; retourne la liste de toutes les évaluations (une par essai et palier)."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_path = output_dir / "trials.jsonl"
+    results = []
+    alive = list(range(len(configs)))
+    previous_epochs = 0
+    schedule = rung_epochs(len(configs), eta, min_epochs)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                             initializer=_limit_threads, initargs=(threads_per_trial,)) as pool, \
+            open(log_path, 'a') as log:
+        for rung, epochs in enumerate(schedule):
+            print(f"\nPalier {rung} : {len(alive)} essai(s), {epochs} époque(s) cumulée(s)")
+            tasks = [{
+                "trial": trial, "rung": rung, "params": configs[trial], "epochs": epochs,
+                "initial_epoch": previous_epochs, "seed": seed + trial,
+                "data_dir": str(data_dir), "trial_dir": str(output_dir / "trials" / f"{trial:03d}"),
+            } for trial in alive]
+            rung_results = []
+            for result in pool.map(run_trial, tasks):
+                rung_results.append(result)
+                log.write(json.dumps(result) + "\n")
+                log.flush()
+                print(f"  essai {result['trial']:>3} : AUC {result['val_auc']:.5f}, "
+                      f"latence {result['latency_p50_ms']:.2f} ms, {result['n_params']:,} paramètres "
+                      f"({result['train_s']:.0f}s) {result['params']}")
+            results.extend(rung_results)
+
+            if rung == len(schedule) - 1:
+                break
+            keep = max(1, len(alive) // eta)
+            ranked = sorted(rung_results, key=lambda r: r["val_auc"], reverse=True)
+            alive = sorted(r["trial"] for r in ranked[:keep])
+            previous_epochs = epochs
+    return results
+
+# --- 5. FRONTIÈRE DE PARETO ---
+
+def pareto_front(results, objectives=(("val_auc", max), ("latency_p50_ms", min), ("model_bytes", min))):
+    """Évaluations qu'aucune autre ne domine (au moins aussi bonne partout, meilleure quelque part)."""
+    def at_least_as_good(a, b):
+        return all((a[key] >= b[key]) if better is max else (a[key] <= b[key]) for key, better in objectives)
+
+    return [
+        candidate for candidate in results
+        if not any(at_least_as_good(other, candidate) and other is not candidate
+                   and any(other[key] != candidate[key] for key, _ in objectives) for other in results)
+    ]
+
+def report(results, output_dir):
+    """Frontière calculée sur le dernier palier atteint par chaque essai, écrite dans report.json."""
+    latest = {}
+    for result in results:
+        if result["trial"] not in latest or result["rung"] > latest[result["trial"]]["rung"]:
+            latest[result["trial"]] = result
+    final_rung = max(result["rung"] for result in results)
+    finalists = [result for result in latest.values() if result["rung"] == final_rung]
+    front = sorted(pareto_front(finalists), key=lambda r: r["latency_p50_ms"])
+
+    print(f"\nFrontière AUC / latence / taille (palier {final_rung}, {finalists[0]['epochs']} époques) :")
+    print(f"{'essai':>6}{'AUC val':>10}{'latence ms':>12}{'lignes/s':>12}{'params':>10}{'Ko':>8}  paramètres")
+    for r in front:
+        print(f"{r['trial']:>6}{r['val_auc']:>10.5f}{r['latency_p50_ms']:>12.2f}{r['throughput_rows_per_s']:>12,.0f}"
+              f"{r['n_params']:>10,}{r['model_bytes'] / 1024:>8.0f}  {r['params']}")
+
+    summary = {"final_rung": final_rung, "pareto_front": front,
+               "finalists": sorted(finalists, key=lambda r: r["val_auc"], reverse=True),
+               "all_trials": sorted(latest.values(), key=lambda r: (-r["rung"], -r["val_auc"]))}
+    with open(Path(output_dir) / "report.json", 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"\n-> Rapport : {Path(output_dir) / 'report.json'}, journal : {Path(output_dir) / 'trials.jsonl'}")
+    return summary
+
+# --- 6. EXÉCUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recherche d'hyperparamètres du modèle expert")
+    parser.add_argument("directories", nargs="+", help="Dossiers écrits par generate_dataset.py --format npy")
+    parser.add_argument("--trials", type=int, default=Config.TRIALS)
+    parser.add_argument("--eta", type=int, default=Config.ETA)
+    parser.add_argument("--min-epochs", type=int, default=Config.MIN_EPOCHS)
+    parser.add_argument("--threads-per-trial", type=int, default=Config.THREADS_PER_TRIAL)
+    parser.add_argument("--workers", type=int, help="Essais simultanés (par défaut : cœurs / threads par essai)")
+    parser.add_argument("--max-rows", type=int, help="Lignes d'entraînement gardées (validation : un quart)")
+    parser.add_argument("--output-dir", default=str(Config.OUTPUT_DIR))
+    parser.add_argument("--seed", type=int, default=Config.SEED)
+    parser.add_argument("--reuse-data", action="store_true", help="Réutiliser search_runs/data déjà préparé")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    data_dir = output_dir / "data"
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads_per_trial)
+
+    if not (args.reuse_data and (data_dir / "meta.json").exists()):
+        start = time.perf_counter()
+        prepare_dataset(args.directories, data_dir, args.max_rows, args.seed)
+        print(f"Jeu de données préparé dans '{data_dir}' ({time.perf_counter() - start:.1f}s)")
+
+    configs = sample_configs(args.trials, args.seed)
+    print(f"{len(configs)} essais, paliers {rung_epochs(len(configs), args.eta, args.min_epochs)} époques, "
+          f"{workers} processus x {args.threads_per_trial} thread(s)")
+    results = successive_halving(configs, data_dir, output_dir, args.eta, args.min_epochs,
+                                 workers, args.threads_per_trial, args.seed)
+    report(results, output_dir)
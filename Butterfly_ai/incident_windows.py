@@ -0,0 +1,259 @@
+# incident_windows.py
+# Comptes glissants d'incidents (24h / 7 jours / 30 jours) par type x gravité x zone, en mémoire
+#
+# getIncidents(timeFilter) interroge la base à chaque appel du tableau de bord. Ici, les
+# incidents sont comptés dans des tampons circulaires de tranches horaires (7 jours) et
+# journalières (30 jours, UTC) : une fenêtre = la somme de ses tranches, quel que soit le
+# nombre d'incidents. Une case dont la tranche est sortie du tampon est ignorée par les
+# requêtes puis remise à zéro par la première tranche qui la réutilise : l'expiration est
+# automatique, sans tâche de nettoyage.
+#
+# Les fenêtres sont arrondies à la tranche : "24h" = l'heure en cours + les 23 précédentes,
+# "30d" = le jour en cours + les 29 précédents.
+#
+# Signaux de récence pour le modèle Butterfly, sans requête par prédiction :
+#   - recency() : days_since_incident, hour_of_day, day_of_week, is_weekend d'incidents
+#     connus (gardés RETENTION_DAYS jours), calculés comme generate_dataset.py ;
+#   - days_since_last() : jours depuis le dernier incident d'un type / gravité / zone.
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from risk_tiles import (DEFAULT_SEVERITY, DEFAULT_TYPE, INCIDENT_TYPES, SEVERITIES, category_indices,
+                        parse_timestamps, read_incidents)
+
+# --- 1. CONFIGURATION ---
+
+# zoneType du schéma (même ordre que generate_dataset.Config.ZONES) ; défaut du schéma : residential
+ZONE_TYPES = ("touristic", "residential", "business", "suburbs", "nightlife")
+DEFAULT_ZONE = "residential"
+
+HOUR_S = 3600
+DAY_S = 86400
+
+# Fenêtre -> (tampon, nombre de tranches)
+WINDOWS = {"24h": ("hour", 24), "7d": ("hour", 7 * 24), "30d": ("day", 30)}
+
+# Valeurs de timeFilter de getIncidents ("all" : tous les incidents vus depuis le démarrage)
+TIME_FILTERS = {"24h": "24h", "week": "7d", "month": "30d", "all": "all"}
+
+# Durée pendant laquelle la date de chaque incident reste connue de recency()
+RETENTION_DAYS = 30
+
+_SHAPE = (len(INCIDENT_TYPES), len(SEVERITIES), len(ZONE_TYPES))
+_N_CATEGORIES = int(np.prod(_SHAPE))
+_TYPE_INDEX = {name: i for i, name in enumerate(INCIDENT_TYPES)}
+_SEVERITY_INDEX = {name: i for i, name in enumerate(SEVERITIES)}
+_ZONE_INDEX = {name: i for i, name in enumerate(ZONE_TYPES)}
+
+# --- 2. TAMPON CIRCULAIRE ---
+
+class _Ring:
+    """size tranches de width_s secondes ; la case bucket % size contient la tranche buckets[case]."""
+
+    def __init__(self, width_s, size):
+        self.width_s = width_s
+        self.size = size
+        self.counts = np.zeros((size,) + _SHAPE, dtype=np.int64)
+        self.buckets = np.full(size, -1, dtype=np.int64)
+
+    def add(self, stamp, category) -> bool:
+        """Compte un incident ; False s'il tombe dans une tranche déjà expirée."""
+        bucket = int(stamp // self.width_s)
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            if self.buckets[slot] > bucket:
+                return False
+            self.counts[slot] = 0
+            self.buckets[slot] = bucket
+        self.counts[slot][category] += 1
+        return True
+
+    def fit(self, stamps, flat_categories, now):
+        """Recompte les tranches se terminant à now ; les incidents plus anciens ou futurs sont ignorés."""
+        current = int(now // self.width_s)
+        window = np.arange(current - self.size + 1, current + 1)
+        buckets = (stamps // self.width_s).astype(np.int64)
+        kept = (buckets > current - self.size) & (buckets <= current)
+        slots = buckets[kept] % self.size
+        counts = np.bincount(slots * _N_CATEGORIES + flat_categories[kept], minlength=self.size * _N_CATEGORIES)
+        self.counts = counts.reshape(self.counts.shape)
+        self.buckets = np.empty(self.size, dtype=np.int64)
+        self.buckets[window % self.size] = window
+
+    def window(self, now, n_buckets) -> np.ndarray:
+        """Comptes (type, gravité, zone) des n_buckets tranches se terminant à now."""
+        current = int(now // self.width_s)
+        live = (self.buckets > current - n_buckets) & (self.buckets <= current)
+        return self.counts[live].sum(axis=0)
+
+# --- 3. FENÊTRES ---
+
+class IncidentWindows:
+    """
+    Comptes glissants et récence des incidents, alimentés au fil de l'eau par add().
+    Sûr entre threads (un verrou pour les ajouts et les lectures).
+    """
+
+    def __init__(self):
+        self._rings = {"hour": _Ring(HOUR_S, max(n for ring, n in WINDOWS.values() if ring == "hour")),
+                       "day": _Ring(DAY_S, max(n for ring, n in WINDOWS.values() if ring == "day"))}
+        self._totals = np.zeros(_SHAPE, dtype=np.int64)
+        self._last_seen = np.full(_SHAPE, -np.inf)
+        # id -> date (s) des incidents de moins de RETENTION_DAYS jours, et file (date, id) pour les expirer
+        self._stamps = {}
+        self._expiry = deque()
+        self._latest = -np.inf
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Fenêtres vides, ou préchargées depuis l'export d'incidents BUTTERFLY_WINDOWS_EXPORT (CSV ou JSON)."""
+        path = os.environ.get("BUTTERFLY_WINDOWS_EXPORT")
+        windows = cls()
+        if path:
+            frame = read_incidents(path).rename(columns={"zone_type": "zoneType"})
+            zone_types = frame["zoneType"].to_numpy() if "zoneType" in frame else None
+            windows.fit(frame["id"].to_numpy(), frame["type"].to_numpy(), frame["severity"].to_numpy(),
+                        zone_types, frame["createdAt"].to_numpy())
+        return windows
+
+    def __len__(self):
+        return int(self._totals.sum())
+
+    # --- Mises à jour ---
+
+    def fit(self, incident_ids, types, severities, zone_types, timestamps, now=None):
+        """
+        Recompte tous les incidents (export de la base au démarrage).
+        :param zone_types: zoneType de chaque incident, ou None (tous residential).
+        :param now: Fin des fenêtres ; défaut : maintenant. Une date illisible vaut now.
+        """
+        now = time.time() if now is None else float(now)
+        stamps = parse_timestamps(timestamps)
+        stamps = np.where(np.isnan(stamps), now, stamps)
+        zone_types = np.full(len(stamps), DEFAULT_ZONE, dtype=object) if zone_types is None else zone_types
+        categories = np.ravel_multi_index((category_indices(types, INCIDENT_TYPES, DEFAULT_TYPE),
+                                           category_indices(severities, SEVERITIES, DEFAULT_SEVERITY),
+                                           category_indices(zone_types, ZONE_TYPES, DEFAULT_ZONE)), _SHAPE)
+        last_seen = np.full(_N_CATEGORIES, -np.inf)
+        np.maximum.at(last_seen, categories, stamps)
+        recent = np.flatnonzero(stamps >= now - RETENTION_DAYS * DAY_S)
+        recent = recent[np.argsort(stamps[recent], kind="stable")]
+        recent_ids = np.asarray(incident_ids, dtype=object)[recent].tolist()
+        recent_stamps = stamps[recent].tolist()
+
+        with self._lock:
+            for ring in self._rings.values():
+                ring.fit(stamps, categories, now)
+            self._totals = np.bincount(categories, minlength=_N_CATEGORIES).reshape(_SHAPE)
+            self._last_seen = last_seen.reshape(_SHAPE)
+            self._stamps = dict(zip(recent_ids, recent_stamps))
+            self._expiry = deque(zip(recent_stamps, recent_ids))
+            self._latest = max(now, float(stamps.max())) if len(stamps) else now
+        return self
+
+    def add(self, incident_id, incident_type, severity, zone_type=None, timestamp=None) -> bool:
+        """
+        Compte un nouvel incident (à appeler après createIncident).
+        :param timestamp: Date de l'incident (s epoch ou ISO 8601) ; défaut : maintenant. Une date
+            future (horloge du client en avance) est ramenée à maintenant : comptée dans une tranche
+            à venir, elle remettrait à zéro une case encore dans la fenêtre.
+        :return: False si l'id est déjà compté.
+        """
+        now = time.time()
+        stamp = np.nan if timestamp is None else parse_timestamps([timestamp])[0]
+        stamp = now if np.isnan(stamp) else min(float(stamp), now)
+        category = (_TYPE_INDEX.get(incident_type, _TYPE_INDEX[DEFAULT_TYPE]),
+                    _SEVERITY_INDEX.get(severity, _SEVERITY_INDEX[DEFAULT_SEVERITY]),
+                    _ZONE_INDEX.get(zone_type, _ZONE_INDEX[DEFAULT_ZONE]))
+        with self._lock:
+            if incident_id is not None and incident_id in self._stamps:
+                return False
+            for ring in self._rings.values():
+                ring.add(stamp, category)
+            self._totals[category] += 1
+            self._last_seen[category] = max(self._last_seen[category], stamp)
+            self._latest = max(self._latest, stamp)
+            if incident_id is not None and stamp >= self._latest - RETENTION_DAYS * DAY_S:
+                self._stamps[incident_id] = stamp
+                self._expiry.append((stamp, incident_id))
+            self._expire()
+        return True
+
+    def _expire(self):
+        """Oublie la date des incidents de plus de RETENTION_DAYS jours (file presque triée par date)."""
+        horizon = self._latest - RETENTION_DAYS * DAY_S
+        while self._expiry and self._expiry[0][0] < horizon:
+            stamp, incident_id = self._expiry.popleft()
+            if self._stamps.get(incident_id) == stamp:
+                del self._stamps[incident_id]
+
+    # --- Requêtes ---
+
+    def counts(self, window, now=None) -> np.ndarray:
+        """Comptes (type, gravité, zone) d'une fenêtre de WINDOWS, d'une valeur de timeFilter, ou "all"."""
+        window = TIME_FILTERS.get(window, window)
+        with self._lock:
+            if window == "all":
+                return self._totals.copy()
+            if window not in WINDOWS:
+                raise ValueError(f"Fenêtre inconnue '{window}', attendu l'une de {sorted(set(WINDOWS) | set(TIME_FILTERS))}")
+            ring, n_buckets = WINDOWS[window]
+            return self._rings[ring].window(time.time() if now is None else now, n_buckets)
+
+    def query(self, window, now=None, types=None, severities=None, zone_types=None) -> dict:
+        """
+        Comptes d'une fenêtre pour les catégories retenues (défaut : toutes), comme les filtres de getIncidents.
+        :return: {"window", "total", "daysSinceLast", "counts": {type: {gravité: {zone: n}}}}
+        """
+        now = time.time() if now is None else now
+        selected = [list(names) if chosen is None else [name for name in names if name in chosen]
+                    for names, chosen in ((INCIDENT_TYPES, types), (SEVERITIES, severities), (ZONE_TYPES, zone_types))]
+        index = np.ix_(*[[names.index(name) for name in chosen]
+                         for names, chosen in zip((INCIDENT_TYPES, SEVERITIES, ZONE_TYPES), selected)])
+        counts = self.counts(window, now)[index]
+        days = self.days_since_last(now, types, severities, zone_types)
+        return {
+            "window": TIME_FILTERS.get(window, window),
+            "total": int(counts.sum()),
+            "daysSinceLast": None if np.isinf(days) else days,
+            "counts": {incident_type: {severity: dict(zip(selected[2], by_zone))
+                                       for severity, by_zone in zip(selected[1], by_severity)}
+                       for incident_type, by_severity in zip(selected[0], counts.tolist())},
+        }
+
+    def days_since_last(self, now=None, types=None, severities=None, zone_types=None) -> float:
+        """Jours (décimaux) depuis le dernier incident des catégories retenues ; inf si aucun."""
+        masks = [np.isin(names, names if chosen is None else list(chosen))
+                 for names, chosen in ((INCIDENT_TYPES, types), (SEVERITIES, severities), (ZONE_TYPES, zone_types))]
+        with self._lock:
+            last = self._last_seen[np.ix_(*masks)]
+            last = last.max() if last.size else -np.inf
+        return max(0.0, ((time.time() if now is None else now) - last) / DAY_S)
+
+    def recency(self, incident_ids, now=None) -> dict:
+        """
+        Caractéristiques temporelles du modèle pour des incidents connus, comme generate_dataset.py
+        (heure et jour de la semaine en heure locale) ; -1 pour un incident inconnu ou expiré.
+        :return: {"days_since_incident", "hour_of_day", "day_of_week", "is_weekend"} en tableaux int16 / int8.
+        """
+        now = datetime.fromtimestamp(time.time() if now is None else now)
+        with self._lock:
+            stamps = [self._stamps.get(incident_id) for incident_id in incident_ids]
+        features = {name: np.full(len(stamps), -1, dtype=dtype) for name, dtype in (
+            ("days_since_incident", np.int16), ("hour_of_day", np.int8), ("day_of_week", np.int8), ("is_weekend", np.int8))}
+        for i, stamp in enumerate(stamps):
+            if stamp is None:
+                continue
+            date = datetime.fromtimestamp(stamp)
+            features["days_since_incident"][i] = max((now - date).days, 0)
+            features["hour_of_day"][i] = date.hour
+            features["day_of_week"][i] = date.weekday()
+            features["is_weekend"][i] = date.weekday() >= 5
+        return features
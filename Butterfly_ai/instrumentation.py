@@ -0,0 +1,248 @@
+# instrumentation.py
+# Mesures du chemin de prédiction : durée de chaque étape, histogrammes, compteurs de
+# décisions, exposés au format texte Prometheus (GET /metrics de ml_server.py)
+#
+# Activé par défaut ; BUTTERFLY_METRICS=0 le désactive. Désactivé, timer() retourne
+# NULL_TIMER dont les méthodes ne font rien (ni horloge, ni verrou) et les autres
+# méthodes de Metrics sortent au premier test. enable() / disable() basculent à chaud.
+#
+# Le profileur par échantillonnage (SamplingProfiler) est indépendant : il se démarre et
+# s'arrête pendant que le serveur tourne (POST /profiler/start, POST /profiler/stop).
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+
+import numpy as np
+
+# --- 1. CONFIGURATION ---
+
+# Étapes mesurées : décodage de la requête, encodage des caractéristiques, scaler (Keras),
+# attente du micro-batcher, appel au modèle, regroupement des zones à risque (/risk_areas),
+# mise à jour ou lecture des tuiles (/tiles) et des fenêtres glissantes (/windows),
+# mise en forme de la réponse
+STAGES = ("decode", "encode", "scale", "queue", "model", "cluster", "tiles", "windows", "post")
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+BATCH_ROWS_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536, 262144)
+
+DEFAULT_PROFILER_INTERVAL_S = 0.005
+PROFILER_MAX_DEPTH = 64
+
+# --- 2. HISTOGRAMMES ET COMPTEURS ---
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Histogram:
+    """Histogramme cumulatif (sémantique Prometheus : bucket le=b compte les valeurs <= b), une série par labels."""
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {} # labels -> [compte par bucket (+Inf en dernier), somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+        for labels, (counts, total, n) in sorted(series.items()):
+            cumulative = np.cumsum(counts)
+            for bound, count in zip(self.buckets + ("+Inf",), cumulative):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {n}")
+        return lines
+
+class Counter:
+    """Compteur monotone, une série par labels."""
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+# --- 3. CHRONOMÈTRE PAR ÉTAPE ---
+
+class StageTimer:
+    """
+    Chronomètre d'une requête : lap(étape) enregistre le temps écoulé depuis le lap
+    précédent, done(point d'entrée) la durée totale.
+    """
+    __slots__ = ("_metrics", "_start", "_last", "stages")
+
+    def __init__(self, metrics):
+        self._metrics = metrics
+        self._start = self._last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        self._metrics.stage_seconds.observe(elapsed, stage)
+
+    def done(self, endpoint):
+        self._metrics.request_seconds.observe(time.perf_counter() - self._start, endpoint)
+
+class _NullTimer:
+    """Chronomètre du mode désactivé : aucune mesure."""
+    __slots__ = ()
+    stages = {}
+
+    def lap(self, stage):
+        pass
+
+    def done(self, endpoint):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+# --- 4. REGISTRE ---
+
+class Metrics:
+    """Mesures d'un processus (les workers d'un pool de processus ont chacun les leurs)."""
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stage_seconds = Histogram("butterfly_stage_seconds", "Durée de chaque étape de prédiction.",
+                                       LATENCY_BUCKETS, ("stage",))
+        self.request_seconds = Histogram("butterfly_request_seconds", "Durée totale par point d'entrée.",
+                                         LATENCY_BUCKETS, ("endpoint",))
+        self.batch_rows = Histogram("butterfly_batch_rows", "Lignes par appel au modèle.",
+                                    BATCH_ROWS_BUCKETS, ("source",))
+        self.decisions = Counter("butterfly_decisions_total", "Prédictions au-dessus / en dessous du seuil.",
+                                 ("decision",))
+        self.errors = Counter("butterfly_errors_total", "Réponses en erreur par point d'entrée et statut.",
+                              ("endpoint", "status"))
+
+    @classmethod
+    def from_env(cls):
+        """Activé sauf si BUTTERFLY_METRICS vaut 0 / false / off."""
+        return cls(enabled=os.environ.get("BUTTERFLY_METRICS", "1").strip().lower() not in ("0", "false", "off"))
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def timer(self):
+        return StageTimer(self) if self.enabled else NULL_TIMER
+
+    def observe_batch(self, source, n_rows):
+        if self.enabled:
+            self.batch_rows.observe(n_rows, source)
+
+    def count_decisions(self, probabilities, threshold):
+        if self.enabled:
+            above = int(np.count_nonzero(np.asarray(probabilities) > threshold))
+            self.decisions.inc("above", amount=above)
+            self.decisions.inc("below", amount=np.size(probabilities) - above)
+
+    def count_error(self, endpoint, status):
+        if self.enabled:
+            self.errors.inc(endpoint, str(status))
+
+    def render(self) -> str:
+        """Toutes les séries au format texte Prometheus (version 0.0.4)."""
+        lines = []
+        for metric in (self.stage_seconds, self.request_seconds, self.batch_rows, self.decisions, self.errors):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Instance partagée par butterfly.py, model_loader.py et ml_server.py
+METRICS = Metrics.from_env()
+
+# --- 5. PROFILEUR PAR ÉCHANTILLONNAGE ---
+
+class SamplingProfiler:
+    """
+    Relève la pile de chaque thread toutes les interval_s (sys._current_frames) depuis un
+    thread dédié ; rien n'est ajouté au chemin de prédiction. Le résultat est au format
+    "pile repliée" (une ligne "f1;f2;f3 nombre"), lu par flamegraph.pl ou speedscope.
+    """
+    def __init__(self, interval_s=DEFAULT_PROFILER_INTERVAL_S, max_depth=PROFILER_MAX_DEPTH):
+        self.interval_s = interval_s
+        self.max_depth = max_depth
+        self.samples = _Tally()
+        self.started_at = None
+        self.stopped_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("Le profileur est déjà démarré")
+        self.samples.clear()
+        self._stop.clear()
+        self.started_at, self.stopped_at = time.time(), None
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.stopped_at = time.time()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
@@ -0,0 +1,135 @@
+# micro_batcher.py
+# Regroupement dynamique des requêtes de prédiction (micro-batching)
+#
+# Les requêtes concurrentes déposent leur ligne de caractéristiques dans une file ;
+# un thread unique les regroupe et appelle le modèle une seule fois par lot, dès que
+# le lot est plein ou que la plus ancienne requête a attendu max_wait_ms.
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# --- 1. CONFIGURATION PAR DÉFAUT ---
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_MAX_QUEUE_SIZE = 1024
+
+class QueueFullError(RuntimeError):
+    """La file d'attente du batcher est pleine : la requête doit être rejetée."""
+
+# --- 2. BATCHER ---
+
+class MicroBatcher:
+    """
+    Regroupe les appels submit() concurrents en lots pour predict_fn.
+
+    :param predict_fn: Fonction (matrice n x d) -> tableau de n probabilités.
+    :param max_batch_size: Taille maximale d'un lot.
+    :param max_wait_ms: Attente maximale de la première requête d'un lot avant envoi.
+    :param max_queue_size: Nombre maximal de requêtes en attente (au-delà : QueueFullError).
+    """
+    def __init__(self, predict_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size doit être >= 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._rejected = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._rows_in_batches = 0
+        self._max_batch_seen = 0
+        self._flush_full = 0
+        self._flush_timeout = 0
+        self._model_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, features) -> Future:
+        """Dépose une ligne de caractéristiques ; le Future reçoit sa probabilité."""
+        future = Future()
+        try:
+            self._queue.put_nowait((np.asarray(features, dtype=np.float32).reshape(-1), future))
+        except queue.Full:
+            with self._stats_lock:
+                self._rejected += 1
+            raise QueueFullError(f"File de prédiction pleine ({self.max_queue_size} requêtes en attente)")
+        with self._stats_lock:
+            self._requests += 1
+        return future
+
+    def predict(self, features, timeout=None) -> float:
+        """Raccourci bloquant : submit() puis attente du résultat."""
+        return self.submit(features).result(timeout=timeout)
+
+    def _collect(self):
+        """Attend une première requête puis complète le lot jusqu'à la taille ou au délai maximal."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def _run(self):
+        while True:
+            batch, full = self._collect()
+            futures = [future for _, future in batch]
+            start = time.perf_counter()
+            try:
+                probabilities = np.asarray(self.predict_fn(np.stack([row for row, _ in batch]))).reshape(-1)
+            except Exception as e:
+                probabilities = None
+                for future in futures:
+                    future.set_exception(e)
+            elapsed = time.perf_counter() - start
+
+            if probabilities is not None:
+                for future, probability in zip(futures, probabilities):
+                    future.set_result(float(probability))
+
+            with self._stats_lock:
+                self._batches += 1
+                if probabilities is None:
+                    self._failed_batches += 1
+                self._rows_in_batches += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                self._model_seconds += elapsed
+                if full:
+                    self._flush_full += 1
+                else:
+                    self._flush_timeout += 1
+
+    # --- 3. MÉTRIQUES ---
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self._queue.qsize(),
+                "requests_total": self._requests,
+                "rejected_total": self._rejected,
+                "batches_total": self._batches,
+                "failed_batches_total": self._failed_batches,
+                "mean_batch_size": self._rows_in_batches / self._batches if self._batches else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "flush_on_full_total": self._flush_full,
+                "flush_on_timeout_total": self._flush_timeout,
+                "model_seconds_total": self._model_seconds,
+            }
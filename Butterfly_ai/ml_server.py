@@ -1,66 +1,481 @@
-from flask import Flask, request, jsonify
-import numpy as np
-import tensorflow as tf
+import json
+import os
+import threading
+
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
+from butterfly_features import FeatureEncodingError
+from incident_windows import ZONE_TYPES, IncidentWindows
+from instrumentation import METRICS, NULL_TIMER, PROMETHEUS_CONTENT_TYPE, SamplingProfiler
+from micro_batcher import MicroBatcher, QueueFullError
+from model_loader import get_artifacts, load_decision_threshold
+from prediction_cache import PredictionCache
+from risk_areas import DEFAULT_CLUSTER_RADIUS_KM, calculate_risk_areas
+from risk_tiles import INCIDENT_TYPES, SEVERITIES, RiskTiles
+from wire_format import BINARY_CONTENT_TYPE, WireFormatError, decode_matrix, encode_probabilities, matrix_rows
+
 app = Flask(__name__)
 CORS(app)  # autorise les requêtes cross-origin
 
-# 📦 Charge le modèle entraîné (ex: butterfly_model.h5 dans le même dossier)
-model = tf.keras.models.load_model("butterfly_model.h5")
-
-# 🧠 Définir l’ordre exact des features attendu par le modèle
-FEATURE_COLUMNS = [
-    "distanceKm",
-    "daysSinceIncident",
-    "hourOfDay",
-    "userEngagementRate",
-    "userNumFriends",
-    "userConnections",
-    "urgencyScore",
-    "dayOfWeek",
-    "isWeekend",  # 0 ou 1
-    # Encodage simple pour userType, incidentType, incidentZoneType (one-hot ou label encoded)
-    "userType_Local", "userType_Tourist",
-    "incidentType_Agression", "incidentType_Vol", "incidentType_Objet Perdu",
-    "incidentZoneType_touristic", "incidentZoneType_business", "incidentZoneType_residential",
-    "incidentZoneType_suburbs", "incidentZoneType_nightlife"
-]
+# 📦 Modèle expert partagé avec butterfly.py (voir model_loader.py), chargé au premier appel.
+# BUTTERFLY_BACKEND=numpy sert le modèle exporté par export_numpy_model.py, sans TensorFlow ;
+# BUTTERFLY_BACKEND=float16|int8|pruned sert une variante produite par optimize_model.py.
+BACKEND = os.environ.get("BUTTERFLY_BACKEND", "keras")
+artifacts = get_artifacts(BACKEND)
+
+def load_model():
+    """Charge les artefacts une seule fois par processus (sûr entre threads)."""
+    return artifacts.load()
+
+def is_model_loaded():
+    return artifacts.is_loaded
+
+def predict_matrix(features):
+    """Probabilités (une par ligne) pour une matrice de caractéristiques brutes déjà encodée."""
+    METRICS.observe_batch("model", len(features))
+    return artifacts.predict_matrix(features, METRICS.timer())
+
+# 🧠 Ordre exact des features attendu par le modèle : celui de expert_model_columns.json.
+# Les requêtes utilisent les mêmes champs que butterfly.predict_incident, en camelCase
+# (distanceKm, userType, incidentZoneType...) ou en snake_case.
+
+def feature_columns():
+    return artifacts.plan.columns
 
 def encode_features(data):
-    # Numériques de base
-    values = [
-        data["distanceKm"],
-        data["daysSinceIncident"],
-        data["hourOfDay"],
-        data["userEngagementRate"],
-        data["userNumFriends"],
-        data["userConnections"],
-        data["urgencyScore"],
-        data["dayOfWeek"],
-        1 if data["isWeekend"] else 0
-    ]
-
-    # Encodages one-hot manuels (adaptés au modèle)
-    def one_hot(value, categories):
-        return [1 if value == cat else 0 for cat in categories]
-
-    # Ajout de features one-hot encodées
-    values += one_hot(data["userType"], ["Local", "Tourist"])
-    values += one_hot(data["incidentType"], ["Agression", "Vol", "Objet Perdu"])
-    values += one_hot(data["incidentZoneType"], ["touristic", "business", "residential", "suburbs", "nightlife"])
-
-    return np.array(values).reshape(1, -1)
+    """Encode un objet JSON en matrice (1, nb_features) ; lève FeatureEncodingError si invalide."""
+    if not isinstance(data, dict):
+        raise FeatureEncodingError("Un objet JSON est attendu")
+    return artifacts.plan.encode_row(data).reshape(1, -1)
+
+def encode_features_batch(rows):
+    """Encode une liste d'objets JSON en une matrice (n, nb_features), colonne par colonne."""
+    return artifacts.plan.encode(rows)
+
+# ⏱️ Micro-batching : les requêtes concurrentes partagent un seul appel au modèle
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 64))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 2.0))
+BATCH_MAX_QUEUE = int(os.environ.get("BATCH_MAX_QUEUE", 1024))
+PREDICT_TIMEOUT_S = float(os.environ.get("PREDICT_TIMEOUT_S", 10.0))
+
+batcher = MicroBatcher(
+    predict_matrix,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue_size=BATCH_MAX_QUEUE,
+)
+
+# 🗃️ Cache optionnel des prédictions sur caractéristiques quantifiées (BUTTERFLY_CACHE_SIZE > 0)
+cache = PredictionCache.from_env(artifacts)
+
+# 📈 Seuil utilisé uniquement pour compter les décisions dans /metrics (la réponse reste la probabilité)
+DECISION_THRESHOLD = load_decision_threshold()
 
 @app.route("/predict", methods=["POST"])
 def predict():
+    # "queue" : attente du micro-batcher + appel au modèle ("scale" / "model" sont mesurés par lot)
+    timer = METRICS.timer()
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) # None (-> 400) si le corps n'est pas du JSON
+        timer.lap("decode")
         features = encode_features(data)
-        prediction = model.predict(features)[0][0]  # Probabilité
-        return jsonify({"probability": float(prediction)})
+        timer.lap("encode")
+        if cache is not None:
+            prediction = cache.predict(features[0], lambda row: batcher.predict(row, timeout=PREDICT_TIMEOUT_S))
+        else:
+            prediction = batcher.predict(features[0], timeout=PREDICT_TIMEOUT_S)  # Probabilité
+        timer.lap("queue")
+        response = jsonify({"probability": float(prediction)})
+        timer.lap("post")
+        METRICS.count_decisions(prediction, DECISION_THRESHOLD)
+        timer.done("predict")
+        return response
+    except FeatureEncodingError as e:
+        METRICS.count_error("predict", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except QueueFullError as e:
+        METRICS.count_error("predict", 429)
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        METRICS.count_error("predict", 500)
+        return jsonify({"error": str(e)}), 500
+
+# 📦 Prédiction en masse : une seule requête HTTP pour toutes les lignes d'un incident
+PREDICT_BATCH_MAX_ROWS = int(os.environ.get("PREDICT_BATCH_MAX_ROWS", 100_000))
+
+class PayloadTooLargeError(ValueError):
+    """La requête contient plus de PREDICT_BATCH_MAX_ROWS lignes."""
+
+def check_batch_rows(n_rows: int):
+    if n_rows > PREDICT_BATCH_MAX_ROWS:
+        raise PayloadTooLargeError(f"Trop de lignes ({n_rows} > {PREDICT_BATCH_MAX_ROWS})")
+
+def decode_batch_request(body: bytes, content_type: str, timer=NULL_TIMER):
+    """
+    Décode le corps de /predict_batch en matrice de caractéristiques :
+    - JSON : un tableau d'objets au format de /predict ;
+    - binaire : matrice float32 de caractéristiques brutes (voir wire_format.py), colonnes
+      dans l'ordre de feature_columns().
+    Le nombre de lignes (longueur du tableau ou en-tête binaire) est vérifié avant l'encodage.
+    Lève WireFormatError / FeatureEncodingError si l'entrée est invalide, PayloadTooLargeError
+    au-delà de PREDICT_BATCH_MAX_ROWS lignes.
+    """
+    if (content_type or "").split(";")[0].strip().lower() == "application/json":
+        try:
+            rows = json.loads(body)
+        except ValueError as e: # JSON ou UTF-8 invalide
+            raise WireFormatError(f"JSON invalide : {e}") from e
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise WireFormatError("Un tableau JSON d'objets est attendu")
+        check_batch_rows(len(rows))
+        timer.lap("decode")
+        features = encode_features_batch(rows)
+        timer.lap("encode")
+    else:
+        check_batch_rows(matrix_rows(body, content_type))
+        features = artifacts.plan.check_matrix(decode_matrix(body, content_type))
+        timer.lap("decode")
+    return features
+
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch():
+    """
+    Réponse : {"probabilities": [...]} dans l'ordre des lignes, ou float32 bruts si
+    l'en-tête Accept demande application/octet-stream.
+    """
+    timer = METRICS.timer()
+    try:
+        features = decode_batch_request(request.get_data(), request.content_type, timer)
+        METRICS.observe_batch("model", len(features))
+        probabilities = artifacts.predict_matrix(features, timer)
+
+        if BINARY_CONTENT_TYPE in request.headers.get("Accept", ""):
+            response = Response(encode_probabilities(probabilities), mimetype=BINARY_CONTENT_TYPE)
+        else:
+            response = jsonify({"probabilities": probabilities.tolist()})
+        timer.lap("post")
+        METRICS.count_decisions(probabilities, DECISION_THRESHOLD)
+        timer.done("predict_batch")
+        return response
+    except PayloadTooLargeError as e:
+        METRICS.count_error("predict_batch", 413)
+        return jsonify({"error": str(e)}), 413
+    except (WireFormatError, FeatureEncodingError, json.JSONDecodeError) as e:
+        METRICS.count_error("predict_batch", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except Exception as e:
+        METRICS.count_error("predict_batch", 500)
+        return jsonify({"error": str(e)}), 500
+
+# 🗺️ Zones à risque de la carte, même regroupement que calculateRiskAreas (heatmap.ts)
+def parse_risk_areas_request(data):
+    """
+    (incidents, rayon en km) du corps de /risk_areas : {"incidents": [...], "clusterRadius": 0.3}
+    ou directement le tableau d'incidents (latitude, longitude, severity). Lève ValueError si invalide.
+    """
+    incidents, cluster_radius = data, DEFAULT_CLUSTER_RADIUS_KM
+    if isinstance(data, dict):
+        incidents = data.get("incidents")
+        try:
+            cluster_radius = float(data.get("clusterRadius", DEFAULT_CLUSTER_RADIUS_KM))
+        except (TypeError, ValueError):
+            raise ValueError("clusterRadius doit être un nombre") from None
+    if not isinstance(incidents, list) or not all(isinstance(incident, dict) for incident in incidents):
+        raise ValueError("Un tableau JSON d'incidents est attendu")
+    if not cluster_radius > 0:
+        raise ValueError("clusterRadius doit être positif")
+    return incidents, cluster_radius
+
+@app.route("/risk_areas", methods=["POST"])
+def risk_areas():
+    """Réponse : {"riskAreas": [...]} au format RiskArea (corps : voir parse_risk_areas_request)."""
+    timer = METRICS.timer()
+    try:
+        incidents, cluster_radius = parse_risk_areas_request(request.get_json(silent=True))
+        timer.lap("decode")
+        areas = calculate_risk_areas(incidents, cluster_radius)
+        timer.lap("cluster")
+        response = jsonify({"riskAreas": areas})
+        timer.lap("post")
+        timer.done("risk_areas")
+        return response
+    except ValueError as e:
+        METRICS.count_error("risk_areas", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except Exception as e:
+        METRICS.count_error("risk_areas", 500)
+        return jsonify({"error": str(e)}), 500
+
+# 🗄️ Magasins d'incidents (tuiles, fenêtres) créés au premier appel et pas à l'import :
+# les workers de ml_server_asgi (spawn) réimportent ce module et n'en ont pas besoin
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _store(name, factory):
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = factory()
+        return _stores[name]
+
+# 🧱 Tuiles de risque précalculées (risk_tiles.py), activées par BUTTERFLY_TILES_DIR
+def get_tiles():
+    """RiskTiles de BUTTERFLY_TILES_DIR chargées au premier appel, ou None si désactivées."""
+    return _store("tiles", RiskTiles.from_env)
+
+TILES_DISABLED = "Tuiles désactivées (BUTTERFLY_TILES_DIR non défini)"
+
+def tiles_disabled():
+    return jsonify({"error": TILES_DISABLED}), 404
+
+def split_list(value):
+    """"a,b" -> ["a", "b"] ; absent ou vide -> None (pas de filtre)."""
+    return value.split(",") if value else None
+
+def incident_list(data) -> list:
+    """Corps d'ajout d'incidents : un incident ou un tableau d'incidents ; lève ValueError sinon."""
+    incidents = data if isinstance(data, list) else [data]
+    if not all(isinstance(incident, dict) for incident in incidents):
+        raise ValueError("Un incident ou un tableau JSON d'incidents est attendu")
+    return incidents
+
+def add_to_tiles(tiles, incidents) -> dict:
+    """Ajoute des incidents au format du schéma aux tuiles (puis autosave) ; {"added", "skipped"}."""
+    added = sum(tiles.add(incident.get("latitude"), incident.get("longitude"), incident.get("type"),
+                          incident.get("severity"), incident.get("createdAt", incident.get("created_at")))
+                for incident in incidents)
+    tiles.autosave()
+    return {"added": added, "skipped": len(incidents) - added}
+
+def parse_tiles_query(args) -> dict:
+    """
+    Arguments de RiskTiles.query depuis les paramètres d'URL : south, west, north, east, zoom
+    (zoom de la carte), filtres optionnels types=theft,danger et severity=high. Lève ValueError.
+    """
+    names = ("south", "west", "north", "east", "zoom")
+    if any(args.get(name) in (None, "") for name in names):
+        raise ValueError("south, west, north, east et zoom sont requis")
+    query = {name: float(args.get(name)) for name in names[:4]}
+    query["zoom"] = int(args.get("zoom"))
+    query["types"] = split_list(args.get("types"))
+    query["severities"] = split_list(args.get("severity"))
+    return query
+
+@app.route("/tiles/incidents", methods=["POST"])
+def tiles_add_incidents():
+    """
+    À appeler après createIncident. Corps : un incident ou un tableau d'incidents au format
+    du schéma (latitude, longitude, type, severity, createdAt). Réponse : {"added", "skipped"}.
+    """
+    tiles = get_tiles()
+    if tiles is None:
+        return tiles_disabled()
+    timer = METRICS.timer()
+    try:
+        incidents = incident_list(request.get_json(silent=True))
+        timer.lap("decode")
+        result = add_to_tiles(tiles, incidents)
+        timer.lap("tiles")
+        response = jsonify(result)
+        timer.lap("post")
+        timer.done("tiles_incidents")
+        return response
+    except ValueError as e:
+        METRICS.count_error("tiles_incidents", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except Exception as e:
+        METRICS.count_error("tiles_incidents", 500)
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/tiles", methods=["GET"])
+def tiles_query():
+    """Tuiles d'une fenêtre de la carte (paramètres : voir parse_tiles_query)."""
+    tiles = get_tiles()
+    if tiles is None:
+        return tiles_disabled()
+    timer = METRICS.timer()
+    try:
+        query = parse_tiles_query(request.args)
+        timer.lap("decode")
+        result = tiles.query(**query)
+        timer.lap("tiles")
+        response = jsonify(result)
+        timer.lap("post")
+        timer.done("tiles")
+        return response
+    except ValueError as e:
+        METRICS.count_error("tiles", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except Exception as e:
+        METRICS.count_error("tiles", 500)
+        return jsonify({"error": str(e)}), 500
+
+# ⏳ Comptes glissants 24h / 7 jours / 30 jours (incident_windows.py), en mémoire ;
+# BUTTERFLY_WINDOWS_EXPORT précharge un export d'incidents au premier appel
+def get_windows():
+    """IncidentWindows créées (et préchargées) au premier appel."""
+    return _store("windows", IncidentWindows.from_env)
+
+def window_incidents(data) -> list:
+    """
+    Incidents du corps de /windows/incidents. Lève ValueError si un incident n'a pas d'id (les
+    ajouts répétés ne seraient pas dédoublonnés) ou si son type, sa gravité ou sa zone est inconnu.
+    """
+    incidents = incident_list(data)
+    for incident in incidents:
+        if incident.get("id") in (None, ""):
+            raise ValueError("id est requis pour chaque incident")
+        if incident.get("type") not in INCIDENT_TYPES:
+            raise ValueError(f"type inconnu {incident.get('type')!r}, attendu l'un de {INCIDENT_TYPES}")
+        if incident.get("severity") not in SEVERITIES:
+            raise ValueError(f"severity inconnue {incident.get('severity')!r}, attendu l'une de {SEVERITIES}")
+        zone_type = incident.get("zoneType", incident.get("zone_type"))
+        if zone_type is not None and zone_type not in ZONE_TYPES:
+            raise ValueError(f"zoneType inconnu {zone_type!r}, attendu l'un de {ZONE_TYPES}")
+    return incidents
+
+def add_to_windows(windows, incidents) -> dict:
+    """Ajoute des incidents au format du schéma aux fenêtres ; {"added", "duplicates"}."""
+    added = sum(windows.add(incident.get("id"), incident.get("type"), incident.get("severity"),
+                            incident.get("zoneType", incident.get("zone_type")),
+                            incident.get("createdAt", incident.get("created_at")))
+                for incident in incidents)
+    return {"added": added, "duplicates": len(incidents) - added}
+
+def parse_windows_query(args) -> dict:
+    """
+    Arguments de IncidentWindows.query depuis les paramètres d'URL : timeFilter=24h|week|month|all
+    (ou 7d, 30d), filtres optionnels types=theft,danger, severity=high et zones=nightlife.
+    """
+    return {"window": args.get("timeFilter") or "24h", "types": split_list(args.get("types")),
+            "severities": split_list(args.get("severity")), "zone_types": split_list(args.get("zones"))}
+
+def recency_response(windows, ids) -> dict:
+    """
+    {"incidents": {id: {days_since_incident, hour_of_day, day_of_week, is_weekend} ou None si
+    l'incident est inconnu ou expiré}} ; lève ValueError si ids est vide.
+    """
+    if not ids:
+        raise ValueError("ids est requis")
+    features = windows.recency(ids)
+    known = features["days_since_incident"] >= 0
+    return {"incidents": {
+        incident_id: {name: int(values[i]) for name, values in features.items()} if known[i] else None
+        for i, incident_id in enumerate(ids)
+    }}
+
+@app.route("/windows/incidents", methods=["POST"])
+def windows_add_incidents():
+    """
+    À appeler après createIncident. Corps : un incident ou un tableau d'incidents au format
+    du schéma (id, type et severity requis ; zoneType, createdAt). Réponse : {"added", "duplicates"}.
+    """
+    timer = METRICS.timer()
+    try:
+        incidents = window_incidents(request.get_json(silent=True))
+        timer.lap("decode")
+        result = add_to_windows(get_windows(), incidents)
+        timer.lap("windows")
+        response = jsonify(result)
+        timer.lap("post")
+        timer.done("windows_incidents")
+        return response
+    except ValueError as e:
+        METRICS.count_error("windows_incidents", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except Exception as e:
+        METRICS.count_error("windows_incidents", 500)
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/windows", methods=["GET"])
+def windows_query():
+    """Comptes d'une fenêtre de temps (paramètres : voir parse_windows_query)."""
+    timer = METRICS.timer()
+    try:
+        query = parse_windows_query(request.args)
+        timer.lap("decode")
+        result = get_windows().query(**query)
+        timer.lap("windows")
+        response = jsonify(result)
+        timer.lap("post")
+        timer.done("windows")
+        return response
+    except ValueError as e:
+        METRICS.count_error("windows", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except Exception as e:
+        METRICS.count_error("windows", 500)
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/windows/recency", methods=["GET"])
+def windows_recency():
+    """Caractéristiques temporelles du modèle pour ?ids=a,b (voir recency_response)."""
+    timer = METRICS.timer()
+    try:
+        ids = split_list(request.args.get("ids"))
+        timer.lap("decode")
+        result = recency_response(get_windows(), ids)
+        timer.lap("windows")
+        response = jsonify(result)
+        timer.lap("post")
+        timer.done("windows_recency")
+        return response
+    except ValueError as e:
+        METRICS.count_error("windows_recency", 400)
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
     except Exception as e:
+        METRICS.count_error("windows_recency", 500)
         return jsonify({"error": str(e)}), 500
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    # Métriques du micro-batching (taille des lots, profondeur de file, rejets...) et du cache
+    return jsonify({"batching": batcher.stats(), "cache": cache.stats() if cache is not None else None})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    # Format texte Prometheus : durée par étape, lignes par lot, décisions, erreurs
+    return Response(METRICS.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
+# 🔬 Profileur par échantillonnage, démarré / arrêté à chaud (une session à la fois)
+profiler = SamplingProfiler()
+_profiler_lock = threading.Lock()
+
+def start_profiler(interval_ms=None) -> SamplingProfiler:
+    """
+    Démarre une session de profilage (intervalle par défaut si interval_ms est None).
+    Lève ValueError si interval_ms <= 0, RuntimeError si une session est déjà en cours.
+    """
+    global profiler
+    if interval_ms is not None and not interval_ms > 0:
+        raise ValueError("interval_ms doit être > 0")
+    with _profiler_lock:
+        if profiler.running:
+            raise RuntimeError("Profileur déjà démarré")
+        profiler = SamplingProfiler(interval_ms / 1000) if interval_ms is not None else SamplingProfiler()
+        profiler.start()
+        return profiler
+
+def stop_profiler() -> str:
+    """Arrête la session en cours ; piles repliées ("f1;f2;f3 nombre") pour flamegraph.pl ou speedscope."""
+    with _profiler_lock:
+        profiler.stop()
+        return profiler.collapsed()
+
+@app.route("/profiler/start", methods=["POST"])
+def profiler_start():
+    try:
+        session = start_profiler(request.args.get("interval_ms", type=float))
+    except ValueError as e:
+        return jsonify({"error": f"Entrée invalide : {e}"}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"running": True, "interval_ms": session.interval_s * 1000})
+
+@app.route("/profiler/stop", methods=["POST"])
+def profiler_stop():
+    return Response(stop_profiler(), mimetype="text/plain")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    load_model()
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
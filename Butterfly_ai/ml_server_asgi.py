@@ -0,0 +1,354 @@
+# ml_server_asgi.py
+# Mode de service "production" : front asynchrone (ASGI) + pool de workers d'inférence
+#
+# Lancement :
+#   uvicorn ml_server_asgi:app --host 0.0.0.0 --port 5000
+#
+# Les connexions sont acceptées par la boucle asyncio ; chaque prédiction est exécutée
+# dans un pool borné (threads partageant un modèle, ou processus avec un modèle chacun).
+# Quand trop de requêtes sont en attente, le serveur répond 429 au lieu d'empiler.
+#
+# Les routes de la carte et du tableau de bord (/risk_areas, /tiles, /windows) n'utilisent
+# pas le modèle : elles tournent dans le pool de threads de Starlette, avec le même décodage
+# que ml_server.py, dans le processus principal (jamais dans les workers d'inférence).
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import ml_server
+from butterfly_features import FeatureEncodingError
+from instrumentation import METRICS, PROMETHEUS_CONTENT_TYPE
+from micro_batcher import QueueFullError
+from risk_areas import calculate_risk_areas
+from wire_format import BINARY_CONTENT_TYPE, WireFormatError, encode_probabilities
+
+# --- 1. CONFIGURATION ---
+
+# "thread" : un modèle partagé par tous les threads ; "process" : un modèle par processus
+WORKER_MODE = os.environ.get("WORKER_MODE", "thread")
+WORKERS = int(os.environ.get("WORKERS", os.cpu_count() or 1))
+# Requêtes acceptées en même temps (en cours + en attente) avant de répondre 429
+MAX_PENDING = int(os.environ.get("MAX_PENDING", 256))
+
+# --- 2. POOL D'INFÉRENCE ---
+
+def _warmup_worker():
+    """Charge le modèle dans le worker courant et exécute une prédiction factice."""
+    ml_server.artifacts.warmup()
+    return os.getpid()
+
+def _predict_in_worker(features):
+    return ml_server.predict_matrix(features)
+
+class InferencePool:
+    """Pool borné d'exécution des prédictions, avec compteur de requêtes en vol."""
+    def __init__(self, mode=WORKER_MODE, workers=WORKERS, max_pending=MAX_PENDING):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"WORKER_MODE inconnu : '{mode}'")
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.ready = False
+        self.load_error = None
+        self.load_seconds = None
+        self.executor = None
+
+    def start(self):
+        # Créé au démarrage du serveur et pas à l'import : les processus workers
+        # réimportent ce module et ne doivent pas ouvrir leur propre pool.
+        if self.mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        else:
+            # "spawn" : TensorFlow ne supporte pas d'être hérité via fork
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def warmup(self):
+        """Charge le modèle dans chaque worker ; le serveur devient 'ready' ensuite."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            n_tasks = 1 if self.mode == "thread" else self.workers
+            await asyncio.gather(*(loop.run_in_executor(self.executor, _warmup_worker) for _ in range(n_tasks)))
+            self.load_seconds = time.perf_counter() - start
+            self.ready = True
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+
+    def try_acquire(self) -> bool:
+        # Pas de verrou : tout se passe dans la boucle asyncio (un seul thread)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        return True
+
+    async def predict(self, features):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, _predict_in_worker, features)
+        finally:
+            self.pending -= 1
+
+    async def predict_one(self, row):
+        """
+        Une seule ligne : en mode thread, elle passe par le micro-batcher de ml_server
+        (un appel modèle pour toutes les requêtes concurrentes) ; en mode process, par le pool.
+        """
+        if self.mode == "process":
+            return (await self.predict(row.reshape(1, -1)))[0]
+        try:
+            return await asyncio.wrap_future(ml_server.batcher.submit(row))
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected_total": self.rejected,
+        }
+
+pool = InferencePool()
+
+# --- 3. ROUTES ---
+
+async def _json_body(request: Request):
+    """Corps JSON de la requête, ou None s'il est vide ou invalide (comme get_json(silent=True))."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def _error(endpoint, status, message):
+    METRICS.count_error(endpoint, status)
+    return JSONResponse({"error": message}, status_code=status)
+
+def _too_busy(endpoint):
+    return _error(endpoint, 429, f"Serveur saturé ({pool.max_pending} requêtes en attente)")
+
+def _not_ready(endpoint):
+    return _error(endpoint, 503, "Modèle en cours de chargement")
+
+async def predict(request: Request):
+    # Mêmes étapes que ml_server.predict : "queue" = attente du pool (ou du cache) + appel au modèle
+    timer = METRICS.timer()
+    if not pool.ready:
+        return _not_ready("predict")
+    try:
+        data = await _json_body(request)
+        timer.lap("decode")
+        features = ml_server.encode_features(data)
+        timer.lap("encode")
+    except ValueError as e: # FeatureEncodingError, JSON invalide
+        return _error("predict", 400, f"Entrée invalide : {e}")
+    row, key, generation = features[0], None, None
+    cache = ml_server.cache
+    probability = None
+    if cache is not None:
+        row = cache.quantize(row)
+        key = cache.key(row)
+        probability = cache.get(key)
+        generation = cache.generation
+    if probability is None:
+        if not pool.try_acquire():
+            return _too_busy("predict")
+        try:
+            probability = float(await pool.predict_one(row))
+        except QueueFullError:
+            return _too_busy("predict")
+        except Exception as e:
+            return _error("predict", 500, str(e))
+        if cache is not None:
+            cache.put(key, probability, generation)
+    timer.lap("queue")
+    response = JSONResponse({"probability": probability})
+    timer.lap("post")
+    METRICS.count_decisions(probability, ml_server.DECISION_THRESHOLD)
+    timer.done("predict")
+    return response
+
+async def predict_batch(request: Request):
+    # "decode" / "encode" dans decode_batch_request, "queue" = attente du pool + appel au modèle
+    # ("scale" / "model" et les lignes par lot sont mesurés par ml_server.predict_matrix)
+    timer = METRICS.timer()
+    if not pool.ready:
+        return _not_ready("predict_batch")
+    try:
+        # Décodage JSON + encodage de jusqu'à PREDICT_BATCH_MAX_ROWS lignes : hors de la boucle asyncio
+        features = await run_in_threadpool(ml_server.decode_batch_request, await request.body(),
+                                           request.headers.get("content-type"), timer)
+    except ml_server.PayloadTooLargeError as e:
+        return _error("predict_batch", 413, str(e))
+    except (WireFormatError, FeatureEncodingError, json.JSONDecodeError) as e:
+        return _error("predict_batch", 400, f"Entrée invalide : {e}")
+    if not pool.try_acquire():
+        return _too_busy("predict_batch")
+    try:
+        probabilities = await pool.predict(features)
+    except Exception as e:
+        return _error("predict_batch", 500, str(e))
+    timer.lap("queue")
+
+    if BINARY_CONTENT_TYPE in request.headers.get("accept", ""):
+        response = Response(encode_probabilities(probabilities), media_type=BINARY_CONTENT_TYPE)
+    else:
+        response = JSONResponse({"probabilities": probabilities.tolist()})
+    timer.lap("post")
+    METRICS.count_decisions(probabilities, ml_server.DECISION_THRESHOLD)
+    timer.done("predict_batch")
+    return response
+
+async def risk_areas(request: Request):
+    try:
+        incidents, cluster_radius = ml_server.parse_risk_areas_request(await _json_body(request))
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    try:
+        areas = await run_in_threadpool(calculate_risk_areas, incidents, cluster_radius)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return JSONResponse({"riskAreas": areas})
+
+async def tiles_add_incidents(request: Request):
+    tiles = ml_server.get_tiles()
+    if tiles is None:
+        return JSONResponse({"error": ml_server.TILES_DISABLED}, status_code=404)
+    try:
+        incidents = ml_server.incident_list(await _json_body(request))
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    try:
+        return JSONResponse(await run_in_threadpool(ml_server.add_to_tiles, tiles, incidents))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def tiles_query(request: Request):
+    tiles = ml_server.get_tiles()
+    if tiles is None:
+        return JSONResponse({"error": ml_server.TILES_DISABLED}, status_code=404)
+    try:
+        query = ml_server.parse_tiles_query(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    try:
+        return JSONResponse(await run_in_threadpool(lambda: tiles.query(**query)))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def windows_add_incidents(request: Request):
+    try:
+        incidents = ml_server.window_incidents(await _json_body(request))
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    try:
+        return JSONResponse(await run_in_threadpool(
+            lambda: ml_server.add_to_windows(ml_server.get_windows(), incidents)))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def windows_query(request: Request):
+    query = ml_server.parse_windows_query(request.query_params)
+    try:
+        return JSONResponse(await run_in_threadpool(lambda: ml_server.get_windows().query(**query)))
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def windows_recency(request: Request):
+    ids = ml_server.split_list(request.query_params.get("ids"))
+    try:
+        return JSONResponse(await run_in_threadpool(lambda: ml_server.recency_response(ml_server.get_windows(), ids)))
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def healthz(request: Request):
+    # Vivant : la boucle répond, même si le modèle n'est pas encore chargé
+    return JSONResponse({"status": "ok"})
+
+async def readyz(request: Request):
+    # Prêt : le modèle est chargé dans les workers et peut servir des prédictions
+    body = {
+        "ready": pool.ready,
+        "backend": ml_server.BACKEND,
+        "model_path": str(ml_server.artifacts.model_path),
+        "load_seconds": pool.load_seconds,
+        "load_error": pool.load_error,
+    }
+    return JSONResponse(body, status_code=200 if pool.ready else 503)
+
+async def stats(request: Request):
+    cache = ml_server.cache
+    return JSONResponse({"pool": pool.stats(), "cache": cache.stats() if cache is not None else None})
+
+async def metrics(request: Request):
+    # En WORKER_MODE=process, les étapes "scale" / "model" sont mesurées dans les workers, pas ici
+    return Response(METRICS.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+async def profiler_start(request: Request):
+    # Même profileur que ml_server.py : il échantillonne tous les threads du processus principal
+    # (boucle asyncio, pool de threads), pas les workers d'un pool de processus
+    try:
+        interval_ms = request.query_params.get("interval_ms")
+        session = ml_server.start_profiler(float(interval_ms) if interval_ms else None)
+    except ValueError as e:
+        return JSONResponse({"error": f"Entrée invalide : {e}"}, status_code=400)
+    except RuntimeError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    return JSONResponse({"running": True, "interval_ms": session.interval_s * 1000})
+
+async def profiler_stop(request: Request):
+    # Attend la fin du thread d'échantillonnage : hors de la boucle asyncio
+    return Response(await run_in_threadpool(ml_server.stop_profiler), media_type="text/plain")
+
+@asynccontextmanager
+async def lifespan(app):
+    pool.start()
+    warmup = asyncio.create_task(pool.warmup())
+    yield
+    warmup.cancel()
+    pool.shutdown()
+
+app = Starlette(
+    routes=[
+        Route("/predict", predict, methods=["POST"]),
+        Route("/predict_batch", predict_batch, methods=["POST"]),
+        Route("/risk_areas", risk_areas, methods=["POST"]),
+        Route("/tiles/incidents", tiles_add_incidents, methods=["POST"]),
+        Route("/tiles", tiles_query, methods=["GET"]),
+        Route("/windows/incidents", windows_add_incidents, methods=["POST"]),
+        Route("/windows", windows_query, methods=["GET"]),
+        Route("/windows/recency", windows_recency, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/profiler/start", profiler_start, methods=["POST"]),
+        Route("/profiler/stop", profiler_stop, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
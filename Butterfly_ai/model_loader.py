@@ -0,0 +1,312 @@
+# model_loader.py
+# Chargement paresseux et partagé des artefacts du modèle expert
+#
+# Rien n'est chargé à l'import : le modèle, le scaler et les configurations sont lus
+# au premier appel de prédiction (ou à warmup()), une seule fois par processus et par
+# moteur, même si plusieurs threads arrivent en même temps.
+
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from butterfly_features import EncodingPlan
+from instrumentation import NULL_TIMER
+
+logger = logging.getLogger(__name__)
+
+# --- 1. CONFIGURATION ---
+
+# Les chemins sont résolus par rapport à ce fichier, pas au répertoire courant
+MODULE_DIR = Path(__file__).resolve().parent
+
+MODEL_PATH = MODULE_DIR / 'butterfly_expert_model.keras'
+SCALER_PATH = MODULE_DIR / 'expert_scaler.joblib'
+COLUMNS_PATH = MODULE_DIR / 'expert_model_columns.json'
+FEATURES_CONFIG_PATH = MODULE_DIR / 'feature_config.json'
+NUMPY_MODEL_PATH = MODULE_DIR / 'butterfly_expert_model.npz'
+THRESHOLD_PATH = MODULE_DIR / 'decision_threshold.json' # Écrit par evaluation.py
+
+# Seuil de décision utilisé tant qu'aucun seuil recommandé n'a été sauvegardé
+DEFAULT_DECISION_THRESHOLD = 0.7
+
+# Au-delà de cette taille, model.predict découpe la matrice en lots (sinon predict_on_batch)
+KERAS_BATCH_SIZE = 4096
+
+# Nombre de lignes traitées par bloc par le moteur NumPy (borne la mémoire des activations)
+NUMPY_BATCH_SIZE = 65536
+
+BACKENDS = ("keras", "numpy")
+
+# Variantes produites par optimize_model.py, servies par le moteur NumPy ("numpy" = "float32")
+NUMPY_VARIANT_PATHS = {
+    "float32": NUMPY_MODEL_PATH,
+    "float16": MODULE_DIR / 'butterfly_expert_model.float16.npz',
+    "int8": MODULE_DIR / 'butterfly_expert_model.int8.npz',
+    "pruned": MODULE_DIR / 'butterfly_expert_model.pruned.npz',
+}
+MODEL_VARIANTS = BACKENDS + tuple(NUMPY_VARIANT_PATHS)
+
+class ArtifactNotFoundError(FileNotFoundError):
+    """Un fichier d'artefact du modèle est introuvable."""
+
+def load_decision_threshold(path=THRESHOLD_PATH, default=DEFAULT_DECISION_THRESHOLD) -> float:
+    """Seuil recommandé par evaluation.py ; 'default' si le fichier est absent ou invalide."""
+    try:
+        with open(path) as f:
+            threshold = float(json.load(f)["decision_threshold"])
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Seuil de décision illisible dans %s (%s) : %s utilisé", path, e, default)
+        return default
+    if not 0.0 <= threshold < 1.0:
+        logger.warning("Seuil de décision %s hors de [0, 1) dans %s : %s utilisé", threshold, path, default)
+        return default
+    return threshold
+
+_ACTIVATIONS = {
+    "relu": lambda z: np.maximum(z, 0, out=z),
+    "sigmoid": lambda z: 0.5 * (1 + np.tanh(0.5 * z)), # forme stable, sans débordement de exp
+    "linear": lambda z: z,
+}
+
+# --- 2. ARTEFACTS ---
+
+class ModelArtifacts:
+    """
+    Regroupe le modèle et ses configurations pour un moteur donné :
+    - "keras" : butterfly_expert_model.keras + expert_scaler.joblib (TensorFlow importé au chargement)
+    - "numpy" : butterfly_expert_model.npz (scaler replié dans les poids, sans TensorFlow),
+      ou l'une des variantes float16 / int8 / élaguée de optimize_model.py (model_path)
+    """
+    def __init__(self, backend: str = "keras", model_path=None, scaler_path=SCALER_PATH,
+                 columns_path=COLUMNS_PATH, features_config_path=FEATURES_CONFIG_PATH):
+        if backend not in BACKENDS:
+            raise ValueError(f"Moteur inconnu '{backend}', attendu l'un de {BACKENDS}")
+        self.backend = backend
+        if model_path is None:
+            model_path = MODEL_PATH if backend == "keras" else NUMPY_MODEL_PATH
+        self.model_path = Path(model_path)
+        self.scaler_path = Path(scaler_path)
+        self.columns_path = Path(columns_path)
+        self.features_config_path = Path(features_config_path)
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._plan = None
+        self.load_seconds = None
+        # Incrémenté à chaque (re)chargement : permet aux caches de détecter un changement
+        self.generation = 0
+        self.loaded_fingerprint = None
+
+    # --- Chargement ---
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        """Charge les artefacts s'ils ne le sont pas déjà (sûr entre threads)."""
+        if self._loaded:
+            return self
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+        return self
+
+    def reload(self):
+        """Relit les artefacts depuis le disque (ex: après un nouvel entraînement ou export)."""
+        with self._lock:
+            self._load_locked()
+        return self
+
+    def _load_locked(self):
+        start = time.perf_counter()
+        fingerprint = self.fingerprint()
+        if self.backend == "keras":
+            self._load_keras()
+        else:
+            self._load_numpy()
+        self._num_idx = [self.model_columns.index(col) for col in self.feature_config['numerical_features']]
+        self._plan = None
+        self.loaded_fingerprint = fingerprint
+        self.generation += 1
+        self.load_seconds = time.perf_counter() - start
+        self._loaded = True
+        logger.info("Artefacts '%s' chargés en %.2fs depuis %s", self.backend, self.load_seconds, self.model_path)
+
+    def files(self):
+        """Fichiers dont dépendent les prédictions de ce moteur."""
+        if self.backend == "keras":
+            return [self.model_path, self.scaler_path, self.columns_path, self.features_config_path]
+        return [self.model_path]
+
+    def fingerprint(self):
+        """(chemin, date de modification, taille) de chaque artefact ; None si un fichier manque."""
+        try:
+            return tuple((str(path), path.stat().st_mtime_ns, path.stat().st_size) for path in self.files())
+        except FileNotFoundError:
+            return None
+
+    def changed_on_disk(self) -> bool:
+        """Vrai si un artefact a été modifié depuis le dernier chargement."""
+        return self._loaded and self.fingerprint() != self.loaded_fingerprint
+
+    def _check_exists(self, *paths):
+        for path in paths:
+            if not path.exists():
+                raise ArtifactNotFoundError(f"Fichier manquant -> {path}")
+
+    def _load_keras(self):
+        self._check_exists(*self.files())
+        import joblib
+        from tensorflow import keras
+
+        self.model = keras.models.load_model(self.model_path)
+        self.scaler = joblib.load(self.scaler_path)
+        with open(self.columns_path) as f:
+            self.model_columns = json.load(f)
+        with open(self.features_config_path) as f:
+            self.feature_config = json.load(f)
+
+    def _load_numpy(self):
+        self._check_exists(self.model_path)
+        with np.load(self.model_path) as artifact:
+            self.model_columns = artifact["model_columns"].tolist()
+            self.feature_config = {
+                "numerical_features": artifact["numerical_features"].tolist(),
+                "categorical_features_one_hot": artifact["categorical_features_one_hot"].tolist(),
+            }
+            files = set(artifact.files)
+            # Variante int8 : scaler NON replié (les activations quantifiées doivent être centrées réduites)
+            if "input_shift" in files:
+                self.input_shift = artifact["input_shift"].astype(np.float32)
+                self.input_scale = artifact["input_scale"].astype(np.float32)
+            else:
+                self.input_shift = self.input_scale = None
+            # Poids float16 / int8 convertis en float32 au chargement : NumPy n'a pas de produit
+            # matriciel rapide en float16 ni en int8 (le gain de ces variantes est sur le disque)
+            self.layers = [
+                (artifact[f"W{i}"].astype(np.float32), artifact[f"b{i}"].astype(np.float32), _ACTIVATIONS[activation],
+                 artifact[f"W{i}_scale"].astype(np.float32) if f"W{i}_scale" in files else None)
+                for i, activation in enumerate(artifact["activations"].tolist())
+            ]
+        self.model = None
+        self.scaler = None
+
+    @property
+    def plan(self) -> EncodingPlan:
+        """
+        Plan d'encodage compilé depuis les colonnes et feature_config.json.
+        Pour Keras, seuls les fichiers JSON sont lus : le modèle n'est pas chargé.
+        """
+        if self._plan is None:
+            if self.backend == "keras" and not self._loaded:
+                self._check_exists(self.columns_path, self.features_config_path)
+                with open(self.columns_path) as f:
+                    model_columns = json.load(f)
+                with open(self.features_config_path) as f:
+                    feature_config = json.load(f)
+            else:
+                self.load()
+                model_columns, feature_config = self.model_columns, self.feature_config
+            self._plan = EncodingPlan(model_columns, feature_config)
+        return self._plan
+
+    def warmup(self):
+        """Charge les artefacts et exécute une prédiction factice ; retourne la durée totale (s)."""
+        start = time.perf_counter()
+        self.load()
+        self.predict_matrix(np.zeros((1, len(self.model_columns)), dtype=np.float32))
+        return time.perf_counter() - start
+
+    # --- Prédiction ---
+
+    def encode(self, records) -> np.ndarray:
+        """
+        Encode les lignes dans l'ordre de 'expert_model_columns.json', SANS scaler :
+        predict_matrix() l'applique pour Keras ; il est déjà replié dans les poids NumPy.
+        Lève FeatureEncodingError pour une caractéristique manquante ou une catégorie inconnue.
+        """
+        return self.plan.encode(records)
+
+    def predict_matrix(self, X: np.ndarray, timer=NULL_TIMER) -> np.ndarray:
+        """
+        Probabilités brutes (une par ligne) pour une matrice encodée par encode().
+        Lève FeatureEncodingError si le nombre de colonnes n'est pas celui du modèle.
+        :param timer: Chronomètre (instrumentation.StageTimer) des étapes "scale" et "model".
+        """
+        self.load()
+        X = self.plan.check_matrix(X)
+        if len(X) == 0:
+            return np.zeros(0, dtype=np.float32)
+        if self.backend == "keras":
+            X = X.copy()
+            X[:, self._num_idx] = (X[:, self._num_idx] - self.scaler.mean_) / self.scaler.scale_
+            timer.lap("scale")
+            if len(X) <= KERAS_BATCH_SIZE:
+                # predict_on_batch évite la mise en place du pipeline de predict() (petits lots)
+                proba = np.asarray(self.model.predict_on_batch(X)).reshape(-1)
+            else:
+                proba = self.model.predict(X, batch_size=KERAS_BATCH_SIZE, verbose=0).reshape(-1)
+        elif len(X) <= NUMPY_BATCH_SIZE:
+            proba = self._forward(X)
+        else:
+            proba = np.concatenate([
+                self._forward(X[start:start + NUMPY_BATCH_SIZE])
+                for start in range(0, len(X), NUMPY_BATCH_SIZE)
+            ])
+        timer.lap("model")
+        return proba
+
+    def _forward(self, X: np.ndarray) -> np.ndarray:
+        if self.input_shift is not None:
+            X = (X - self.input_shift) / self.input_scale
+        for W, b, activation, w_scale in self.layers:
+            Z = X @ W if w_scale is None else _quantized_matmul(X, W, w_scale)
+            Z += b
+            X = activation(Z)
+        return X.reshape(-1)
+
+    def predict_proba(self, records, timer=NULL_TIMER) -> np.ndarray:
+        X = self.encode(records)
+        timer.lap("encode")
+        return self.predict_matrix(X, timer)
+
+def _quantized_matmul(X, W_q, w_scale):
+    """
+    Quantification dynamique int8 (comme TFLite "dynamic range") : chaque ligne de X est
+    ramenée sur [-127, 127] avec sa propre échelle, W_q contient des entiers int8 (stockés
+    en float32) avec une échelle par neurone de sortie. Les sommes restent exactes en
+    float32 (127 * 127 * nb_entrées < 2**24), donc BLAS calcule le produit entier.
+    """
+    x_scale = np.abs(X).max(axis=1, keepdims=True) / 127
+    x_scale[x_scale == 0] = 1
+    Z = np.rint(X / x_scale) @ W_q
+    Z *= x_scale
+    Z *= w_scale
+    return Z
+
+# --- 3. INSTANCES PARTAGÉES ---
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def get_artifacts(backend: str = "keras") -> ModelArtifacts:
+    """
+    Retourne l'instance partagée (une par moteur/variante et par processus) ; ne charge rien.
+    :param backend: "keras", "numpy", ou une variante de NUMPY_VARIANT_PATHS ("float16", "int8", ...).
+    """
+    if backend not in MODEL_VARIANTS:
+        raise ValueError(f"Moteur ou variante inconnu '{backend}', attendu l'un de {MODEL_VARIANTS}")
+    with _shared_lock:
+        if backend not in _shared:
+            if backend in BACKENDS:
+                _shared[backend] = ModelArtifacts(backend)
+            else:
+                _shared[backend] = ModelArtifacts("numpy", model_path=NUMPY_VARIANT_PATHS[backend])
+        return _shared[backend]
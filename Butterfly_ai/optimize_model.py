@@ -0,0 +1,220 @@
+# optimize_model.py
+# Variantes compressées du modèle expert, après entraînement : BatchNormalization replié,
+# poids float16, quantification int8 dynamique et élagage par magnitude
+#
+# Chaque variante est un .npz servi par le moteur NumPy (model_loader.NUMPY_VARIANT_PATHS) ;
+# butterfly.py la charge avec BUTTERFLY_MODEL_VARIANT=<variante> (ml_server avec
+# BUTTERFLY_BACKEND=<variante>). Le rapport compare chaque variante au modèle Keras sur des
+# lignes jamais vues à l'entraînement : exactitude, AUC, décisions modifiées, latence CPU.
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from evaluation import area_under_curves, threshold_sweep
+from export_numpy_model import fold_layers, fold_scaler, save_numpy_model
+from model_loader import MODULE_DIR, NUMPY_VARIANT_PATHS, get_artifacts, load_decision_threshold
+
+# --- 1. CONFIGURATION ---
+
+class Config:
+    VARIANTS = ("float32", "float16", "int8", "pruned")
+    PRUNE_SPARSITY = 0.5          # Part des poids mis à zéro dans chaque couche cachée
+    HOLDOUT_ROWS = 50000
+    HOLDOUT_SEED = 2024           # Différente de la graine d'entraînement (42) : lignes jamais vues
+    LATENCY_CALLS = 300           # Appels d'une seule ligne
+    BATCH_ROWS = 10000
+    BATCH_REPEATS = 10
+    REPORT_PATH = MODULE_DIR / 'optimization_report.json'
+
+# --- 2. CONSTRUCTION DES VARIANTES ---
+
+def quantize_int8(W):
+    """
+    Quantification symétrique par neurone de sortie : W ≈ W_q * scale, W_q dans [-127, 127].
+    :return: (W_q int8, scale float32 de forme (nb_sorties,))
+    """
+    scale = np.abs(W).max(axis=0) / 127
+    scale[scale == 0] = 1
+    W_q = np.clip(np.rint(W / scale), -127, 127).astype(np.int8)
+    return W_q, scale.astype(np.float32)
+
+def prune_magnitude(layers, sparsity=Config.PRUNE_SPARSITY):
+    """
+    Met à zéro la fraction 'sparsity' des poids de plus petite valeur absolue, couche par
+    couche. La couche de sortie (quelques dizaines de poids) n'est pas élaguée.
+    """
+    pruned = []
+    for i, (W, b, activation) in enumerate(layers):
+        if i < len(layers) - 1:
+            W = np.where(np.abs(W) <= np.quantile(np.abs(W), sparsity), 0.0, W)
+        pruned.append([W, b, activation])
+    return pruned
+
+def _input_affine(model_columns, scaler, numerical_features):
+    """StandardScaler étendu à toutes les colonnes (décalage 0, échelle 1 pour les colonnes codées)."""
+    shift = np.zeros(len(model_columns), dtype=np.float32)
+    scale = np.ones(len(model_columns), dtype=np.float32)
+    num_idx = [model_columns.index(col) for col in numerical_features]
+    shift[num_idx] = scaler.mean_
+    scale[num_idx] = scaler.scale_
+    return shift, scale
+
+def build_variants(variants=Config.VARIANTS, sparsity=Config.PRUNE_SPARSITY):
+    """Écrit un .npz par variante à partir de butterfly_expert_model.keras ; retourne {variante: chemin}."""
+    source = get_artifacts("keras").load()
+    model_columns, feature_config = source.model_columns, source.feature_config
+    numerical = feature_config['numerical_features']
+    # BatchNormalization replié dans les Dense, entrées encore centrées réduites
+    folded = fold_layers(source.model)
+
+    def with_scaler(layers):
+        return fold_scaler([list(layer) for layer in layers], source.scaler, model_columns, numerical)
+
+    paths = {}
+    for variant in variants:
+        path = NUMPY_VARIANT_PATHS[variant]
+        if variant == "float32":
+            save_numpy_model(path, with_scaler(folded), model_columns, feature_config)
+        elif variant == "float16":
+            save_numpy_model(path, with_scaler(folded), model_columns, feature_config, weight_dtype=np.float16)
+        elif variant == "int8":
+            # Le scaler reste séparé : la quantification dynamique des activations suppose des
+            # entrées du même ordre de grandeur (user_connections brut écraserait les colonnes 0/1)
+            shift, scale = _input_affine(model_columns, source.scaler, numerical)
+            quantized, scales = [], {}
+            for i, (W, b, activation) in enumerate(folded):
+                W_q, scales[f"W{i}_scale"] = quantize_int8(W)
+                quantized.append([W_q, b, activation])
+            save_numpy_model(path, quantized, model_columns, feature_config, weight_dtype=np.int8,
+                             input_shift=shift, input_scale=scale, **scales)
+        elif variant == "pruned":
+            # Magnitudes comparées sur entrées réduites, avant repliement du scaler
+            save_numpy_model(path, with_scaler(prune_magnitude(folded, sparsity)), model_columns, feature_config)
+        else:
+            raise ValueError(f"Variante inconnue '{variant}', attendu l'une de {tuple(NUMPY_VARIANT_PATHS)}")
+        paths[variant] = path
+        print(f"Variante '{variant}' sauvegardée dans '{path}' ({path.stat().st_size / 1024:.1f} Ko)")
+    return paths
+
+# --- 3. DONNÉES DE TEST ---
+
+def holdout_columns(n_rows=Config.HOLDOUT_ROWS, seed=Config.HOLDOUT_SEED, directories=None):
+    """
+    Lignes de test en colonnes, catégorielles décodées en valeurs brutes.
+    Avec 'directories' (dossiers .npy), les blocs "test" de train_streaming.split_blocks ;
+    sinon n_rows lignes tirées par generate_columns avec une graine jamais utilisée.
+    :return: ({colonne: tableau}, étiquettes)
+    """
+    from generate_dataset import Config as DatasetConfig, DatasetGenerator, decode_columns, generate_columns
+    if directories:
+        from train_streaming import open_shards, split_blocks
+        schema, shards = open_shards(directories)
+        blocks, total = [], 0
+        for shard, start, stop in split_blocks(shards)["test"]:
+            stop = min(stop, start + n_rows - total)
+            blocks.append((shard, start, stop))
+            total += stop - start
+            if total >= n_rows:
+                break
+        columns = {
+            column["name"]: np.concatenate([shards[shard][column["name"]][start:stop] for shard, start, stop in blocks])
+            for column in schema
+        }
+    else:
+        schema = DatasetGenerator(DatasetConfig()).schema()
+        columns = generate_columns(n_rows, seed)
+    return decode_columns(schema, columns)
+
+# --- 4. MESURES ---
+
+def measure_latency(artifacts, X, calls=Config.LATENCY_CALLS, batch_rows=Config.BATCH_ROWS,
+                    repeats=Config.BATCH_REPEATS):
+    """Latence CPU d'une ligne (p50/p95 en ms) et d'un lot de batch_rows lignes (médiane en ms)."""
+    row = X[:1]
+    batch = np.resize(X, (batch_rows, X.shape[1])) # répète les lignes si X en a moins
+    artifacts.predict_matrix(row)
+    artifacts.predict_matrix(batch)
+
+    single = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        artifacts.predict_matrix(row)
+        single.append(time.perf_counter() - start)
+    batched = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        artifacts.predict_matrix(batch)
+        batched.append(time.perf_counter() - start)
+    return {
+        "single_row_p50_ms": float(np.percentile(single, 50) * 1e3),
+        "single_row_p95_ms": float(np.percentile(single, 95) * 1e3),
+        f"batch_{batch_rows}_ms": float(np.median(batched) * 1e3),
+        "batch_rows_per_s": float(batch_rows / np.median(batched)),
+    }
+
+def quality(y_true, y_proba, threshold):
+    sweep = threshold_sweep(y_true, y_proba)
+    return {
+        "accuracy": float(np.mean((y_proba > threshold) == (y_true == 1))),
+        "roc_auc": float(area_under_curves(sweep)["roc_auc"]),
+    }
+
+def evaluate_variants(variants=Config.VARIANTS, n_rows=Config.HOLDOUT_ROWS, seed=Config.HOLDOUT_SEED,
+                      directories=None, report_path=Config.REPORT_PATH):
+    """Compare le modèle Keras et chaque variante sur les mêmes lignes de test ; écrit le rapport JSON."""
+    threshold = load_decision_threshold()
+    columns, y = holdout_columns(n_rows, seed, directories)
+    reference = get_artifacts("keras")
+    X = reference.encode(columns)
+    print(f"\n{len(X):,} lignes de test, seuil de décision {threshold}")
+
+    reference_proba = reference.predict_matrix(X)
+    results = {}
+    for name in ("keras",) + tuple(variants):
+        artifacts = reference if name == "keras" else get_artifacts(name)
+        proba = reference_proba if name == "keras" else artifacts.predict_matrix(X)
+        result = {"file_bytes": artifacts.model_path.stat().st_size, **quality(y, proba, threshold)}
+        if name != "keras":
+            result["max_abs_proba_diff"] = float(np.max(np.abs(proba - reference_proba)))
+            result["decisions_changed"] = int(np.sum((proba > threshold) != (reference_proba > threshold)))
+        result.update(measure_latency(artifacts, X))
+        results[name] = result
+
+    keras_result = results["keras"]
+    for result in results.values():
+        result["accuracy_delta"] = result["accuracy"] - keras_result["accuracy"]
+        result["roc_auc_delta"] = result["roc_auc"] - keras_result["roc_auc"]
+
+    print(f"\n{'variante':<9} {'taille Ko':>9} {'exactitude':>10} {'Δ exact.':>9} {'Δ AUC':>9} {'décisions':>9} "
+          f"{'1 ligne ms':>10} {'10k lignes ms':>13}")
+    for name, r in results.items():
+        print(f"{name:<9} {r['file_bytes'] / 1024:>9.1f} {r['accuracy']:>10.4f} {r['accuracy_delta']:>+9.4f} "
+              f"{r['roc_auc_delta']:>+9.5f} {r.get('decisions_changed', 0):>9} {r['single_row_p50_ms']:>10.3f} "
+              f"{r[f'batch_{Config.BATCH_ROWS}_ms']:>13.2f}")
+
+    report = {"rows": len(X), "threshold": threshold, "source": [str(d) for d in directories] if directories else
+              f"generate_columns(seed={seed})", "variants": results}
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nRapport sauvegardé dans '{report_path}'")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Variantes compressées du modèle expert (float16, int8, élagage)")
+    parser.add_argument("--variants", nargs="+", default=list(Config.VARIANTS), choices=list(NUMPY_VARIANT_PATHS))
+    parser.add_argument("--sparsity", type=float, default=Config.PRUNE_SPARSITY, help="Part des poids élagués")
+    parser.add_argument("--rows", type=int, default=Config.HOLDOUT_ROWS, help="Lignes de test")
+    parser.add_argument("--seed", type=int, default=Config.HOLDOUT_SEED)
+    parser.add_argument("--data", nargs="+", help="Dossiers .npy : utilise leurs blocs de test (train_streaming)")
+    parser.add_argument("--skip-build", action="store_true", help="Évalue les .npz existants sans les réécrire")
+    parser.add_argument("--report", default=Config.REPORT_PATH)
+    args = parser.parse_args()
+
+    if not 0.0 <= args.sparsity < 1.0:
+        parser.error("--sparsity doit être dans [0, 1)")
+    if not args.skip_build:
+        build_variants(args.variants, args.sparsity)
+    evaluate_variants(args.variants, args.rows, args.seed, args.data, args.report)
@@ -0,0 +1,218 @@
+# prediction_cache.py
+# Cache LRU/TTL des prédictions, indexé par les caractéristiques quantifiées
+#
+# Beaucoup d'évaluations d'alertes répètent presque les mêmes entrées (même type
+# d'incident, même zone, même heure) avec des distances ou des taux d'engagement à
+# peine différents. Les caractéristiques numériques sont arrondies à un pas configurable
+# (ex: distance à 100 m) ; la prédiction est calculée sur la ligne arrondie, si bien que
+# toutes les entrées d'une même case reçoivent la même probabilité.
+#
+# Désactivé par défaut : BUTTERFLY_CACHE_SIZE > 0 l'active (voir from_env()).
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# --- 1. CONFIGURATION PAR DÉFAUT ---
+
+# Pas d'arrondi par caractéristique brute ; les autres colonnes restent exactes
+DEFAULT_QUANTIZATION = {
+    "distance_km": 0.1,           # 100 m
+    "user_engagement_rate": 0.05,
+    "urgency_score": 0.05,
+    "user_connections": 10,
+}
+DEFAULT_MAX_SIZE = 100_000
+DEFAULT_TTL_S = 300.0
+# Intervalle minimal entre deux vérifications des artefacts sur le disque
+DEFAULT_CHECK_INTERVAL_S = 5.0
+
+def parse_quantization(spec: str) -> dict:
+    """'distance_km=0.1,user_engagement_rate=0.05' -> {'distance_km': 0.1, ...}"""
+    steps = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, step = item.partition("=")
+        steps[name.strip()] = float(step)
+    return steps
+
+# --- 2. CACHE ---
+
+class PredictionCache:
+    """
+    Cache borné (éviction LRU) avec durée de vie par entrée, devant un ModelArtifacts.
+
+    :param artifacts: Artefacts du modèle (pour l'ordre des colonnes et l'invalidation), lus au premier quantize().
+    :param quantization: {caractéristique numérique: pas d'arrondi}.
+    :param max_size: Nombre maximal d'entrées ; la moins récemment utilisée est évincée.
+    :param ttl_s: Durée de vie d'une entrée en secondes (None : pas d'expiration).
+    :param check_interval_s: Période de vérification des fichiers d'artefacts ; s'ils ont
+        changé, le modèle est rechargé et le cache vidé.
+    :param clock: Horloge en secondes (time.monotonic par défaut ; remplaçable pour un rejeu).
+    """
+    def __init__(self, artifacts, quantization=None, max_size=DEFAULT_MAX_SIZE, ttl_s=DEFAULT_TTL_S,
+                 check_interval_s=DEFAULT_CHECK_INTERVAL_S, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size doit être >= 1")
+        self.artifacts = artifacts
+        self.quantization = dict(DEFAULT_QUANTIZATION if quantization is None else quantization)
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.check_interval_s = check_interval_s
+        self.clock = clock
+
+        # Indices des colonnes quantifiées, résolus au premier quantize() (et après un rechargement) :
+        # construire le cache ne lit aucun artefact
+        self._q_idx = None
+        self._q_steps = np.array(list(self.quantization.values()), dtype=np.float64)
+
+        self._entries = OrderedDict() # clé -> (probabilité, date d'expiration)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock() # Un seul appelant vérifie / recharge les artefacts
+        self._generation = artifacts.generation
+        self._next_check = clock() + check_interval_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, artifacts):
+        """Cache configuré par l'environnement, ou None si BUTTERFLY_CACHE_SIZE vaut 0 (défaut)."""
+        max_size = int(os.environ.get("BUTTERFLY_CACHE_SIZE", 0))
+        if max_size <= 0:
+            return None
+        ttl_s = float(os.environ.get("BUTTERFLY_CACHE_TTL_S", DEFAULT_TTL_S))
+        spec = os.environ.get("BUTTERFLY_CACHE_QUANTIZATION")
+        return cls(
+            artifacts,
+            quantization=parse_quantization(spec) if spec is not None else None,
+            max_size=max_size,
+            ttl_s=ttl_s if ttl_s > 0 else None,
+            check_interval_s=float(os.environ.get("BUTTERFLY_CACHE_CHECK_S", DEFAULT_CHECK_INTERVAL_S)),
+        )
+
+    # --- Quantification ---
+
+    def _resolve_columns(self):
+        columns = self.artifacts.plan.columns
+        unknown = [name for name in self.quantization if name not in columns]
+        if unknown:
+            raise ValueError(f"Caractéristiques à quantifier inconnues du modèle : {unknown}")
+        self._q_idx = np.array([columns.index(name) for name in self.quantization], dtype=np.intp)
+        return self._q_idx
+
+    def quantize(self, X: np.ndarray) -> np.ndarray:
+        """Copie de X (lignes brutes, non scalées) avec les colonnes configurées arrondies à leur pas."""
+        q_idx = self._q_idx if self._q_idx is not None else self._resolve_columns()
+        Q = np.array(X, dtype=np.float32, copy=True)
+        Q[..., q_idx] = np.round(Q[..., q_idx] / self._q_steps) * self._q_steps
+        return Q
+
+    @property
+    def generation(self):
+        """À passer à put() pour un calcul fait hors de predict() (voir ml_server_asgi.py)."""
+        return self._generation
+
+    @staticmethod
+    def key(q_row: np.ndarray) -> bytes:
+        return q_row.tobytes()
+
+    # --- Accès ---
+
+    def get(self, key):
+        """Probabilité en cache pour cette clé, ou None (absente ou expirée)."""
+        now = self.clock()
+        self._check_artifacts(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation=None):
+        """
+        Met en cache une probabilité. generation : valeur de self._generation lue avant le calcul ;
+        si le cache a été invalidé entretemps, la valeur (ancien modèle) est ignorée.
+        """
+        expires_at = None if self.ttl_s is None else self.clock() + self.ttl_s
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def predict(self, row, predict_fn):
+        """
+        Probabilité d'une ligne brute : depuis le cache, sinon predict_fn(ligne quantifiée)
+        puis mise en cache.
+        """
+        q_row = self.quantize(np.asarray(row).reshape(-1))
+        key = self.key(q_row)
+        value = self.get(key)
+        if value is None:
+            generation = self._generation
+            value = float(predict_fn(q_row))
+            self.put(key, value, generation)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # --- Invalidation ---
+
+    def _check_artifacts(self, now):
+        if self.artifacts.generation != self._generation:
+            self._invalidate()
+        if now < self._next_check:
+            return
+        # Les autres appelants n'attendent pas : ils continuent avec le modèle courant
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval_s
+            if self.artifacts.changed_on_disk():
+                self.artifacts.reload()
+                self._invalidate()
+        finally:
+            self._reload_lock.release()
+
+    def _invalidate(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = self.artifacts.generation
+            self._q_idx = None # L'ordre des colonnes a pu changer
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl_s,
+                "quantization": self.quantization,
+                "hits_total": self.hits,
+                "misses_total": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions_total": self.evictions,
+                "expirations_total": self.expirations,
+                "invalidations_total": self.invalidations,
+            }
@@ -0,0 +1,121 @@
+# replay_cache.py
+# Rejoue un trafic de prédictions à travers PredictionCache : taux de succès du cache et
+# décisions modifiées par la quantification des caractéristiques
+#
+# Exemples :
+#   python replay_cache.py --traffic requetes.jsonl       # un corps de /predict par ligne
+#   python replay_cache.py --rows 50000 --users 500       # trafic synthétique (generate_dataset)
+#   python replay_cache.py --quantization "distance_km=0.05,user_engagement_rate=0.02"
+#
+# Chaque requête peut porter un champ "timestamp" (secondes) ; sinon les requêtes sont
+# espacées de --interval-ms. Les probabilités sont calculées en lot : le rejeu mesure le
+# cache, pas le modèle.
+
+import argparse
+import json
+
+import numpy as np
+
+from butterfly import DECISION_THRESHOLD
+from butterfly_features import FeatureEncodingError
+from geo_features import urgency_score
+from model_loader import get_artifacts
+from prediction_cache import DEFAULT_MAX_SIZE, DEFAULT_TTL_S, PredictionCache, parse_quantization
+
+def load_traffic(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+USER_FIELDS = ("user_engagement_rate", "user_num_friends", "user_connections", "user_type")
+INCIDENT_FIELDS = ("days_since_incident", "hour_of_day", "incident_type", "day_of_week", "is_weekend", "incident_zone_type")
+
+def synthetic_traffic(n_rows, n_users=2000, n_incidents=200, gps_noise_km=0.03, seed=0):
+    """
+    Trafic synthétique : n_users profils et n_incidents incidents tirés du générateur ;
+    chaque requête associe un utilisateur et un incident au hasard, avec la distance du
+    couple bruitée (bruit GPS), comme des alertes réévaluées au fil des déplacements.
+    """
+    from generate_dataset import Config, DatasetGenerator
+
+    generator = DatasetGenerator(Config())
+    samples = [generator._generate_single_row() for _ in range(max(n_users, n_incidents))]
+    rng = np.random.default_rng(seed)
+    pair_distance = rng.choice([row["distance_km"] for row in samples], size=(n_users, n_incidents))
+
+    records = []
+    for u, k in zip(rng.integers(0, n_users, n_rows).tolist(), rng.integers(0, n_incidents, n_rows).tolist()):
+        record = {field: samples[u][field] for field in USER_FIELDS}
+        record.update({field: samples[k][field] for field in INCIDENT_FIELDS})
+        distance = max(0.0, float(pair_distance[u, k] + rng.normal(0, gps_noise_km)))
+        record["distance_km"] = distance
+        record["urgency_score"] = urgency_score(distance, record["days_since_incident"])
+        records.append(record)
+    return records
+
+class ReplayClock:
+    """Horloge du cache pilotée par les horodatages du trafic rejoué."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def replay(records, backend="numpy", quantization=None, max_size=DEFAULT_MAX_SIZE, ttl_s=DEFAULT_TTL_S,
+           interval_ms=10.0, threshold=DECISION_THRESHOLD):
+    artifacts = get_artifacts(backend)
+    clock = ReplayClock()
+    cache = PredictionCache(artifacts, quantization, max_size=max_size, ttl_s=ttl_s,
+                            check_interval_s=float("inf"), clock=clock)
+
+    valid = []
+    for record in records:
+        try:
+            artifacts.plan.encode_row(record)
+            valid.append(record)
+        except FeatureEncodingError:
+            pass
+    X = artifacts.encode(valid)
+    Q = cache.quantize(X)
+    exact = artifacts.predict_matrix(X)
+    quantized = artifacts.predict_matrix(Q)
+
+    served = np.empty(len(valid), dtype=np.float32)
+    for i, record in enumerate(valid):
+        clock.now = float(record.get("timestamp", i * interval_ms / 1000))
+        key = cache.key(Q[i])
+        value = cache.get(key)
+        if value is None:
+            value = float(quantized[i])
+            cache.put(key, value)
+        served[i] = value
+
+    changed = (exact > threshold) != (served > threshold)
+    diff = np.abs(exact - served)
+    return {
+        "requests": len(records),
+        "invalid_requests": len(records) - len(valid),
+        "cache": cache.stats(),
+        "decisions_changed": int(changed.sum()),
+        "decisions_changed_rate": float(changed.mean()) if len(valid) else None,
+        "mean_abs_probability_diff": float(diff.mean()) if len(valid) else None,
+        "max_abs_probability_diff": float(diff.max()) if len(valid) else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rejeu du trafic à travers le cache de prédictions")
+    parser.add_argument("--traffic", help="Fichier JSONL de corps de requêtes /predict")
+    parser.add_argument("--rows", type=int, default=20_000, help="Taille du trafic synthétique sans --traffic")
+    parser.add_argument("--users", type=int, default=2000, help="Utilisateurs distincts du trafic synthétique")
+    parser.add_argument("--incidents", type=int, default=200, help="Incidents distincts du trafic synthétique")
+    parser.add_argument("--backend", default="numpy", choices=["keras", "numpy"])
+    parser.add_argument("--quantization", help="ex: 'distance_km=0.1,user_engagement_rate=0.05'")
+    parser.add_argument("--max-size", type=int, default=DEFAULT_MAX_SIZE)
+    parser.add_argument("--ttl-s", type=float, default=DEFAULT_TTL_S)
+    parser.add_argument("--interval-ms", type=float, default=10.0)
+    parser.add_argument("--threshold", type=float, default=DECISION_THRESHOLD)
+    args = parser.parse_args()
+
+    records = load_traffic(args.traffic) if args.traffic else synthetic_traffic(args.rows, args.users, args.incidents)
+    quantization = parse_quantization(args.quantization) if args.quantization is not None else None
+    results = replay(records, args.backend, quantization, args.max_size, args.ttl_s, args.interval_ms, args.threshold)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -0,0 +1,331 @@
+# risk_areas.py
+# Zones à risque de la carte : même regroupement que calculateRiskAreas
+# (client/src/lib/heatmap.ts), calculé côté serveur sur une grille
+#
+# Sémantique de heatmap.ts, conservée à l'identique :
+#   - les incidents sont parcourus dans l'ordre ; un incident pas encore regroupé devient
+#     une graine et absorbe tous les incidents pas encore regroupés à au plus
+#     cluster_radius km (haversine) de lui ;
+#   - le centre d'une zone est la moyenne des coordonnées de ses incidents, son score la
+#     moyenne des gravités (high 3, medium 2, low 1, autre 1) ;
+#   - niveau et rayon (mètres) : critical/150 si >= 5 incidents ou score >= 2.5, high/100
+#     si >= 3 ou >= 2, medium/75 si >= 2 ou >= 1.5, sinon low/50.
+#
+# heatmap.ts compare chaque incident à tous les autres (O(n²)). Ici, les incidents sont
+# rangés par cellule de cluster_radius de côté : une graine ne lit que les cellules
+# voisines (3 rangées, quelques colonnes), triées par clé. Les distances viennent de
+# geo_features.haversine_km.
+#
+# add() ajoute un incident à la fin de la liste sans tout recalculer : l'incident rejoint
+# la première graine (dans l'ordre) à portée, sinon il devient une zone d'un incident ;
+# c'est exactement ce que donnerait un recalcul complet de la liste allongée.
+#
+# Les identifiants sont supposés uniques (heatmap.ts ignore les doublons d'un id déjà regroupé).
+
+import numpy as np
+
+from geo_features import EARTH_RADIUS_KM, haversine_km, unit_vectors
+
+# --- 1. CONFIGURATION ---
+
+DEFAULT_CLUSTER_RADIUS_KM = 0.3
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+
+SEVERITY_SCORES = {"high": 3, "medium": 2, "low": 1}
+DEFAULT_SEVERITY_SCORE = 1
+
+# (niveau, rayon en mètres, nombre minimal d'incidents, score moyen minimal), du plus grave au moins grave
+RISK_LEVELS = (
+    ("critical", 150, 5, 2.5),
+    ("high", 100, 3, 2.0),
+    ("medium", 75, 2, 1.5),
+)
+DEFAULT_RISK_LEVEL = ("low", 50)
+
+# Les cellules sont assez larges en longitude pour que les incidents à moins de ce nombre
+# de degrés de la latitude médiane ne lisent que 3 x 3 cellules
+_LATITUDE_MARGIN_DEG = 1.0
+
+# Écart au seuil du produit scalaire en deçà duquel la distance est recalculée en haversine
+_DOT_TOLERANCE = 1e-12
+
+# Taille de grille en dessous de laquelle les incidents regroupés ne sont plus retirés
+_MIN_REBUILD = 4096
+
+# Clé de cellule = (rangée + _OFFSET) * _STRIDE + (colonne + _OFFSET), comme spatial_index.py
+_OFFSET = 1 << 30
+_STRIDE = 1 << 31
+
+def severity_scores(severities) -> np.ndarray:
+    """Score de gravité de chaque incident (getSeverityScore de heatmap.ts)."""
+    severities = np.asarray(severities, dtype=object)
+    scores = np.full(severities.shape, DEFAULT_SEVERITY_SCORE, dtype=np.float64)
+    for severity, score in SEVERITY_SCORES.items():
+        scores[severities == severity] = score
+    return scores
+
+def parse_coordinates(values) -> np.ndarray:
+    """Latitudes / longitudes (nombres, ou texte comme dans le schéma) -> float ; une valeur illisible vaut NaN, comme parseFloat."""
+    array = np.asarray(values)
+    if array.dtype.kind in "fiu":
+        return array.astype(np.float64).reshape(-1)
+    parsed = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            parsed[i] = float(value)
+        except (TypeError, ValueError):
+            parsed[i] = np.nan
+    return parsed
+
+def risk_levels(incident_counts, scores):
+    """(niveaux, rayons en mètres) pour des zones de incident_counts incidents et de score moyen scores."""
+    counts, scores = np.asarray(incident_counts), np.asarray(scores)
+    conditions = [(counts >= min_count) | (scores >= min_score) for _, _, min_count, min_score in RISK_LEVELS]
+    levels = np.select(conditions, [level for level, *_ in RISK_LEVELS], DEFAULT_RISK_LEVEL[0])
+    radii = np.select(conditions, [radius for _, radius, *_ in RISK_LEVELS], DEFAULT_RISK_LEVEL[1])
+    return levels, radii
+
+# --- 2. REGROUPEMENT ---
+
+class RiskAreaIndex:
+    """
+    Zones à risque d'une liste d'incidents, mises à jour incident par incident (add).
+
+    :param cluster_radius_km: Rayon de regroupement (clusterRadius de heatmap.ts).
+    """
+    def __init__(self, cluster_radius_km=DEFAULT_CLUSTER_RADIUS_KM):
+        if cluster_radius_km <= 0:
+            raise ValueError("cluster_radius_km doit être positif")
+        self.cluster_radius_km = cluster_radius_km
+        self._dlat = cluster_radius_km / KM_PER_DEGREE
+        # d <= rayon  <=>  produit scalaire des vecteurs unitaires >= cos(rayon / R)
+        self._cos_radius = np.cos(cluster_radius_km / EARTH_RADIUS_KM)
+        self.fit([], [], [])
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def n_areas(self) -> int:
+        return self._n_areas
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Zone de chaque incident, dans l'ordre de la liste."""
+        return self._labels[:self._n]
+
+    # --- Grille ---
+
+    def _rows_cols(self, latitudes, longitudes, dlon):
+        with np.errstate(invalid="ignore"):
+            return np.floor(latitudes / self._dlat), np.floor(longitudes / dlon)
+
+    def _col_span(self, latitudes):
+        """Colonnes à lire de chaque côté pour couvrir cluster_radius à ces latitudes (cercle inclus dans la rangée ± 1)."""
+        widest = np.minimum(np.abs(latitudes) + self._dlat, 89.9)
+        dlon_needed = self._dlat / np.maximum(np.cos(np.radians(widest)), 1e-6)
+        return np.ceil(dlon_needed / self._dlon).astype(np.int64)
+
+    @staticmethod
+    def _key(rows, cols):
+        return (rows.astype(np.int64) + _OFFSET) * _STRIDE + cols.astype(np.int64) + _OFFSET
+
+    # --- Calcul complet ---
+
+    def fit(self, latitudes, longitudes, severities):
+        """
+        Regroupe une liste complète d'incidents (remplace l'état courant).
+        :param latitudes: Degrés (float, ou texte comme dans le schéma) ; NaN : zone isolée, comme dans heatmap.ts.
+        """
+        latitudes, longitudes = parse_coordinates(latitudes), parse_coordinates(longitudes)
+        scores = severity_scores(severities)
+        n = len(latitudes)
+
+        # Largeur des cellules en longitude : cluster_radius un peu au-delà de la latitude médiane
+        # (les latitudes plus hautes lisent plus de colonnes, voir _col_span)
+        located = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+        reference = float(np.median(np.abs(latitudes[located]))) if len(located) else 0.0
+        self._dlon = self._dlat / max(np.cos(np.radians(min(reference + _LATITUDE_MARGIN_DEG, 89.9))), 0.01)
+
+        seed_of = np.arange(n) # Un incident non localisé reste sa propre graine
+        if len(located):
+            seed_of[located] = -1
+            self._assign(latitudes, longitudes, located, seed_of)
+
+        # Zones numérotées dans l'ordre des graines ; une graine précède tous les incidents de sa zone
+        seeds, labels = np.unique(seed_of, return_inverse=True)
+        n_areas = len(seeds)
+        self._n, self._n_areas = n, n_areas
+        self._labels = labels.astype(np.int64)
+        self._seed_lat, self._seed_lon = latitudes[seeds], longitudes[seeds]
+        self._count = np.bincount(labels, minlength=n_areas).astype(np.int64)
+        self._lat_sum = np.bincount(labels, latitudes, minlength=n_areas)
+        self._lon_sum = np.bincount(labels, longitudes, minlength=n_areas)
+        self._score_sum = np.bincount(labels, scores, minlength=n_areas)
+        self._seed_cells = None # Construit au premier add()
+        return self
+
+    def _assign(self, latitudes, longitudes, located, seed_of):
+        """
+        Parcours des graines dans l'ordre ; seed_of[j] reçoit la graine de j (-1 : pas encore
+        regroupé). Les incidents regroupés restent dans la grille, filtrés par seed_of, jusqu'à
+        ce que les relire coûte autant que reconstruire la grille sans eux.
+        """
+        n = len(seed_of)
+        radius, cos_radius = self.cluster_radius_km, self._cos_radius
+        xyz = np.zeros((n, 3))
+        xyz[located] = np.column_stack(unit_vectors(latitudes[located], longitudes[located]))
+        keys = np.zeros(n, dtype=np.int64)
+        keys[located] = self._key(*self._rows_cols(latitudes[located], longitudes[located], self._dlon))
+        cell_of = np.full(n, -1, dtype=np.int64) # Ligne de 'ranges' (cellule) de chaque incident actif
+
+        def build(active):
+            """
+            Incidents actifs triés par cellule et, pour chaque cellule occupée, les tranches
+            [lo, hi) des 3 rangées voisines (calculées par cellule, pas par incident).
+            """
+            by_cell = np.argsort(keys[active], kind="stable")
+            order = active[by_cell]
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            cells = sorted_keys[starts]
+            rows, cols = cells // _STRIDE - _OFFSET, cells % _STRIDE - _OFFSET
+            # Colonnes à lire : à la latitude la plus éloignée de l'équateur de la cellule
+            span = self._col_span(np.maximum(np.abs(rows), np.abs(rows + 1)) * self._dlat)
+            bounds = [np.searchsorted(sorted_keys, self._key(rows + dr, cols - span), side="left") for dr in (-1, 0, 1)]
+            bounds += [np.searchsorted(sorted_keys, self._key(rows + dr, cols + span), side="right") for dr in (-1, 0, 1)]
+            cell_of[order] = np.repeat(np.arange(len(cells)), np.diff(np.r_[starts, len(order)]))
+            # Seul actif de son voisinage : zone d'un incident, qui n'en absorbe ni n'est absorbé par aucun autre
+            neighbours = sum(hi - lo for lo, hi in zip(bounds[:3], bounds[3:]))
+            isolated = order[neighbours[cell_of[order]] == 1]
+            seed_of[isolated] = isolated
+            return order, np.column_stack(bounds).tolist()
+
+        active = located
+        order, ranges = build(active)
+        wasted = 0
+        for i in range(n):
+            if seed_of[i] >= 0:
+                continue
+            lo0, lo1, lo2, hi0, hi1, hi2 = ranges[cell_of[i]]
+            candidates = np.concatenate((order[lo0:hi0], order[lo1:hi1], order[lo2:hi2]))
+            scanned = len(candidates)
+            candidates = candidates[seed_of[candidates] < 0] # Contient i
+            wasted += scanned - len(candidates)
+            if len(candidates) > 1:
+                dot = xyz[candidates] @ xyz[i]
+                near = dot >= cos_radius
+                # Près du seuil, l'arrondi du produit scalaire pourrait trancher autrement que haversine
+                band = np.abs(dot - cos_radius) <= _DOT_TOLERANCE
+                if band.any():
+                    near[band] = haversine_km(latitudes[i], longitudes[i], latitudes[candidates[band]],
+                                              longitudes[candidates[band]]) <= radius
+                candidates = candidates[near]
+            seed_of[candidates] = i
+            seed_of[i] = i
+            # Reconstruction quand les incidents déjà regroupés relus coûtent autant qu'elle
+            if wasted > len(active) > _MIN_REBUILD:
+                active = active[seed_of[active] < 0]
+                order, ranges = build(active)
+                wasted = 0
+
+    # --- Mise à jour incrémentale ---
+
+    def _build_seed_grid(self):
+        """Cellule -> zones dont la graine y tombe, dans l'ordre des zones (pour add)."""
+        self._seed_cells = {}
+        seed_lat, seed_lon = self._seed_lat[:self._n_areas], self._seed_lon[:self._n_areas]
+        located = ~(np.isnan(seed_lat) | np.isnan(seed_lon))
+        rows, cols = self._rows_cols(seed_lat[located], seed_lon[located], self._dlon)
+        for key, area in zip(self._key(rows, cols).tolist(), np.flatnonzero(located).tolist()):
+            self._seed_cells.setdefault(key, []).append(area)
+
+    def _nearest_seed_area(self, latitude, longitude):
+        """Première zone (dans l'ordre) dont la graine est à portée, ou None."""
+        if self._seed_cells is None:
+            self._build_seed_grid()
+        row, col = self._rows_cols(np.array([latitude]), np.array([longitude]), self._dlon)
+        span = int(self._col_span(np.array([latitude]))[0])
+        areas = [
+            area
+            for key in self._key(np.repeat(row + np.array([-1, 0, 1]), 2 * span + 1),
+                                 np.tile(col + np.arange(-span, span + 1), 3)).tolist()
+            for area in self._seed_cells.get(key, ())
+        ]
+        if not areas:
+            return None
+        areas = np.array(sorted(areas), dtype=np.int64)
+        distance = haversine_km(latitude, longitude, self._seed_lat[areas], self._seed_lon[areas])
+        within = areas[distance <= self.cluster_radius_km]
+        return int(within[0]) if len(within) else None
+
+    def _reserve(self, names, size):
+        """Capacité doublée au besoin : add() reste en O(1) amorti."""
+        for name in names:
+            array = getattr(self, name)
+            if len(array) < size:
+                grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+
+    def add(self, latitude, longitude, severity) -> int:
+        """
+        Ajoute un incident à la fin de la liste ; même résultat que fit() sur la liste allongée.
+        :return: Indice de la zone qui le contient.
+        """
+        latitude, longitude = parse_coordinates([latitude])[0], parse_coordinates([longitude])[0]
+        score = float(severity_scores([severity])[0])
+        located = not (np.isnan(latitude) or np.isnan(longitude))
+        area = self._nearest_seed_area(latitude, longitude) if located else None
+        if area is None:
+            area = self._n_areas
+            self._reserve(("_seed_lat", "_seed_lon", "_count", "_lat_sum", "_lon_sum", "_score_sum"), area + 1)
+            self._seed_lat[area], self._seed_lon[area] = latitude, longitude
+            self._n_areas += 1
+            if located and self._seed_cells is not None:
+                row, col = self._rows_cols(np.array([latitude]), np.array([longitude]), self._dlon)
+                self._seed_cells.setdefault(int(self._key(row, col)[0]), []).append(area)
+        self._count[area] += 1
+        self._lat_sum[area] += latitude
+        self._lon_sum[area] += longitude
+        self._score_sum[area] += score
+        self._reserve(("_labels",), self._n + 1)
+        self._labels[self._n] = area
+        self._n += 1
+        return area
+
+    # --- Résultat ---
+
+    def arrays(self) -> dict:
+        """Zones en colonnes NumPy (latitude, longitude, radius, riskLevel, incidentCount, severityScore)."""
+        n_areas = self._n_areas
+        count = self._count[:n_areas]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            score = self._score_sum[:n_areas] / count
+            latitude, longitude = self._lat_sum[:n_areas] / count, self._lon_sum[:n_areas] / count
+        levels, radii = risk_levels(count, score)
+        return {"latitude": latitude, "longitude": longitude, "radius": radii, "riskLevel": levels,
+                "incidentCount": count, "severityScore": score}
+
+    def risk_areas(self) -> list:
+        """Zones au format RiskArea de heatmap.ts, dans l'ordre des graines ; un centre NaN devient None."""
+        columns = self.arrays()
+        latitude = np.where(np.isnan(columns["latitude"]), None, columns["latitude"]).tolist()
+        longitude = np.where(np.isnan(columns["longitude"]), None, columns["longitude"]).tolist()
+        return [
+            {"latitude": lat, "longitude": lon, "radius": radius, "riskLevel": level,
+             "incidentCount": n, "severityScore": score}
+            for lat, lon, radius, level, n, score in zip(
+                latitude, longitude, columns["radius"].tolist(), columns["riskLevel"].tolist(),
+                columns["incidentCount"].tolist(), columns["severityScore"].tolist())
+        ]
+
+def calculate_risk_areas(incidents, cluster_radius_km=DEFAULT_CLUSTER_RADIUS_KM) -> list:
+    """calculateRiskAreas(incidents, clusterRadius) : incidents au format du schéma (latitude, longitude, severity)."""
+    index = RiskAreaIndex(cluster_radius_km).fit(
+        [incident.get("latitude") for incident in incidents],
+        [incident.get("longitude") for incident in incidents],
+        [incident.get("severity") for incident in incidents],
+    )
+    return index.risk_areas()
@@ -0,0 +1,406 @@
+# risk_tiles.py
+# Agrégats de risque précalculés par tuile de carte, à plusieurs niveaux de zoom
+#
+# Chaque vue de la carte recalcule les zones à partir de la liste brute des incidents
+# (DatabaseStorage.getIncidents). Ici, chaque incident est compté une fois par niveau de
+# LEVELS, dans sa tuile Web Mercator (le découpage de Google Maps) : nombre d'incidents par
+# type x gravité, et score de gravité (high 3, medium 2, low 1, comme heatmap.ts) décroissant
+# dans le temps avec une demi-vie de DECAY_HALF_LIFE_DAYS.
+#
+# Une requête de fenêtre lit les tuiles du niveau adapté au zoom de la carte (environ
+# 64 px de côté à l'écran) : les tuiles d'un niveau sont triées par clé y * 2^zoom + x,
+# une rangée de tuiles de la fenêtre = une recherche dichotomique.
+#
+# add() met à jour les tuiles d'un nouvel incident (à appeler après createIncident) ; les
+# nouvelles tuiles sont rangées à part puis fusionnées dans le tableau trié par paquets.
+# save() écrit un .npy structuré par niveau (remplacement atomique) ; load() les ouvre en
+# mémoire projetée, en copie à l'écriture : un redémarrage ne relit que les pages utiles
+# et ne recompte aucun incident.
+#
+# python risk_tiles.py incidents.csv --out risk_tiles   # reconstruction complète
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from risk_areas import DEFAULT_SEVERITY_SCORE, SEVERITY_SCORES, parse_coordinates, severity_scores
+
+# --- 1. CONFIGURATION ---
+
+# Niveaux de zoom précalculés (tuile de niveau 16 : ~470 m de côté à Lisbonne)
+LEVELS = (6, 8, 10, 12, 14, 16)
+
+# Une carte au zoom z lit le niveau z + DETAIL_LEVELS (tuile de 256 / 2^2 = 64 px à l'écran)
+DETAIL_LEVELS = 2
+
+INCIDENT_TYPES = ("theft", "danger", "harassment", "other")
+SEVERITIES = ("low", "medium", "high")
+# Type ou gravité inconnus : comptés comme "other" / "low" (score 1, comme heatmap.ts)
+DEFAULT_TYPE, DEFAULT_SEVERITY = "other", "low"
+
+DECAY_HALF_LIFE_DAYS = 7.0
+
+# Latitude maximale de la projection Web Mercator
+MAX_LATITUDE = 85.05112878
+
+# Nouvelles tuiles d'un niveau au-delà desquelles elles sont fusionnées dans le tableau trié
+_MIN_MERGE = 4096
+
+_TYPE_INDEX = {name: i for i, name in enumerate(INCIDENT_TYPES)}
+_SEVERITY_INDEX = {name: i for i, name in enumerate(SEVERITIES)}
+
+FILE_VERSION = 1
+META_FILE = "meta.json"
+
+# Une tuile : clé, nombre d'incidents et score décru par (type, gravité), date (s) du score
+TILE_DTYPE = np.dtype([
+    ("key", "<i8"),
+    ("counts", "<u4", (len(INCIDENT_TYPES), len(SEVERITIES))),
+    ("score", "<f8", (len(INCIDENT_TYPES), len(SEVERITIES))),
+    ("updated", "<f8"),
+])
+
+# --- 2. TUILES WEB MERCATOR ---
+
+def tile_xy(latitudes, longitudes, zoom):
+    """Tuile (x, y) contenant chaque point au niveau zoom (y = 0 au nord) ; zoom peut être un tableau."""
+    side = np.power(2.0, zoom)
+    latitudes = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(longitudes, dtype=np.float64) + 180.0) / 360.0 * side)
+    y = np.floor((1.0 - np.arcsinh(np.tan(latitudes)) / np.pi) / 2.0 * side)
+    return np.clip(x, 0, side - 1).astype(np.int64), np.clip(y, 0, side - 1).astype(np.int64)
+
+def tile_center(x, y, zoom):
+    """(latitude, longitude) du centre des tuiles (x, y) au niveau zoom."""
+    side = float(1 << zoom)
+    longitude = (np.asarray(x) + 0.5) / side * 360.0 - 180.0
+    latitude = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (np.asarray(y) + 0.5) / side))))
+    return latitude, longitude
+
+def category_indices(values, names, default) -> np.ndarray:
+    """Indice de chaque valeur dans names ; une valeur inconnue prend l'indice de default."""
+    values = np.asarray(values, dtype=object).reshape(-1)
+    indices = np.full(values.shape, names.index(default), dtype=np.int64)
+    for i, name in enumerate(names):
+        indices[values == name] = i
+    return indices
+
+def parse_timestamps(values) -> np.ndarray:
+    """Dates en secondes epoch : nombres tels quels, texte ISO 8601 (createdAt) ; illisible -> NaN."""
+    array = np.asarray(values)
+    if array.dtype.kind in "fiu":
+        return array.astype(np.float64).reshape(-1)
+    import pandas as pd  # seulement pour du texte : ml_server et ses workers n'importent pas pandas
+    parsed = pd.to_datetime(pd.Series(array.reshape(-1), dtype=object), utc=True, errors="coerce", format="ISO8601")
+    return (parsed - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy(dtype=np.float64)
+
+# --- 3. TUILES D'UN NIVEAU ---
+
+class _Level:
+    """Tuiles d'un niveau : tableau trié par clé (éventuellement projeté en mémoire) + tuiles récentes."""
+
+    def __init__(self, zoom, tiles=None):
+        self.zoom = zoom
+        self.tiles = np.zeros(0, dtype=TILE_DTYPE) if tiles is None else tiles
+        self._extra = np.zeros(16, dtype=TILE_DTYPE)
+        self._n_extra = 0
+        self._extra_rows = {}
+
+    def __len__(self):
+        return len(self.tiles) + self._n_extra
+
+    def record(self, key):
+        """(tableau, ligne) de la tuile key, créée vide si elle n'existe pas."""
+        keys = self.tiles["key"]
+        row = int(np.searchsorted(keys, key))
+        if row < len(keys) and keys[row] == key:
+            return self.tiles, row
+        row = self._extra_rows.get(key)
+        if row is None:
+            if self._n_extra == len(self._extra):
+                grown = np.zeros(2 * len(self._extra), dtype=TILE_DTYPE)
+                grown[:self._n_extra] = self._extra[:self._n_extra]
+                self._extra = grown
+            row = self._n_extra
+            self._extra["key"][row] = key
+            self._extra_rows[key] = row
+            self._n_extra += 1
+        return self._extra, row
+
+    def merge(self, force=False):
+        """Range les tuiles récentes dans le tableau trié (toujours si force, sinon par paquets)."""
+        if self._n_extra == 0 or not (force or self._n_extra > max(_MIN_MERGE, len(self.tiles) // 8)):
+            return
+        tiles = np.concatenate([self.tiles, self._extra[:self._n_extra]])
+        self.tiles = tiles[np.argsort(tiles["key"], kind="stable")]
+        self._extra = np.zeros(16, dtype=TILE_DTYPE)
+        self._n_extra = 0
+        self._extra_rows = {}
+
+    def select(self, x_ranges, y_min, y_max) -> np.ndarray:
+        """Copie des tuiles dont x est dans l'un des intervalles fermés x_ranges et y dans [y_min, y_max]."""
+        side = 1 << self.zoom
+        rows = np.arange(y_min, y_max + 1, dtype=np.int64) * side
+        keys = self.tiles["key"]
+        starts, ends = [], []
+        for x_min, x_max in x_ranges:
+            starts.append(np.searchsorted(keys, rows + x_min))
+            ends.append(np.searchsorted(keys, rows + x_max + 1))
+        starts, ends = np.concatenate(starts), np.concatenate(ends)
+        # Concaténation des intervalles [start, end) sans boucle Python
+        lengths = ends - starts
+        offsets = np.cumsum(lengths) - lengths
+        indices = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+
+        extra = self._extra[:self._n_extra]
+        x, y = extra["key"] % side, extra["key"] // side
+        in_x = np.zeros(len(extra), dtype=bool)
+        for x_min, x_max in x_ranges:
+            in_x |= (x >= x_min) & (x <= x_max)
+        return np.concatenate([self.tiles[indices], extra[in_x & (y >= y_min) & (y <= y_max)]])
+
+# --- 4. AGRÉGATS MULTI-NIVEAUX ---
+
+class RiskTiles:
+    """
+    Agrégats par tuile à chaque niveau de LEVELS, mis à jour incident par incident.
+    Sûr entre threads (un verrou pour les mises à jour, les requêtes et les sauvegardes).
+    """
+
+    def __init__(self, levels=LEVELS, half_life_days=DECAY_HALF_LIFE_DAYS, directory=None, autosave_s=30.0):
+        """
+        :param levels: Niveaux de zoom précalculés.
+        :param half_life_days: Demi-vie du score (jours).
+        :param directory: Dossier de save() / autosave() ; None : rien n'est écrit.
+        :param autosave_s: Intervalle minimal entre deux sauvegardes d'autosave().
+        """
+        self.levels = tuple(sorted(int(zoom) for zoom in levels))
+        self.half_life_days = float(half_life_days)
+        self.directory = directory
+        self.autosave_s = autosave_s
+        self.n_incidents = 0
+        self._decay_per_s = np.log(2) / (self.half_life_days * 86400)
+        self._zooms = np.array(self.levels)
+        self._levels = {zoom: _Level(zoom) for zoom in self.levels}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        """Tuiles de BUTTERFLY_TILES_DIR (chargées si le dossier existe), ou None si la variable n'est pas définie."""
+        directory = os.environ.get("BUTTERFLY_TILES_DIR")
+        if not directory:
+            return None
+        autosave_s = float(os.environ.get("BUTTERFLY_TILES_SAVE_S", 30.0))
+        if os.path.exists(os.path.join(directory, META_FILE)):
+            tiles = cls.load(directory)
+            tiles.autosave_s = autosave_s
+            return tiles
+        return cls(directory=directory, autosave_s=autosave_s)
+
+    def __len__(self):
+        return sum(len(level) for level in self._levels.values())
+
+    def level_for(self, zoom) -> int:
+        """Niveau lu pour une carte au zoom donné : le plus fin, sans dépasser zoom + DETAIL_LEVELS."""
+        candidates = [level for level in self.levels if level <= zoom + DETAIL_LEVELS]
+        return max(candidates) if candidates else self.levels[0]
+
+    # --- Mises à jour ---
+
+    def fit(self, latitudes, longitudes, types, severities, timestamps, now=None):
+        """
+        Reconstruit toutes les tuiles. Les incidents sans coordonnées lisibles sont ignorés ;
+        une date illisible vaut now.
+        :param now: Date (s) à laquelle les scores sont décrus ; défaut : l'incident le plus récent.
+        """
+        latitudes, longitudes = parse_coordinates(latitudes), parse_coordinates(longitudes)
+        stamps = parse_timestamps(timestamps)
+        if now is None:
+            now = float(np.nanmax(stamps)) if np.isfinite(stamps).any() else time.time()
+        located = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        stamps = np.where(np.isnan(stamps), now, stamps)[located]
+        latitudes, longitudes = latitudes[located], longitudes[located]
+        severities = np.asarray(severities, dtype=object)[located]
+        category = (category_indices(np.asarray(types, dtype=object)[located], INCIDENT_TYPES, DEFAULT_TYPE) * len(SEVERITIES)
+                    + category_indices(severities, SEVERITIES, DEFAULT_SEVERITY))
+        decayed = severity_scores(severities) * np.exp(-self._decay_per_s * (now - stamps))
+
+        n_categories = len(INCIDENT_TYPES) * len(SEVERITIES)
+        levels = {}
+        for zoom in self.levels:
+            x, y = tile_xy(latitudes, longitudes, zoom)
+            keys, inverse = np.unique(y * (1 << zoom) + x, return_inverse=True)
+            slots = inverse * n_categories + category
+            tiles = np.zeros(len(keys), dtype=TILE_DTYPE)
+            tiles["key"] = keys
+            tiles["counts"] = np.bincount(slots, minlength=len(keys) * n_categories).reshape(tiles["counts"].shape)
+            tiles["score"] = np.bincount(slots, weights=decayed, minlength=len(keys) * n_categories).reshape(tiles["score"].shape)
+            tiles["updated"] = now
+            levels[zoom] = _Level(zoom, tiles)
+        with self._lock:
+            self._levels = levels
+            self.n_incidents = int(located.sum())
+            self._dirty = True
+        return self
+
+    def add(self, latitude, longitude, incident_type, severity, timestamp=None) -> bool:
+        """
+        Compte un nouvel incident dans sa tuile à chaque niveau.
+        :param timestamp: Date de l'incident (s epoch ou ISO 8601) ; défaut : maintenant.
+        :return: False si les coordonnées sont illisibles (incident ignoré).
+        """
+        latitude, longitude = parse_coordinates([latitude])[0], parse_coordinates([longitude])[0]
+        if np.isnan(latitude) or np.isnan(longitude):
+            return False
+        stamp = np.nan if timestamp is None else parse_timestamps([timestamp])[0]
+        stamp = time.time() if np.isnan(stamp) else float(stamp)
+        category = (_TYPE_INDEX.get(incident_type, _TYPE_INDEX[DEFAULT_TYPE]),
+                    _SEVERITY_INDEX.get(severity, _SEVERITY_INDEX[DEFAULT_SEVERITY]))
+        weight = SEVERITY_SCORES.get(severity, DEFAULT_SEVERITY_SCORE)
+        xs, ys = tile_xy(latitude, longitude, self._zooms)
+
+        with self._lock:
+            for zoom, x, y in zip(self.levels, xs.tolist(), ys.tolist()):
+                level = self._levels[zoom]
+                tiles, row = level.record(y * (1 << zoom) + x)
+                record = tiles[row]  # vue sur la ligne (modifiable)
+                elapsed = stamp - float(record["updated"])
+                if elapsed >= 0:
+                    # Score ramené à la date de l'incident ; un incident plus ancien que la tuile est décru à la place
+                    record["score"] *= math.exp(-self._decay_per_s * elapsed)
+                    record["updated"] = stamp
+                    record["score"][category] += weight
+                else:
+                    record["score"][category] += weight * math.exp(self._decay_per_s * elapsed)
+                record["counts"][category] += 1
+                level.merge()
+            self.n_incidents += 1
+            self._dirty = True
+        return True
+
+    # --- Requêtes ---
+
+    def query(self, south, west, north, east, zoom, now=None, types=None, severities=None) -> dict:
+        """
+        Tuiles non vides de la fenêtre, au niveau level_for(zoom).
+        Une fenêtre avec west > east traverse l'antiméridien.
+        :param types: Types d'incident retenus (défaut : tous), comme le filtre de getIncidents.
+        :param severities: Gravités retenues (défaut : toutes).
+        :return: {"zoom": niveau lu, "tiles": [{x, y, latitude, longitude, incidentCount,
+                 severityScore, score, counts: {type: {gravité: n}}}]}
+        """
+        level = self.level_for(zoom)
+        side = 1 << level
+        (x_west, x_east), (y_north, y_south) = tile_xy([north, south], [west, east], level)
+        x_ranges = [(x_west, x_east)] if west <= east else [(x_west, side - 1), (0, x_east)]
+        with self._lock:
+            tiles = self._levels[level].select(x_ranges, y_north, y_south)
+
+        type_mask = np.isin(INCIDENT_TYPES, INCIDENT_TYPES if types is None else list(types))
+        severity_mask = np.isin(SEVERITIES, SEVERITIES if severities is None else list(severities))
+        mask = np.outer(type_mask, severity_mask)
+        counts = tiles["counts"] * mask
+        count = counts.sum(axis=(1, 2))
+        kept = count > 0
+        tiles, counts, count = tiles[kept], counts[kept], count[kept]
+
+        now = time.time() if now is None else now
+        decay = np.exp(-self._decay_per_s * np.maximum(now - tiles["updated"], 0.0))
+        score = (tiles["score"] * mask).sum(axis=(1, 2)) * decay
+        weights = np.array([SEVERITY_SCORES[severity] for severity in SEVERITIES], dtype=np.float64)
+        severity_score = counts.sum(axis=1) @ weights / count
+        x, y = tiles["key"] % side, tiles["key"] // side
+        latitude, longitude = tile_center(x, y, level)
+
+        return {"zoom": level, "tiles": [
+            {"x": tx, "y": ty, "latitude": lat, "longitude": lon, "incidentCount": n,
+             "severityScore": mean, "score": decayed,
+             "counts": {incident_type: dict(zip(SEVERITIES, row)) for incident_type, row in zip(INCIDENT_TYPES, by_type)}}
+            for tx, ty, lat, lon, n, mean, decayed, by_type in zip(
+                x.tolist(), y.tolist(), latitude.tolist(), longitude.tolist(), count.tolist(),
+                severity_score.tolist(), score.tolist(), counts.tolist())
+        ]}
+
+    # --- Persistance ---
+
+    def save(self, directory=None):
+        """Un .npy structuré par niveau + meta.json, chacun remplacé atomiquement."""
+        directory = directory or self.directory
+        if directory is None:
+            raise ValueError("Aucun dossier de sauvegarde")
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            for zoom, level in self._levels.items():
+                level.merge(force=True)
+                _replace(os.path.join(directory, f"level-{zoom:02d}.npy"), lambda f, tiles=level.tiles: np.save(f, tiles))
+            meta = {"version": FILE_VERSION, "levels": list(self.levels), "half_life_days": self.half_life_days,
+                    "n_incidents": self.n_incidents, "saved_at": time.time()}
+            _replace(os.path.join(directory, META_FILE), lambda f: f.write(json.dumps(meta, indent=2).encode()))
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+    def autosave(self) -> bool:
+        """save() si des incidents ont été ajoutés et que la dernière sauvegarde date de plus de autosave_s."""
+        if self.directory is None or not self._dirty or time.monotonic() - self._saved_at < self.autosave_s:
+            return False
+        self.save()
+        return True
+
+    @classmethod
+    def load(cls, directory):
+        """Tuiles sauvegardées par save(), projetées en mémoire (copie à l'écriture : le fichier n'est pas modifié)."""
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("version") != FILE_VERSION:
+            raise ValueError(f"Version de tuiles {meta.get('version')} non prise en charge (attendu {FILE_VERSION})")
+        tiles = cls(meta["levels"], meta["half_life_days"], directory=directory)
+        for zoom in tiles.levels:
+            array = np.load(os.path.join(directory, f"level-{zoom:02d}.npy"), mmap_mode="c")
+            if array.dtype != TILE_DTYPE:
+                raise ValueError(f"Format de tuiles inattendu au niveau {zoom} : {array.dtype}")
+            tiles._levels[zoom] = _Level(zoom, array)
+        tiles.n_incidents = meta["n_incidents"]
+        return tiles
+
+def _replace(path, write):
+    """Écrit path via un fichier temporaire renommé : jamais de fichier à moitié écrit."""
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        write(f)
+    os.replace(temporary, path)
+
+# --- 5. RECONSTRUCTION EN LIGNE DE COMMANDE ---
+
+def read_incidents(path):
+    """DataFrame des incidents exportés (CSV ou tableau JSON) avec latitude, longitude, type, severity, createdAt."""
+    import pandas as pd
+    frame = pd.read_json(path, dtype=False) if path.endswith(".json") else pd.read_csv(path, dtype=str)
+    frame = frame.rename(columns={"created_at": "createdAt"})
+    if "createdAt" not in frame:
+        frame["createdAt"] = np.nan
+    return frame
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruit les tuiles de risque à partir d'un export d'incidents")
+    parser.add_argument("files", nargs="+", help="Fichiers CSV ou JSON d'incidents")
+    parser.add_argument("--out", required=True, help="Dossier des tuiles (celui de BUTTERFLY_TILES_DIR)")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(LEVELS))
+    parser.add_argument("--half-life-days", type=float, default=DECAY_HALF_LIFE_DAYS)
+    args = parser.parse_args()
+
+    import pandas as pd
+    frame = pd.concat([read_incidents(path) for path in args.files], ignore_index=True)
+    start = time.perf_counter()
+    tiles = RiskTiles(args.levels, args.half_life_days).fit(
+        frame["latitude"].to_numpy(), frame["longitude"].to_numpy(), frame["type"].to_numpy(),
+        frame["severity"].to_numpy(), frame["createdAt"].to_numpy(), now=time.time())
+    tiles.save(args.out)
+    print(f"{tiles.n_incidents:,} incidents -> {len(tiles):,} tuiles sur {len(tiles.levels)} niveaux "
+          f"en {time.perf_counter() - start:.1f}s, écrites dans {args.out}")
@@ -0,0 +1,175 @@
+# social_graph.py
+# Listes d'amis compactes (CSR) et recouvrement social calculé par lots
+#
+# Les amis de la ligne i sont indices[indptr[i]:indptr[i+1]] : des identifiants entiers
+# triés et sans doublon, stockés bout à bout dans un seul tableau. Le recouvrement de
+# nombreuses paires (a, b) se calcule sans boucle Python : chaque lien est encodé en clé
+# ligne * (N + 1) + identifiant, triée par construction ; un searchsorted des amis d'un côté
+# dans les clés de l'autre, suivi d'un bincount, donne le nombre d'amis communs par paire.
+#
+# Utilisé par generate_dataset.py (--social-model graph) et butterfly_fanout.py.
+
+import numpy as np
+
+# Nombre maximal de clés cherchées par bloc de paires : borne la mémoire temporaire
+DEFAULT_MAX_KEYS = 8_000_000
+
+class SocialGraph:
+    """
+    Listes d'amis au format CSR (une ligne par utilisateur ou par victime).
+
+    :param indptr: Tableau (n_lignes + 1,) des débuts de ligne dans indices.
+    :param indices: Identifiants des amis, triés et uniques à l'intérieur de chaque ligne.
+    """
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices)
+        if self.indptr.ndim != 1 or len(self.indptr) == 0 or self.indptr[0] != 0 or self.indptr[-1] != len(indices):
+            raise ValueError("indptr doit commencer à 0 et finir à len(indices)")
+        if len(indices) and indices.min() < 0:
+            raise ValueError("Les identifiants d'amis doivent être positifs")
+        self.max_id = int(indices.max()) if len(indices) else 0
+        self.indices = indices.astype(np.int32 if self.max_id < 2**31 else np.int64, copy=False)
+        self._keys = None
+
+    # --- Construction ---
+
+    @classmethod
+    def from_flat(cls, lengths, ids):
+        """
+        Construit le graphe à partir de listes mises bout à bout : la ligne i possède les
+        lengths[i] identifiants suivants de ids. Les doublons sont retirés.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        n_rows = len(lengths)
+        span = int(ids.max()) + 1 if len(ids) else 1
+        keys = np.repeat(np.arange(n_rows, dtype=np.int64), lengths) * span + ids
+        keys.sort()
+        if len(keys):
+            keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        rows, friends = np.divmod(keys, span)
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        return cls(indptr, friends)
+
+    @classmethod
+    def from_lists(cls, friend_lists):
+        """Construit le graphe à partir d'une liste de listes d'identifiants."""
+        lengths = [len(friends) for friends in friend_lists]
+        ids = np.fromiter((f for friends in friend_lists for f in friends), dtype=np.int64, count=sum(lengths))
+        return cls.from_flat(lengths, ids)
+
+    # --- Accès ---
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def degree(self, rows=None) -> np.ndarray:
+        """Nombre d'amis distincts des lignes demandées (toutes par défaut)."""
+        degrees = np.diff(self.indptr)
+        return degrees if rows is None else degrees[rows]
+
+    def neighbors(self, row) -> np.ndarray:
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    @property
+    def keys(self) -> np.ndarray:
+        """
+        Clé ligne * (max_id + 1) + identifiant de chaque lien, triée par construction.
+        Calculée au premier recouvrement puis gardée (8 octets par lien).
+        """
+        if self._keys is None:
+            rows = np.repeat(np.arange(len(self), dtype=np.int64), self.degree())
+            self._keys = rows * (self.max_id + 1) + self.indices
+        return self._keys
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + (self._keys.nbytes if self._keys is not None else 0)
+
+    def _gather(self, rows):
+        """Amis des lignes demandées, bout à bout : (numéro de paire, identifiant) triés par paire puis id."""
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        pair = np.repeat(np.arange(len(rows), dtype=np.int64), lengths)
+        positions = np.arange(len(pair), dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return pair, self.indices[positions]
+
+# --- RECOUVREMENT PAR LOTS ---
+
+def overlap_counts(a: SocialGraph, rows_a, b: SocialGraph, rows_b, max_keys=DEFAULT_MAX_KEYS) -> np.ndarray:
+    """
+    Nombre d'amis communs |amis(a[rows_a[k]]) ∩ amis(b[rows_b[k]])| pour chaque paire k.
+    rows_b peut être un entier : toutes les paires partagent alors la même ligne de b.
+
+    Pour chaque paire, seuls les amis du côté le moins connecté sont cherchés dans les clés
+    triées de l'autre graphe (voir SocialGraph.keys) : le coût suit min(degré a, degré b).
+    """
+    rows_a = np.asarray(rows_a, dtype=np.int64)
+    counts = np.zeros(len(rows_a), dtype=np.int64)
+    if len(rows_a) == 0:
+        return counts
+
+    if np.ndim(rows_b) == 0:
+        # Une seule ligne côté b (ex: la victime d'un incident) : masque d'appartenance direct
+        target = b.neighbors(int(rows_b))
+        if len(target) == 0:
+            return counts
+        member = np.zeros(max(a.max_id, b.max_id) + 1, dtype=bool)
+        member[target] = True
+        for start, stop in _chunks(a.degree(rows_a), max_keys):
+            pair, friends = a._gather(rows_a[start:stop])
+            counts[start:stop] = np.bincount(pair[member[friends]], minlength=stop - start)
+        return counts
+
+    rows_b = np.asarray(rows_b, dtype=np.int64)
+    if len(rows_b) != len(rows_a):
+        raise ValueError("rows_a et rows_b doivent avoir la même longueur")
+    a_smaller = a.degree(rows_a) <= b.degree(rows_b)
+    selected = np.flatnonzero(a_smaller)
+    counts[selected] = _count_in_keys(a, rows_a[selected], b, rows_b[selected], max_keys)
+    selected = np.flatnonzero(~a_smaller)
+    counts[selected] = _count_in_keys(b, rows_b[selected], a, rows_a[selected], max_keys)
+    return counts
+
+def _count_in_keys(query: SocialGraph, rows_query, other: SocialGraph, rows_other, max_keys):
+    """Pour chaque paire, nombre d'amis de query[rows_query[k]] présents dans other[rows_other[k]]."""
+    counts = np.zeros(len(rows_query), dtype=np.int64)
+    if len(rows_query) == 0 or len(other.keys) == 0:
+        return counts
+    # Paires triées par ligne cible : les clés cherchées arrivent presque triées et le
+    # searchsorted parcourt other.keys dans l'ordre (cache), au lieu de sauts aléatoires
+    order = np.argsort(rows_other, kind="stable")
+    rows_query, rows_other = rows_query[order], rows_other[order]
+    span = other.max_id + 1
+    for start, stop in _chunks(query.degree(rows_query), max_keys):
+        pair, friends = query._gather(rows_query[start:stop])
+        keys = rows_other[start:stop][pair] * span + friends
+        found = np.searchsorted(other.keys, keys)
+        found[found == len(other.keys)] = 0
+        matched = (other.keys[found] == keys) & (friends < span)
+        counts[order[start:stop]] = np.bincount(pair[matched], minlength=stop - start)
+    return counts
+
+def overlap_ratio(a: SocialGraph, rows_a, b: SocialGraph, rows_b, denominator=None, max_keys=DEFAULT_MAX_KEYS):
+    """
+    Amis communs / nombre d'amis du côté a (score social de ButterflyMock), 0 pour un dénominateur nul.
+    :param denominator: Dénominateur par paire (ex: longueur des listes avec doublons) ; degré de a par défaut.
+    """
+    counts = overlap_counts(a, rows_a, b, rows_b, max_keys)
+    if denominator is None:
+        denominator = a.degree(np.asarray(rows_a, dtype=np.int64))
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(counts, denominator, out=np.zeros(len(counts)), where=denominator > 0)
+
+def _chunks(keys_per_pair, max_keys):
+    """Découpe les paires en intervalles [start, stop) d'au plus max_keys clés (au moins une paire)."""
+    n_pairs = len(keys_per_pair)
+    cumulative = np.cumsum(keys_per_pair)
+    start = 0
+    while start < n_pairs:
+        budget = (cumulative[start - 1] if start else 0) + max_keys
+        stop = max(start + 1, int(np.searchsorted(cumulative, budget, side="right")))
+        yield start, stop
+        start = stop
@@ -0,0 +1,191 @@
+# spatial_index.py
+# Index spatial en grille des positions des utilisateurs : candidats dans un rayon d'alerte
+#
+# Les positions sont rangées par cellule (≈ cell_km de côté) dans des tableaux triés :
+# une requête lit, pour chaque rangée de cellules couvrant le rayon, une tranche contiguë
+# (deux searchsorted), puis filtre les candidats par distance haversine exacte.
+# Les déplacements s'ajoutent à une petite table de débordement (cellule -> utilisateurs)
+# jusqu'à la prochaine reconstruction, déclenchée quand elle dépasse rebuild_fraction.
+#
+# Hypothèse "échelle d'une ville" : la grille ne gère pas le passage de l'antiméridien.
+
+import numpy as np
+
+from geo_features import EARTH_RADIUS_KM, haversine_km
+
+# --- 1. CONFIGURATION ---
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180
+
+# Côté des cellules ; un rayon d'alerte de 2 km couvre environ 9 x 9 cellules
+DEFAULT_CELL_KM = 0.5
+
+# Part d'utilisateurs déplacés (hors de leur cellule d'origine) avant reconstruction
+DEFAULT_REBUILD_FRACTION = 0.05
+
+# Clé de cellule = (rangée + _OFFSET) * _STRIDE + (colonne + _OFFSET), triée rangée par rangée
+_OFFSET = 1 << 30
+_STRIDE = 1 << 31
+_NO_CELL = -1 # Utilisateur sans position (retiré, ou latitude NaN)
+
+# --- 2. INDEX ---
+
+class GridIndex:
+    """
+    Index des positions d'une population (un indice par utilisateur, comme UserPopulation).
+
+    :param latitudes: Latitudes en degrés (copiées ; NaN = utilisateur sans position).
+    :param cell_km: Côté des cellules : environ le rayon des requêtes divisé par 4.
+    :param rebuild_fraction: Part d'utilisateurs déplacés qui déclenche rebuild().
+    """
+    def __init__(self, latitudes, longitudes, cell_km=DEFAULT_CELL_KM, rebuild_fraction=DEFAULT_REBUILD_FRACTION):
+        if cell_km <= 0:
+            raise ValueError("cell_km doit être positif")
+        self.cell_km = cell_km
+        self.rebuild_fraction = rebuild_fraction
+        self.rebuilds = 0
+        self.rebuild(latitudes, longitudes)
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.latitudes, self.longitudes, self._cell, self._moved, self._order, self._sorted_keys))
+
+    # --- Construction ---
+
+    def rebuild(self, latitudes=None, longitudes=None):
+        """
+        Reconstruit les tableaux triés (en bloc, O(n log n)) ; avec latitudes/longitudes,
+        remplace toute la population. La taille des cellules en longitude suit la latitude médiane.
+        """
+        if latitudes is not None:
+            self.latitudes = np.array(latitudes, dtype=np.float64)
+            self.longitudes = np.array(longitudes, dtype=np.float64)
+            if self.latitudes.shape != self.longitudes.shape or self.latitudes.ndim != 1:
+                raise ValueError("latitudes et longitudes doivent être deux vecteurs de même longueur")
+            located = self.latitudes[~np.isnan(self.latitudes)]
+            reference = float(np.median(located)) if len(located) else 0.0
+            self._dlat = self.cell_km / KM_PER_DEGREE
+            self._dlon = self.cell_km / (KM_PER_DEGREE * max(np.cos(np.radians(reference)), 0.01))
+
+        self._cell = self._keys(self.latitudes, self.longitudes)
+        located = np.flatnonzero(self._cell != _NO_CELL)
+        self._order = located[np.argsort(self._cell[located], kind="stable")]
+        self._sorted_keys = self._cell[self._order]
+        self._moved = np.zeros(len(self._cell), dtype=bool)
+        self._overflow = {} # clé de cellule -> set d'utilisateurs déplacés depuis la construction
+        self.n_moved = 0
+        self.rebuilds += 1
+        return self
+
+    def _keys(self, latitudes, longitudes):
+        with np.errstate(invalid="ignore"):
+            rows = np.floor(np.asarray(latitudes) / self._dlat)
+            cols = np.floor(np.asarray(longitudes) / self._dlon)
+        located = ~(np.isnan(rows) | np.isnan(cols))
+        keys = np.full(rows.shape, _NO_CELL, dtype=np.int64)
+        keys[located] = (rows[located].astype(np.int64) + _OFFSET) * _STRIDE + cols[located].astype(np.int64) + _OFFSET
+        return keys
+
+    # --- Mises à jour ---
+
+    def update(self, indices, latitudes, longitudes):
+        """
+        Nouvelles positions pour 'indices' (une latitude NaN retire l'utilisateur).
+        Un utilisateur qui reste dans sa cellule d'origine ne coûte qu'une écriture ;
+        les autres passent par la table de débordement. Si un indice est répété, la
+        dernière position l'emporte.
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        latitudes = np.broadcast_to(np.asarray(latitudes, dtype=np.float64), indices.shape)
+        longitudes = np.broadcast_to(np.asarray(longitudes, dtype=np.float64), indices.shape)
+        # Dernière occurrence de chaque indice
+        _, last = np.unique(indices[::-1], return_index=True)
+        keep = len(indices) - 1 - last
+        indices, latitudes, longitudes = indices[keep], latitudes[keep], longitudes[keep]
+
+        new_keys = self._keys(latitudes, longitudes)
+        old_keys = self._cell[indices]
+        was_moved = self._moved[indices]
+        changed = was_moved | (new_keys != old_keys)
+
+        self.latitudes[indices] = latitudes
+        self.longitudes[indices] = longitudes
+        self._cell[indices] = new_keys
+        overflow = self._overflow
+        for user, old, new, moved in zip(indices[changed].tolist(), old_keys[changed].tolist(),
+                                         new_keys[changed].tolist(), was_moved[changed].tolist()):
+            if moved and old != _NO_CELL:
+                members = overflow[old]
+                members.discard(user)
+                if not members:
+                    del overflow[old]
+            if new != _NO_CELL:
+                overflow.setdefault(new, set()).add(user)
+        newly_moved = indices[changed & ~was_moved]
+        self._moved[newly_moved] = True
+        self.n_moved += len(newly_moved)
+
+        if self.n_moved > self.rebuild_fraction * len(self):
+            self.rebuild()
+        return self
+
+    def remove(self, indices):
+        """Retire des utilisateurs de l'index (plus de position connue)."""
+        return self.update(indices, np.nan, np.nan)
+
+    # --- Requêtes ---
+
+    def _cell_ranges(self, latitude, longitude, radius_km):
+        """Rangées de cellules et bornes de colonnes couvrant le carré englobant le cercle."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(min(abs(latitude) + dlat, 89.9))), 1e-6))
+        rows = np.arange(np.floor((latitude - dlat) / self._dlat), np.floor((latitude + dlat) / self._dlat) + 1,
+                         dtype=np.int64)
+        col_lo = int(np.floor((longitude - dlon) / self._dlon))
+        col_hi = int(np.floor((longitude + dlon) / self._dlon))
+        return rows, col_lo, col_hi
+
+    def candidates(self, latitude, longitude, radius_km):
+        """Utilisateurs des cellules qui recouvrent le cercle (sur-ensemble, sans filtre de distance)."""
+        rows, col_lo, col_hi = self._cell_ranges(latitude, longitude, radius_km)
+        row_keys = (rows + _OFFSET) * _STRIDE
+        lo = np.searchsorted(self._sorted_keys, row_keys + col_lo + _OFFSET, side="left")
+        hi = np.searchsorted(self._sorted_keys, row_keys + col_hi + _OFFSET, side="right")
+        parts = [self._order[a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a]
+        found = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        if self.n_moved:
+            # Positions d'origine périmées : ces utilisateurs sont cherchés dans le débordement
+            found = found[~self._moved[found]]
+            moved = [
+                user
+                for row_key in row_keys.tolist()
+                for col in range(col_lo + _OFFSET, col_hi + _OFFSET + 1)
+                for user in self._overflow.get(row_key + col, ())
+            ]
+            if moved:
+                found = np.concatenate([found, np.array(moved, dtype=np.int64)])
+        return found
+
+    def query_radius(self, latitude, longitude, radius_km):
+        """
+        Utilisateurs à au plus radius_km (haversine) du point.
+        :return: (indices triés, distances en km), prêts pour butterfly_fanout.build_pair_features.
+        """
+        found = np.sort(self.candidates(latitude, longitude, radius_km))
+        distance = haversine_km(self.latitudes[found], self.longitudes[found], latitude, longitude)
+        within = distance <= radius_km
+        return found[within], distance[within]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self),
+            "located": int(np.count_nonzero(self._cell != _NO_CELL)),
+            "cells": int(len(np.unique(self._sorted_keys))) if len(self._sorted_keys) else 0,
+            "moved_since_rebuild": self.n_moved,
+            "overflow_cells": len(self._overflow),
+            "rebuilds": self.rebuilds,
+            "nbytes": self.nbytes,
+        }
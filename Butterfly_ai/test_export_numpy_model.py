@@ -0,0 +1,30 @@
+# test_export_numpy_model.py
+# Parité Keras / NumPy du modèle exporté : python -m pytest Butterfly_ai
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from export_numpy_model import PARITY_ATOL, ParityError, check_parity, export
+from model_loader import get_artifacts
+
+@pytest.fixture(scope="module", autouse=True)
+def keras_artifacts():
+    try:
+        return get_artifacts("keras").load()
+    except (OSError, ValueError) as e: # Artefacts absents ou illisibles par cette version de Keras
+        pytest.skip(f"Modèle Keras indisponible : {e}")
+
+def test_numpy_export_matches_keras(tmp_path):
+    path = export(tmp_path / "butterfly_expert_model.npz")
+    assert check_parity(2000, numpy_path=path) <= PARITY_ATOL
+
+def test_parity_error_beyond_tolerance(tmp_path):
+    path = export(tmp_path / "butterfly_expert_model.npz")
+    with np.load(path) as data:
+        arrays = dict(data)
+    arrays["b0"] = arrays["b0"] + 1.0
+    np.savez_compressed(path, **arrays)
+    with pytest.raises(ParityError):
+        check_parity(2000, numpy_path=path)
@@ -1,18 +1,22 @@
 import pandas as pd
 import tensorflow as tf
-from tensorflow import keras
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import classification_report, confusion_matrix, PrecisionRecallDisplay, RocCurveDisplay
 from sklearn.utils import class_weight
-from tensorflow.keras.layers import BatchNormalization
-from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json # MODIFIÉ : Import nécessaire
 import joblib # MODIFIÉ : Import nécessaire pour la sauvegarde
 
+from evaluation import evaluate_predictions
+from expert_model import build_expert_model, training_callbacks
+from model_loader import COLUMNS_PATH, MODEL_PATH, SCALER_PATH, THRESHOLD_PATH
+
+# Objectif du seuil de décision recommandé (voir evaluation.parse_objective)
+THRESHOLD_OBJECTIVE = "f1"
+EVALUATION_DIR = "evaluation"
+# Les quatre artefacts (modèle, scaler, colonnes, seuil) vont dans le dossier du module, où
+# model_loader les relit, quel que soit le dossier de lancement
+
 print("TensorFlow Version:", tf.__version__)
 
 # --- ÉTAPE 1 : CHARGEMENT DYNAMIQUE DES DONNÉES ---
@@ -42,6 +46,7 @@ numerical_cols = feature_config['numerical_features']
 print(f"\nColonnes numériques à scaler (depuis config) : {numerical_cols}")
 
 
+X = X.astype({col: 'float64' for col in numerical_cols}) # Colonnes entières : sinon pandas refuse les valeurs scalées
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
 
 scaler = StandardScaler()
@@ -55,40 +60,14 @@ class_weights_dict = dict(enumerate(class_weights))
 print(f"\nPoids calculés pour les classes : {class_weights_dict}")
 
 
-# --- ÉTAPE 3 : CONSTRUCTION DU MODÈLE EXPERT (Inchangé) ---
-
-model = keras.Sequential([
-    keras.layers.Input(shape=(X_train.shape[1],)),
-    keras.layers.Dense(128, kernel_initializer='he_normal'),
-    keras.layers.BatchNormalization(),
-    keras.layers.Activation('relu'),
-    keras.layers.Dropout(0.5),
-    keras.layers.Dense(64, kernel_initializer='he_normal'),
-    keras.layers.BatchNormalization(),
-    keras.layers.Activation('relu'),
-    keras.layers.Dropout(0.4),
-    keras.layers.Dense(32, kernel_initializer='he_normal'),
-    keras.layers.BatchNormalization(),
-    keras.layers.Activation('relu'),
-    keras.layers.Dense(1, activation='sigmoid')
-])
-
-optimizer = keras.optimizers.Adam(learning_rate=0.001)
-
-model.compile(
-    optimizer=optimizer,
-    loss='binary_crossentropy',
-    metrics=['accuracy', tf.keras.metrics.Precision(name='precision'), tf.keras.metrics.Recall(name='recall')]
-)
+# --- ÉTAPE 3 : CONSTRUCTION DU MODÈLE EXPERT (voir expert_model.py) ---
 
+model = build_expert_model(X_train.shape[1])
 model.summary()
 
 
 # --- ÉTAPE 4 : ENTRAÎNEMENT AVEC DES CALLBACKS AVANCÉS (Inchangé) ---
 
-early_stopping_callback = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
-learning_rate_scheduler = ReduceLROnPlateau(monitor='val_loss', factor=0.2, patience=3, min_lr=1e-6, verbose=1)
-
 print("\n--- DÉBUT DE L'ENTRAÎNEMENT AVANCÉ ---")
 history = model.fit(
     X_train,
@@ -96,66 +75,34 @@ history = model.fit(
     epochs=100,
     batch_size=64,
     validation_split=0.2,
-    callbacks=[early_stopping_callback, learning_rate_scheduler],
+    callbacks=training_callbacks(),
     class_weight=class_weights_dict,
     verbose=1
 )
 print("--- FIN DE L'ENTRAÎNEMENT ---")
 
 
-# --- ÉTAPE 5 : ÉVALUATION MULTI-SEUILS (Inchangé) ---
+# --- ÉTAPE 5 : ÉVALUATION SUR TOUS LES SEUILS (voir evaluation.py) ---
+# Sans fenêtre : métriques dans evaluation/metrics.json, courbes en PNG, et seuil recommandé
+# dans decision_threshold.json à côté du modèle (lu par butterfly.py à la place du 0.7 codé en dur).
 
 print("\n--- ÉVALUATION FINALE SUR L'ENSEMBLE DE TEST ---")
 y_pred_proba = model.predict(X_test).flatten()
-THRESHOLDS = [0.5, 0.7, 0.8, 0.9]
-
-for threshold in THRESHOLDS:
-    print("\n" + "="*50)
-    print(f"   RAPPORT DE CLASSIFICATION POUR UN SEUIL DE {threshold}")
-    print("="*50)
-    
-    y_pred_class = (y_pred_proba > threshold).astype(int)
-    print(classification_report(y_test, y_pred_class, target_names=['Inutile (0)', 'Utile (1)']))
-    
-    cm = confusion_matrix(y_test, y_pred_class)
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=['Inutile', 'Utile'], yticklabels=['Inutile', 'Utile'])
-    plt.xlabel('Prédiction')
-    plt.ylabel('Vraie valeur')
-    plt.title(f'Matrice de Confusion (Seuil = {threshold})')
-    plt.show()
-
-
-# --- ÉTAPE 6 : VISUALISATIONS D'EXPERT (Inchangé) ---
-
-print("\n" + "="*50)
-print("   VISUALISATIONS AVANCÉES POUR LE CHOIX DU SEUIL")
-print("="*50)
-
-fig, ax = plt.subplots(figsize=(10, 8))
-PrecisionRecallDisplay.from_predictions(y_test, y_pred_proba, ax=ax, name="Modèle Expert")
-ax.set_title("Courbe Précision-Rappel")
-ax.grid(True)
-plt.show()
-
-fig, ax = plt.subplots(figsize=(10, 8))
-RocCurveDisplay.from_predictions(y_test, y_pred_proba, ax=ax, name="Modèle Expert")
-ax.set_title("Courbe ROC (Receiver Operating Characteristic)")
-ax.grid(True)
-plt.show()
-
-
-# --- NOUVEAU : ÉTAPE 7 : SAUVEGARDE DES ARTEFACTS POUR LA PRODUCTION ---
+evaluate_predictions(y_test.to_numpy(), y_pred_proba, output_dir=EVALUATION_DIR, objective=THRESHOLD_OBJECTIVE,
+                     threshold_path=THRESHOLD_PATH)
+
+
+# --- NOUVEAU : ÉTAPE 6 : SAUVEGARDE DES ARTEFACTS POUR LA PRODUCTION ---
 
 print("\n--- SAUVEGARDE DES ARTEFACTS POUR LA PRÉDICTION ---")
 
-model.save('butterfly_expert_model.keras')
-print("Modèle expert sauvegardé dans 'butterfly_expert_model.keras'")
+model.save(MODEL_PATH)
+print(f"Modèle expert sauvegardé dans '{MODEL_PATH}'")
 
-joblib.dump(scaler, 'expert_scaler.joblib')
-print("Scaler expert sauvegardé dans 'expert_scaler.joblib'")
+joblib.dump(scaler, SCALER_PATH)
+print(f"Scaler expert sauvegardé dans '{SCALER_PATH}'")
 
 model_columns = list(X_train.columns)
-with open('expert_model_columns.json', 'w') as f:
+with open(COLUMNS_PATH, 'w') as f:
     json.dump(model_columns, f)
-print("Ordre des colonnes sauvegardé dans 'expert_model_columns.json'")
+print(f"Ordre des colonnes sauvegardé dans '{COLUMNS_PATH}'")
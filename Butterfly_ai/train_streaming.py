@@ -0,0 +1,281 @@
+# train_streaming.py
+# Entraînement hors mémoire du modèle expert à partir de jeux de données .npy par colonnes
+# (generate_dataset.py --format npy), sans jamais charger tout le jeu de données
+#
+# Exemples :
+#   python generate_dataset.py --rows 20000000 --format npy
+#   python train_streaming.py lisbon_expert_data_npy
+#   python train_streaming.py part_a_npy part_b_npy --epochs 5 --steps-per-epoch 20000
+#
+# Chaque dossier est découpé en blocs de BLOCK_ROWS lignes, répartis au hasard entre
+# entraînement, validation et test. Un seul passage sur les blocs d'entraînement calcule
+# le scaler (StandardScaler.partial_fit) et les poids de classes. Ensuite, tf.data lit les
+# blocs en parallèle (interleave + numpy_function sur les memmap), les découpe en lots et
+# fait le One-Hot à la volée (tf.one_hot) à partir des codes entiers : seuls quelques
+# blocs sont en mémoire à la fois.
+#
+# Artefacts produits, identiques à ceux de train_optimized_network.py :
+# butterfly_expert_model.keras, expert_scaler.joblib, expert_model_columns.json et
+# decision_threshold.json, tous dans le dossier de --output-dir (par défaut celui du
+# module, où model_loader les relit) ; rapport d'évaluation dans evaluation/.
+
+import argparse
+import itertools
+import json
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import tensorflow as tf
+from sklearn.preprocessing import StandardScaler
+
+from dataset_io import load_npy_columns, one_hot_header
+from evaluation import evaluate_predictions
+from expert_model import build_expert_model, training_callbacks
+from model_loader import COLUMNS_PATH, MODEL_PATH, MODULE_DIR, SCALER_PATH, THRESHOLD_PATH
+
+# --- 1. CONFIGURATION ---
+
+class Config:
+    BLOCK_ROWS = 65_536 # Lignes lues d'un coup dans une colonne memmap
+    BATCH_SIZE = 64
+    EPOCHS = 100
+    TEST_FRACTION = 0.2
+    VALIDATION_FRACTION = 0.2 # Part des blocs restants, comme validation_split=0.2
+    CYCLE_LENGTH = 4 # Blocs lus en parallèle (et mélangés entre eux) par l'interleave
+    SEED = 42
+    THRESHOLD_OBJECTIVE = "f1" # Voir evaluation.parse_objective
+    EVALUATION_DIR = 'evaluation'
+    OUTPUT_DIR = MODULE_DIR # Dossier des quatre artefacts, lus par model_loader
+    MODEL_FILENAME = MODEL_PATH.name
+    SCALER_FILENAME = SCALER_PATH.name
+    COLUMNS_FILENAME = COLUMNS_PATH.name
+    THRESHOLD_FILENAME = THRESHOLD_PATH.name
+
+# --- 2. SHARDS ET BLOCS ---
+
+def open_shards(directories):
+    """Ouvre chaque dossier .npy en memmap ; tous doivent avoir le même schéma."""
+    shards = [load_npy_columns(directory) for directory in directories]
+    schema = shards[0][0]
+    for directory, (other, _) in zip(directories, shards):
+        if other != schema:
+            raise ValueError(f"Le schéma de '{directory}' diffère de celui de '{directories[0]}'")
+    return schema, [columns for _, columns in shards]
+
+def split_blocks(shards, block_rows=Config.BLOCK_ROWS, test_fraction=Config.TEST_FRACTION,
+                 validation_fraction=Config.VALIDATION_FRACTION, seed=Config.SEED):
+    """
+    Découpe chaque shard en blocs (shard, début, fin) et les répartit au hasard entre
+    "train", "val" et "test" : le partage se fait par bloc, sans lire les données.
+    """
+    blocks = [
+        (shard, start, min(start + block_rows, len(next(iter(columns.values())))))
+        for shard, columns in enumerate(shards)
+        for start in range(0, len(next(iter(columns.values()))), block_rows)
+    ]
+    rng = np.random.default_rng(seed)
+    draw = rng.random(len(blocks))
+    n_test = max(1, round(len(blocks) * test_fraction))
+    n_val = max(1, round((len(blocks) - n_test) * validation_fraction))
+    if len(blocks) < n_test + n_val + 1:
+        raise ValueError(f"Seulement {len(blocks)} blocs : réduire --block-rows")
+    order = np.argsort(draw)
+    return {
+        "test": [blocks[i] for i in sorted(order[:n_test])],
+        "val": [blocks[i] for i in sorted(order[n_test:n_test + n_val])],
+        "train": [blocks[i] for i in sorted(order[n_test + n_val:])],
+    }
+
+def fit_streaming_scaler(schema, shards, blocks):
+    """
+    Un seul passage sur les blocs d'entraînement : StandardScaler.partial_fit sur les
+    colonnes numériques et comptage des labels (poids de classes 'balanced').
+    """
+    numerical = [column["name"] for column in schema if column["kind"] == "numerical"]
+    label = next(column["name"] for column in schema if column["kind"] == "label")
+    scaler = StandardScaler()
+    label_counts = np.zeros(2, dtype=np.int64)
+    for shard, start, stop in blocks:
+        columns = shards[shard]
+        scaler.partial_fit(np.column_stack([columns[name][start:stop] for name in numerical]).astype(np.float64))
+        label_counts += np.bincount(columns[label][start:stop], minlength=2)[:2]
+    class_weights = {k: float(label_counts.sum() / (2 * count)) for k, count in enumerate(label_counts) if count}
+    return scaler, class_weights, label_counts
+
+# --- 3. PIPELINE tf.data ---
+
+def make_dataset(schema, shards, blocks, scaler, batch_size=Config.BATCH_SIZE, shuffle=True,
+                 cycle_length=Config.CYCLE_LENGTH, seed=Config.SEED):
+    """
+    Lots (X, y) dans l'ordre de one_hot_header(schema) : numériques mises à l'échelle,
+    catégorielles en One-Hot via tf.one_hot, binaires recopiées.
+    """
+    numerical = [column["name"] for column in schema if column["kind"] == "numerical"]
+    coded = [column for column in schema if column["kind"] in ("categorical", "binary")]
+    label = next(column["name"] for column in schema if column["kind"] == "label")
+    block_table = np.asarray(blocks, dtype=np.int64)
+    # Un générateur par lecture de bloc (les Generator ne sont pas sûrs entre threads et
+    # load_block tourne en parallèle sous interleave) ; le compteur change l'ordre à chaque époque
+    loads = itertools.count()
+
+    def load_block(index):
+        shard, start, stop = block_table[index]
+        columns = shards[shard]
+        numbers = np.column_stack([columns[name][start:stop] for name in numerical]).astype(np.float32)
+        codes = np.column_stack([columns[column["name"]][start:stop] for column in coded]).astype(np.int32)
+        labels = columns[label][start:stop].astype(np.float32)
+        if shuffle: # mélange des lignes à l'intérieur du bloc
+            order = np.random.default_rng([seed, int(index), next(loads)]).permutation(stop - start)
+            numbers, codes, labels = numbers[order], codes[order], labels[order]
+        return numbers, codes, labels
+
+    def read(index):
+        numbers, codes, labels = tf.numpy_function(load_block, [index], [tf.float32, tf.int32, tf.float32])
+        block = (tf.ensure_shape(numbers, [None, len(numerical)]), tf.ensure_shape(codes, [None, len(coded)]),
+                 tf.ensure_shape(labels, [None]))
+        return tf.data.Dataset.from_tensors(block).rebatch(batch_size)
+
+    mean = tf.constant(scaler.mean_, dtype=tf.float32)
+    scale = tf.constant(scaler.scale_, dtype=tf.float32)
+
+    def encode(numbers, codes, labels):
+        # Colonnes numériques d'abord, puis chaque colonne codée à sa place dans le schéma
+        parts = [(numbers - mean) / scale]
+        for j, column in enumerate(coded):
+            if column["kind"] == "categorical":
+                parts.append(tf.one_hot(codes[:, j], len(column["categories"]), dtype=tf.float32))
+            else:
+                parts.append(tf.cast(codes[:, j:j + 1], tf.float32))
+        return tf.concat(parts, axis=1), labels
+
+    dataset = tf.data.Dataset.range(len(blocks))
+    if shuffle:
+        dataset = dataset.shuffle(len(blocks), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(read, cycle_length=cycle_length, num_parallel_calls=tf.data.AUTOTUNE,
+                                 deterministic=not shuffle)
+    return dataset.map(encode, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+def memory_usage_mb():
+    """
+    Mémoire anonyme (tas, tenseurs) et pic de RSS, lus dans /proc (Linux). Les pages des
+    memmap comptent dans le RSS mais restent du cache disque que le noyau peut libérer.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmHWM", "RssAnon", "RssFile"):
+                    usage[f"{key}_mb"] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+def model_columns(schema):
+    label = next(column["name"] for column in schema if column["kind"] == "label")
+    return [name for name in one_hot_header(schema) if name != label]
+
+def check_column_order(schema):
+    """Les colonnes numériques doivent précéder les codées, comme l'assemble encode()."""
+    kinds = [column["kind"] for column in schema if column["kind"] != "label"]
+    n_numerical = kinds.count("numerical")
+    if kinds[:n_numerical] != ["numerical"] * n_numerical:
+        raise ValueError("Le schéma doit lister les colonnes numériques en premier")
+
+# --- 4. ENTRAÎNEMENT ---
+
+def train(directories, epochs=Config.EPOCHS, batch_size=Config.BATCH_SIZE, block_rows=Config.BLOCK_ROWS,
+          steps_per_epoch=None, seed=Config.SEED, save=True, output_dir=Config.OUTPUT_DIR):
+    """:param output_dir: Dossier où sont écrits le modèle, le scaler, les colonnes et le seuil."""
+    output_dir = Path(output_dir)
+    if save:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    schema, shards = open_shards(directories)
+    check_column_order(schema)
+    blocks = split_blocks(shards, block_rows, seed=seed)
+    n_rows = {name: sum(stop - start for _, start, stop in part) for name, part in blocks.items()}
+    print(f"Lignes : {n_rows['train']:,} entraînement, {n_rows['val']:,} validation, {n_rows['test']:,} test "
+          f"({sum(len(part) for part in blocks.values())} blocs de {block_rows:,} lignes)")
+
+    start = time.perf_counter()
+    scaler, class_weights, label_counts = fit_streaming_scaler(schema, shards, blocks["train"])
+    print(f"Scaler et poids de classes en un passage ({time.perf_counter() - start:.1f}s) : "
+          f"taux d'utiles {label_counts[1] / label_counts.sum():.3f}, poids {class_weights}")
+
+    train_ds = make_dataset(schema, shards, blocks["train"], scaler, batch_size, shuffle=True, seed=seed)
+    val_ds = make_dataset(schema, shards, blocks["val"], scaler, batch_size=4096, shuffle=False)
+    if steps_per_epoch:
+        train_ds = train_ds.repeat()
+
+    tf.keras.utils.set_random_seed(seed)
+    columns = model_columns(schema)
+    model = build_expert_model(len(columns))
+    model.summary()
+
+    print("\n--- DÉBUT DE L'ENTRAÎNEMENT (FLUX) ---")
+    model.fit(
+        train_ds,
+        epochs=epochs,
+        steps_per_epoch=steps_per_epoch,
+        validation_data=val_ds,
+        callbacks=training_callbacks(),
+        class_weight=class_weights,
+        verbose=1
+    )
+    print("--- FIN DE L'ENTRAÎNEMENT ---")
+
+    test_ds = make_dataset(schema, shards, blocks["test"], scaler, batch_size=4096, shuffle=False)
+    results = evaluate(model, test_ds, threshold_path=output_dir / Config.THRESHOLD_FILENAME if save else None)
+    results.update(memory_usage_mb())
+    print("Mémoire du processus (Mo) : " + ", ".join(f"{k[:-3]} {v:.0f}" for k, v in results.items() if k.endswith("_mb")))
+
+    if save:
+        model.save(output_dir / Config.MODEL_FILENAME)
+        joblib.dump(scaler, output_dir / Config.SCALER_FILENAME)
+        with open(output_dir / Config.COLUMNS_FILENAME, 'w') as f:
+            json.dump(columns, f)
+        print(f"Artefacts sauvegardés dans {output_dir} : {Config.MODEL_FILENAME}, {Config.SCALER_FILENAME}, "
+              f"{Config.COLUMNS_FILENAME}, {Config.THRESHOLD_FILENAME}")
+    return model, scaler, results
+
+def evaluate(model, test_ds, threshold_path=None):
+    """
+    Prédictions sur l'ensemble de test, lot par lot (seules les probabilités sont gardées),
+    puis balayage des seuils d'evaluation.py.
+    :param threshold_path: Fichier où écrire le seuil recommandé (None : rien n'est écrit).
+    """
+    probabilities, labels = [], []
+    for X, y in test_ds:
+        probabilities.append(model.predict_on_batch(X).ravel())
+        labels.append(y.numpy())
+    probabilities, labels = np.concatenate(probabilities), np.concatenate(labels).astype(np.int8)
+
+    print(f"\n--- ÉVALUATION SUR {len(labels):,} LIGNES DE TEST ---")
+    report = evaluate_predictions(labels, probabilities, Config.EVALUATION_DIR, Config.THRESHOLD_OBJECTIVE,
+                                  threshold_path=threshold_path)
+    results = {"test_rows": len(labels), "auc": report["roc_auc"],
+               "decision_threshold": report["recommended"]["threshold"]}
+    for row in report["report_thresholds"]:
+        results[f"accuracy@{row['threshold']}"] = (row["tp"] + row["tn"]) / len(labels)
+    return results
+
+# --- 5. EXÉCUTION ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entraînement hors mémoire sur des dossiers .npy")
+    parser.add_argument("directories", nargs="+", help="Dossiers écrits par generate_dataset.py --format npy")
+    parser.add_argument("--epochs", type=int, default=Config.EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=Config.BATCH_SIZE)
+    parser.add_argument("--block-rows", type=int, default=Config.BLOCK_ROWS)
+    parser.add_argument("--steps-per-epoch", type=int, help="Lots par époque (par défaut : un passage complet)")
+    parser.add_argument("--seed", type=int, default=Config.SEED)
+    parser.add_argument("--no-save", action="store_true", help="Ne pas écraser les artefacts de production")
+    parser.add_argument("--output-dir", type=Path, default=Config.OUTPUT_DIR,
+                        help="Dossier des artefacts (par défaut celui du module, lu par model_loader)")
+    args = parser.parse_args()
+
+    print("TensorFlow Version:", tf.__version__)
+    _, _, results = train(args.directories, args.epochs, args.batch_size, args.block_rows, args.steps_per_epoch,
+                          args.seed, save=not args.no_save, output_dir=args.output_dir)
+    print(json.dumps(results, indent=2))
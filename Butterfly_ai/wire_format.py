@@ -0,0 +1,76 @@
+# wire_format.py
+# Format binaire compact pour échanger des matrices de caractéristiques float32
+#
+# Deux encodages sont acceptés en entrée de /predict_batch :
+# - "application/octet-stream" : en-tête de 8 octets (lignes, colonnes en uint32 little-endian)
+#   suivi des lignes * colonnes valeurs float32 little-endian, ligne par ligne ;
+# - "application/x-npy" : un fichier .npy standard (np.save), sans pickle.
+
+import io
+import struct
+
+import numpy as np
+
+BINARY_CONTENT_TYPE = "application/octet-stream"
+NPY_CONTENT_TYPE = "application/x-npy"
+
+_HEADER = struct.Struct("<II")
+
+class WireFormatError(ValueError):
+    """Le corps de la requête ne correspond pas au format binaire annoncé."""
+
+def encode_matrix(X) -> bytes:
+    """Sérialise une matrice 2D en en-tête (lignes, colonnes) + float32 little-endian."""
+    X = np.ascontiguousarray(X, dtype="<f4")
+    if X.ndim != 2:
+        raise WireFormatError(f"Matrice 2D attendue, reçu {X.ndim} dimension(s)")
+    return _HEADER.pack(*X.shape) + X.tobytes()
+
+def matrix_rows(body: bytes, content_type: str) -> int:
+    """Nombre de lignes annoncé par l'en-tête d'un corps binaire, lu sans décoder la matrice."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+
+    if content_type == NPY_CONTENT_TYPE:
+        f = io.BytesIO(body)
+        try:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, _ = np.lib.format.read_array_header_2_0(f)
+        except ValueError as e:
+            raise WireFormatError(f"Fichier .npy invalide : {e}") from e
+        return shape[0] if shape else 0
+    if content_type == BINARY_CONTENT_TYPE:
+        if len(body) < _HEADER.size:
+            raise WireFormatError("En-tête binaire incomplet")
+        return _HEADER.unpack_from(body)[0]
+    raise WireFormatError(f"Type de contenu binaire non supporté : '{content_type}'")
+
+def decode_matrix(body: bytes, content_type: str) -> np.ndarray:
+    """Décode un corps binaire (octet-stream ou .npy) en matrice float32 (lignes, colonnes)."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+
+    if content_type == NPY_CONTENT_TYPE:
+        try:
+            X = np.load(io.BytesIO(body), allow_pickle=False)
+        except ValueError as e:
+            raise WireFormatError(f"Fichier .npy invalide : {e}") from e
+    elif content_type == BINARY_CONTENT_TYPE:
+        if len(body) < _HEADER.size:
+            raise WireFormatError("En-tête binaire incomplet")
+        rows, cols = _HEADER.unpack_from(body)
+        expected = _HEADER.size + rows * cols * 4
+        if len(body) != expected:
+            raise WireFormatError(f"Taille du corps {len(body)} octets, attendu {expected} pour ({rows}, {cols})")
+        X = np.frombuffer(body, dtype="<f4", offset=_HEADER.size).reshape(rows, cols)
+    else:
+        raise WireFormatError(f"Type de contenu binaire non supporté : '{content_type}'")
+
+    if X.ndim != 2:
+        raise WireFormatError(f"Matrice 2D attendue, reçu la forme {X.shape}")
+    return X.astype(np.float32, copy=False)
+
+def encode_probabilities(probabilities) -> bytes:
+    """Réponse binaire : les probabilités en float32 little-endian, dans l'ordre des lignes."""
+    return np.ascontiguousarray(probabilities, dtype="<f4").tobytes()
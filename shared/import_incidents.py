@@ -0,0 +1,257 @@
+# import_incidents.py
+# Import parallèle et reprenable de gros historiques d'incidents (arrivée d'une nouvelle ville)
+#
+# Les fichiers (JSON, JSONL, CSV) sont découpés en tronçons de --chunk-size lignes,
+# numérotés dans l'ordre de lecture. Les tronçons partent bruts (lignes JSONL, valeurs CSV :
+# addincidentsdatabase.iter_raw_records) vers un pool de processus qui les décode, les
+# valide et les normalise (normalize_incident : coordonnées, type, severity, zone_type),
+# puis chacun est écrit par un des --connections threads, en une transaction (upsert sur id).
+#
+# Un tronçon validé en base est noté dans le fichier de reprise (--checkpoint) : relancer
+# la même commande après un arrêt saute les tronçons déjà faits. Un tronçon écrit mais pas
+# encore noté au moment de l'arrêt est simplement réécrit (l'upsert le laisse inchangé).
+# Les lignes rejetées vont dans <--rejected-dir>/chunk-NNNNNN.jsonl, avec leur source et la raison.
+#
+# Exemples :
+#   export DATABASE_URL="postgresql://..."
+#   python import_incidents.py historique_porto.jsonl --connections 8
+#   python import_incidents.py dump_*.csv --chunk-size 50000 --dry-run   # validation seule
+#   python import_incidents.py historique_porto.jsonl --restart          # ignore la reprise
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import count, islice
+from pathlib import Path
+
+from addincidentsdatabase import (
+    METHODS, Config as LoaderConfig, IncidentFormatError, connection_pool, csv_header, decode_record,
+    file_format, iter_raw_records, normalize_incident, pooled_connection, write_batch,
+)
+
+# --- 1. CONFIGURATION ---
+
+class Config:
+    CHUNK_SIZE = 20000                  # Lignes par tronçon (= par transaction)
+    WORKERS = os.cpu_count() or 1       # Processus de validation
+    CONNECTIONS = 4                     # Connexions (threads d'écriture) simultanées
+    IN_FLIGHT_PER_WORKER = 2            # Tronçons en mémoire par processus / connexion
+    CHECKPOINT_PATH = "import_incidents.checkpoint.json"
+    REJECTED_DIR = "rejected"
+    PROGRESS_EVERY_S = 5.0
+
+# --- 2. DÉCOUPAGE ET VALIDATION ---
+
+def iter_chunks(paths, chunk_size=Config.CHUNK_SIZE):
+    """
+    (numéro, format, en-tête CSV, [(source, incident brut), ...]) sur tous les fichiers, dans
+    l'ordre ; un tronçon ne mélange pas deux fichiers. Envoyer les incidents bruts plutôt que
+    décodés divise par trois le coût de transfert vers les processus (pickle de dictionnaires).
+    """
+    chunk_ids = count()
+    for path in paths:
+        fmt = file_format(path)
+        header = csv_header(path) if fmt == "csv" else None
+        records = iter_raw_records(path)
+        while chunk := list(islice(records, chunk_size)):
+            yield next(chunk_ids), fmt, header, chunk
+
+def validate_chunk(chunk_id, fmt, header, records):
+    """
+    Exécuté dans un processus du pool : décodage, validation et normalisation.
+    :return: (chunk_id, lignes normalisées, [{"source", "reason", "record"}, ...])
+    """
+    rows, rejected = [], []
+    for source, raw in records:
+        record = raw # Reste brut s'il n'est pas décodable
+        try:
+            record = decode_record(fmt, raw, header, source)
+            rows.append(normalize_incident(record, source))
+        except IncidentFormatError as error:
+            rejected.append({"source": source, "reason": error.reason, "record": record})
+    return chunk_id, rows, rejected
+
+def write_rejected(rejected_dir, chunk_id, rejected):
+    """Un fichier par tronçon : réécrit à l'identique si le tronçon est rejoué après une reprise."""
+    path = Path(rejected_dir) / f"chunk-{chunk_id:06d}.jsonl"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for item in rejected:
+            f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+    return path
+
+# --- 3. REPRISE ---
+
+def input_fingerprint(paths, chunk_size) -> str:
+    """Empreinte des fichiers d'entrée (chemin, taille, date) et du découpage : les numéros de tronçons en dépendent."""
+    digest = hashlib.sha256(str(chunk_size).encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+class Checkpoint:
+    """Tronçons validés en base et totaux, réécrits atomiquement (fichier temporaire + os.replace)."""
+    def __init__(self, path, fingerprint):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self.done = set()
+        self.totals = {"rows": 0, "rejected": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    @classmethod
+    def load(cls, path, fingerprint, restart=False):
+        checkpoint = cls(path, fingerprint)
+        if restart or not checkpoint.path.exists():
+            return checkpoint
+        with open(checkpoint.path) as f:
+            saved = json.load(f)
+        if saved["fingerprint"] != fingerprint:
+            raise RuntimeError(f"Le fichier de reprise '{path}' correspond à d'autres fichiers d'entrée ou à une "
+                               "autre taille de tronçon (relancer avec --restart pour repartir de zéro)")
+        checkpoint.done = set(saved["done"])
+        checkpoint.totals.update(saved["totals"])
+        return checkpoint
+
+    def mark_done(self, chunk_id, counts):
+        self.done.add(chunk_id)
+        for key, value in counts.items():
+            self.totals[key] += value
+        self.save()
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"fingerprint": self.fingerprint, "done": sorted(self.done), "totals": self.totals}, f)
+        os.replace(tmp, self.path)
+
+# --- 4. PIPELINE ---
+
+def load_chunk(pool, chunk_id, rows, method):
+    """Exécuté dans un thread d'écriture : une connexion du pool, une transaction."""
+    if pool is None or not rows: # --dry-run, ou tronçon entièrement rejeté
+        return chunk_id, {"inserted": 0, "updated": 0, "unchanged": 0}
+    with pooled_connection(pool) as conn:
+        return chunk_id, write_batch(conn, rows, method)
+
+def run_import(paths, pool=None, checkpoint=None, chunk_size=Config.CHUNK_SIZE, workers=Config.WORKERS,
+               connections=Config.CONNECTIONS, method=LoaderConfig.METHOD, rejected_dir=Config.REJECTED_DIR,
+               progress_every_s=Config.PROGRESS_EVERY_S) -> dict:
+    """
+    Valide (processus) et écrit (threads) les tronçons pas encore faits. Les tronçons en
+    mémoire sont bornés : la lecture attend quand validation ou écriture prennent du retard.
+
+    :param pool: Pool de connexions avec au moins 'connections' connexions ; None : validation seule.
+    :param checkpoint: Checkpoint à compléter (None : pas de reprise).
+    :return: Totaux de cette exécution (lignes, rejets, insertions, ..., lignes/s).
+    """
+    run = {"rows": 0, "rejected": 0, "inserted": 0, "updated": 0, "unchanged": 0, "chunks": 0, "skipped": 0}
+    rejected_rows = {}
+    start = last_report = time.perf_counter()
+
+    def report(final=False):
+        elapsed = time.perf_counter() - start
+        rate = run["rows"] / elapsed if elapsed else 0.0
+        label = "Terminé" if final else "En cours"
+        print(f"{label} : {run['chunks']} tronçon(s), {run['rows']:,} lignes ({rate:,.0f} lignes/s), "
+              f"{run['rejected']:,} rejetées, {run['skipped']} tronçon(s) déjà faits, {elapsed:.1f}s", flush=True)
+
+    def finish_loads(futures, block):
+        nonlocal last_report
+        finished, _ = wait(futures, return_when=FIRST_COMPLETED) if block else (
+            {future for future in futures if future.done()}, None)
+        for future in finished:
+            futures.discard(future)
+            chunk_id, counts = future.result()
+            counts = dict(counts, **rejected_rows.pop(chunk_id))
+            if checkpoint is not None:
+                checkpoint.mark_done(chunk_id, counts)
+            for key, value in counts.items():
+                run[key] += value
+            run["chunks"] += 1
+        if time.perf_counter() - last_report >= progress_every_s:
+            last_report = time.perf_counter()
+            report()
+
+    def start_load(validated, loads):
+        chunk_id, rows, rejected = validated.result()
+        if rejected:
+            write_rejected(rejected_dir, chunk_id, rejected)
+        rejected_rows[chunk_id] = {"rows": len(rows) + len(rejected), "rejected": len(rejected)}
+        loads.add(writers.submit(load_chunk, pool, chunk_id, rows, method))
+
+    max_validating = workers * Config.IN_FLIGHT_PER_WORKER
+    max_loading = connections * Config.IN_FLIGHT_PER_WORKER
+    validating, loads = [], set()
+    with ProcessPoolExecutor(workers) as validators, ThreadPoolExecutor(connections) as writers:
+        try:
+            for chunk_id, fmt, header, records in iter_chunks(paths, chunk_size):
+                if checkpoint is not None and chunk_id in checkpoint.done:
+                    run["skipped"] += 1
+                    continue
+                validating.append(validators.submit(validate_chunk, chunk_id, fmt, header, records))
+                # Les tronçons validés passent à l'écriture dans l'ordre de soumission
+                while validating and (validating[0].done() or len(validating) >= max_validating):
+                    while len(loads) >= max_loading:
+                        finish_loads(loads, block=True)
+                    start_load(validating.pop(0), loads)
+                finish_loads(loads, block=False)
+            for validated in validating:
+                while len(loads) >= max_loading:
+                    finish_loads(loads, block=True)
+                start_load(validated, loads)
+            while loads:
+                finish_loads(loads, block=True)
+        except BaseException:
+            # Tronçons en cours abandonnés : ils seront rejoués à la reprise
+            for future in validating:
+                future.cancel()
+            validators.shutdown(cancel_futures=True)
+            writers.shutdown(cancel_futures=True)
+            raise
+
+    run["seconds"] = time.perf_counter() - start
+    run["rows_per_s"] = run["rows"] / run["seconds"] if run["seconds"] else 0.0
+    report(final=True)
+    return run
+
+# --- 5. EXÉCUTION ---
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import parallèle et reprenable d'incidents (JSON, JSONL, CSV)")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--chunk-size", type=int, default=Config.CHUNK_SIZE, help="Lignes par tronçon / transaction")
+    parser.add_argument("--workers", type=int, default=Config.WORKERS, help="Processus de validation")
+    parser.add_argument("--connections", type=int, default=Config.CONNECTIONS, help="Connexions d'écriture simultanées")
+    parser.add_argument("--method", choices=METHODS, default=LoaderConfig.METHOD)
+    parser.add_argument("--checkpoint", default=Config.CHECKPOINT_PATH, help="Fichier de reprise")
+    parser.add_argument("--rejected-dir", default=Config.REJECTED_DIR, help="Dossier des lignes rejetées")
+    parser.add_argument("--restart", action="store_true", help="Ignore le fichier de reprise existant")
+    parser.add_argument("--dry-run", action="store_true", help="Valide sans se connecter ni noter de reprise")
+    args = parser.parse_args()
+
+    try:
+        fingerprint = input_fingerprint(args.files, args.chunk_size)
+        checkpoint = None if args.dry_run else Checkpoint.load(args.checkpoint, fingerprint, args.restart)
+        pool = None if args.dry_run else connection_pool(maxconn=args.connections)
+    except (OSError, RuntimeError) as error:
+        raise SystemExit(f"Erreur : {error}")
+    if checkpoint is not None and checkpoint.done:
+        print(f"Reprise : {len(checkpoint.done)} tronçon(s) déjà en base ({checkpoint.totals['rows']:,} lignes)")
+
+    try:
+        run = run_import(args.files, pool, checkpoint, args.chunk_size, args.workers, args.connections,
+                         args.method, args.rejected_dir)
+    except IncidentFormatError as error:
+        raise SystemExit(f"Erreur : {error} (les tronçons déjà écrits sont notés dans '{args.checkpoint}')")
+    finally:
+        if pool is not None:
+            pool.closeall()
+
+    print(f"  {run['inserted']:,} insérés, {run['updated']:,} mis à jour, {run['unchanged']:,} inchangés, "
+          f"{run['rejected']:,} rejetés" + (f" (voir '{args.rejected_dir}/')" if run["rejected"] else ""))
+    if checkpoint is not None:
+        totals = checkpoint.totals
+        print(f"  Depuis le début de l'import : {totals['rows']:,} lignes, {totals['rejected']:,} rejetées")